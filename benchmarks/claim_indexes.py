@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+r"""Benchmark of GET /api/claims with and without the claim indexes.
+
+It fills a scratch database with synthetic claims and measures the latency
+of the most common filters of the REST API, first without the secondary
+indexes of the `claim` table and then with them.
+
+The database given with `--database-uri` is dropped and recreated, so never
+point it to a database with valuable data. Usage::
+
+    $ python benchmarks/claim_indexes.py \
+        --database-uri postgresql://localhost/claimstore_bench \
+        --rows 1000000 --rows 10000000
+"""
+
+import argparse
+import statistics
+import time
+
+from claimstore.app import create_app, db
+from claimstore.core.db.indexes import create_index, \
+    create_trigram_index, drop_index, missing_indexes
+from claimstore.models import Claim, invalidate_reference_caches
+from claimstore.testing.fixtures.claimant import load_all_claimants
+from claimstore.testing.fixtures.pid import load_all_pids
+from claimstore.testing.fixtures.predicate import load_all_predicates
+
+ENVIRON = {'REMOTE_ADDR': '127.0.0.1'}
+
+QUERIES = [
+    ('type+value', '/api/claims?type=DOI&value=subject-12345'),
+    ('type', '/api/claims?type=DOI&per_page=20'),
+    ('value', '/api/claims?value=object-777'),
+    ('claimant+dates',
+     '/api/claims?claimant=CDS&since=2015-03-01&until=2015-03-02'),
+    ('predicate+dates',
+     '/api/claims?predicate=is_same_as&since=2015-03-01&until=2015-03-02'),
+    ('certainty', '/api/claims?certainty=0.995'),
+    ('actor', '/api/claims?actor=actor-42'),
+    ('actor wildcard', '/api/claims?actor=%25tor-42'),
+    ('role+human', '/api/claims?role=role-3&human=1'),
+    ('cursor by received', '/api/claims?sort=received&cursor='),
+]
+
+INSERT_CLAIMS = """
+INSERT INTO claim (uuid, received, created, claimant_id, subject_type_id,
+                   subject_value, predicate_id, certainty, human, actor,
+                   role, object_type_id, object_value, claim_details)
+SELECT md5(i::text)::uuid,
+       timestamp '2016-01-01' + i * interval '1 second',
+       timestamp '2015-01-01' + (i % 100000) * interval '5 minutes',
+       (:claimants)[1 + i % array_length(:claimants, 1)],
+       (:types)[1 + i % array_length(:types, 1)],
+       'subject-' || i,
+       (:predicates)[1 + i % array_length(:predicates, 1)],
+       (i % 1000) / 1000.0,
+       i % 2,
+       'actor-' || (i % 10000),
+       'role-' || (i % 10),
+       (:types)[1 + (i + 1) % array_length(:types, 1)],
+       'object-' || (i / 2),
+       jsonb_build_object('subject', 'subject-' || i,
+                          'object', 'object-' || (i / 2))
+FROM generate_series(:start, :stop) AS i
+"""
+
+
+def analyze():
+    """Update the planner statistics of the claim table."""
+    db.engine.execute(db.text('ANALYZE claim').execution_options(
+        autocommit=True
+    ))
+
+
+def populate(rows, chunk_size=1000000):
+    """Recreate the database and insert `rows` synthetic claims."""
+    db.drop_all()
+    db.create_all()
+    load_all_predicates()
+    load_all_pids()
+    load_all_claimants()
+    invalidate_reference_caches()
+    ids = {
+        name: [row[0] for row in db.engine.execute(
+            'SELECT id FROM {} ORDER BY id'.format(name)
+        )]
+        for name in ('claimant', 'identifier_type', 'predicate')
+    }
+    for start in range(1, rows + 1, chunk_size):
+        db.engine.execute(
+            db.text(INSERT_CLAIMS),
+            claimants=ids['claimant'],
+            types=ids['identifier_type'],
+            predicates=ids['predicate'],
+            start=start,
+            stop=min(start + chunk_size - 1, rows)
+        )
+    analyze()
+
+
+def measure(client, repeat):
+    """Return the median latency in milliseconds of every query."""
+    latencies = []
+    for name, url in QUERIES:
+        client.get(url + '&count=none', environ_base=ENVIRON)  # warm up
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            resp = client.get(url + '&count=none', environ_base=ENVIRON)
+            samples.append(time.perf_counter() - start)
+            assert resp.status_code == 200, resp.data
+        latencies.append(statistics.median(samples) * 1000)
+    return latencies
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-uri', required=True,
+                        help='Scratch database (it will be recreated)')
+    parser.add_argument('--rows', type=int, action='append',
+                        help='Number of claims (can be repeated)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of requests per query')
+    parser.add_argument('--trigram', action='store_true',
+                        help='Also create the pg_trgm indexes')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    with app.app_context():
+        client = app.test_client()
+        for rows in args.rows or [1000000, 10000000]:
+            print('Loading {} claims...'.format(rows))
+            populate(rows)
+            for index in Claim.__table__.indexes:
+                drop_index(db.engine, index.name)
+            before = measure(client, args.repeat)
+            for index in missing_indexes(db.engine, [Claim.__table__]):
+                create_index(db.engine, index)
+            if args.trigram:
+                for column in Claim.trigram_columns:
+                    create_trigram_index(db.engine,
+                                         Claim.__table__.columns[column])
+            analyze()
+            after = measure(client, args.repeat)
+
+            print('{:<20} {:>14} {:>14} {:>9}'.format(
+                'query', 'no index (ms)', 'indexed (ms)', 'speedup'))
+            for (name, _), slow, fast in zip(QUERIES, before, after):
+                print('{:<20} {:>14.1f} {:>14.1f} {:>8.1f}x'.format(
+                    name, slow, fast, slow / fast))
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
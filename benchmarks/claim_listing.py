@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+r"""Benchmark of the serialization of claim listings.
+
+It fills a scratch database with synthetic claims and measures how many
+claims per second are loaded and encoded for pages of different sizes:
+as :class:`Claim` objects (previous code), as tuples of the columns of the
+output encoded with `json`, and as tuples encoded with `orjson`.
+
+The database given with `--database-uri` is dropped and recreated, so never
+point it to a database with valuable data. Usage::
+
+    $ python benchmarks/claim_listing.py \
+        --database-uri postgresql://localhost/claimstore_bench \
+        --per-page 20 --per-page 1000 --per-page 10000
+"""
+
+import argparse
+import json
+import time
+
+from claimstore.app import create_app, db
+from claimstore.core.json import orjson, orjson_dumps
+from claimstore.models import Claim, invalidate_reference_caches
+from claimstore.restful import ClaimResource
+from claimstore.testing.fixtures.claimant import load_all_claimants
+from claimstore.testing.fixtures.pid import load_all_pids
+from claimstore.testing.fixtures.predicate import load_all_predicates
+
+INSERT_CLAIMS = """
+INSERT INTO claim (uuid, received, created, claimant_id, subject_type_id,
+                   subject_value, predicate_id, certainty, human, actor,
+                   role, object_type_id, object_value, claim_details)
+SELECT md5(i::text)::uuid,
+       timestamp '2016-01-01' + i * interval '1 second',
+       timestamp '2015-01-01' + i * interval '1 minute',
+       :claimant, :type, 'subject-' || i, :predicate, 0.8, 1,
+       'actor-' || i, 'cataloguer', :type, 'object-' || i,
+       jsonb_build_object(
+           'claimant', 'INSPIRE',
+           'subject', jsonb_build_object('type', 'DOI',
+                                         'value', 'subject-' || i),
+           'predicate', 'is_same_as',
+           'object', jsonb_build_object('type', 'DOI',
+                                        'value', 'object-' || i),
+           'certainty', 0.8,
+           'arguments', jsonb_build_object('human', 1,
+                                           'actor', 'actor-' || i,
+                                           'role', 'cataloguer'),
+           'created', '2015-01-01T00:00:00Z')
+FROM generate_series(1, :rows) AS i
+"""
+
+
+def populate(rows):
+    """Recreate the database and insert `rows` synthetic claims."""
+    db.drop_all()
+    db.create_all()
+    load_all_predicates()
+    load_all_pids()
+    load_all_claimants()
+    invalidate_reference_caches()
+    first_id = 'SELECT min(id) FROM {}'
+    db.engine.execute(
+        db.text(INSERT_CLAIMS),
+        claimant=db.engine.scalar(first_id.format('claimant')),
+        type=db.engine.scalar(first_id.format('identifier_type')),
+        predicate=db.engine.scalar(first_id.format('predicate')),
+        rows=rows
+    )
+    db.engine.execute(db.text('ANALYZE claim').execution_options(
+        autocommit=True
+    ))
+
+
+def list_objects(per_page):
+    """Encode a page of claims loaded as objects, as the previous code."""
+    output = []
+    for claim in Claim.query.order_by(Claim.id).limit(per_page):
+        item = dict(claim.claim_details)
+        item['recieved'] = claim.received.isoformat()
+        item['uuid'] = claim.uuid
+        output.append(item)
+    return json.dumps(output)
+
+
+def list_tuples(per_page, encode):
+    """Encode a page of claims loaded as tuples, as the REST API does."""
+    resource = ClaimResource()
+    rows = resource._project(Claim.query, None, 'id').order_by(Claim.id). \
+        limit(per_page)
+    return encode(resource._make_output(rows))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-uri', required=True,
+                        help='Scratch database (it will be recreated)')
+    parser.add_argument('--per-page', type=int, action='append',
+                        help='Number of claims per page (can be repeated)')
+    parser.add_argument('--seconds', type=float, default=2,
+                        help='Minimum duration of every measure')
+    args = parser.parse_args()
+    sizes = args.per_page or [20, 1000, 10000]
+
+    candidates = [
+        ('objects + json', list_objects),
+        ('tuples + json', lambda n: list_tuples(n, json.dumps)),
+    ]
+    if orjson:
+        candidates.append(
+            ('tuples + orjson', lambda n: list_tuples(n, orjson_dumps))
+        )
+
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    with app.app_context():
+        populate(max(sizes))
+        print('{:<20} {:>9} {:>14} {:>8}'.format(
+            'listing', 'per_page', 'claims/s', 'speedup'))
+        for per_page in sizes:
+            baseline = None
+            for name, func in candidates:
+                func(per_page)  # warm up
+                pages, start = 0, time.perf_counter()
+                while time.perf_counter() - start < args.seconds:
+                    func(per_page)
+                    db.session.rollback()
+                    pages += 1
+                rate = pages * per_page / (time.perf_counter() - start)
+                baseline = baseline or rate
+                print('{:<20} {:>9} {:>14.0f} {:>7.1f}x'.format(
+                    name, per_page, rate, rate / baseline))
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Micro-benchmark of the JSON schema validation of claims.
+
+It compares the per-call cost of building a new validator for every claim,
+as ClaimStore used to do, with the validators compiled once per process.
+
+Usage::
+
+    $ python benchmarks/json_validation.py --number 2000
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import timeit
+
+import jsonschema
+
+from claimstore.app import create_app
+from claimstore.core.json import CompiledValidator, fastjsonschema, \
+    get_json_schema, load_validators
+
+CLAIM = {
+    'claimant': 'INSPIRE',
+    'subject': {'type': 'ARXIV_ID', 'value': 'cond-mat/9906097'},
+    'predicate': 'is_same_as',
+    'certainty': 0.8,
+    'object': {'type': 'DOI', 'value': 'C10.1103/PhysRevE.62.7422'},
+    'arguments': {'human': 1, 'actor': 'John Doe', 'role': 'cataloguer'},
+    'created': '2015-04-25T11:00:00Z'
+}
+
+
+def validate_uncached(json_input, schema, base_dir):
+    """Validate JSON building the validator from scratch (previous code)."""
+    schema_content = get_json_schema(schema)
+    resolver = jsonschema.RefResolver('{}/'.format(
+        pathlib.Path(os.path.join(base_dir, 'claimstore')).as_uri()),
+        schema_content
+    )
+    jsonschema.Draft4Validator(
+        json.loads(schema_content),
+        resolver=resolver
+    ).validate(json_input)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=1000,
+                        help='Number of validations per implementation')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        base_dir = app.config['BASE_DIR']
+        app.config['CFG_JSON_SCHEMA_CODEGEN'] = []
+        cached = load_validators()['claim']
+        candidates = [
+            ('uncached Draft4Validator',
+             lambda: validate_uncached(CLAIM, 'claims.claim', base_dir)),
+            ('cached Draft4Validator', lambda: cached.validate(CLAIM)),
+        ]
+        if fastjsonschema:
+            compiled = CompiledValidator(cached.schema)
+            candidates.append(('generated code (fastjsonschema)',
+                               lambda: compiled.validate(CLAIM)))
+
+        baseline = None
+        for name, func in candidates:
+            per_call = timeit.timeit(func, number=args.number) / args.number
+            baseline = baseline or per_call
+            print('{:<35} {:>10.1f} us/call {:>8.1f}x'.format(
+                name, per_call * 1e6, baseline / per_call))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,13 +22,21 @@
 
 from __future__ import absolute_import
 
+import time
 from pathlib import Path
 
 import click
+from flask import current_app
 from flask_cli import FlaskGroup, with_appcontext
 
 from claimstore.app import create_app, db
-from claimstore.models import EquivalentIdentifier
+from claimstore.core.datetime import loc_date_utc
+from claimstore.core.db.indexes import create_index, \
+    create_trigram_index, drop_index, index_stats, missing_indexes
+from claimstore.core.db.transaction import run_in_transaction
+from claimstore.models import Claim, EquivalentCluster, EquivalentEvent, \
+    EquivalentIdentifier, EquivalentIndexState, EquivalentQueue, \
+    identifier_type_cache, invalidate_reference_caches
 from claimstore.testing.fixtures.claim import load_all_claims
 from claimstore.testing.fixtures.claimant import load_all_claimants
 from claimstore.testing.fixtures.pid import load_all_pids
@@ -73,6 +81,7 @@ def create(config):
     load_all_predicates(config)
     load_all_pids(config)
     load_all_claimants(config)
+    invalidate_reference_caches()
     click.echo('Database initialisation completed.')
 
 
@@ -143,16 +152,296 @@ def drop_eqid():
 
 
 @eqid_cli.command()
+@click.option('--engine', type=click.Choice(['unionfind', 'legacy']),
+              default='unionfind', show_default=True,
+              help='Compute the clusters in memory or claim by claim')
+@click.option('--incremental', is_flag=True,
+              help='Only process the claims that are not indexed yet')
 @with_appcontext
-def reindex():
-    """Process all claims to rebuild the eqid index."""
+def reindex(engine, incremental):
+    """Process all claims to rebuild the eqid index.
+
+    With `--incremental`, only the claims received after the last reindex
+    and the claims using new equivalence predicates are processed, in
+    batches that are committed as they go. An interrupted incremental
+    reindex resumes from its last batch.
+
+    The claims are then linked to their equivalent identifiers, and the
+    claims that are still unlinked are reported.
+    """
     if click.confirm('Are you sure to reindex eqid?'):
-        EquivalentIdentifier.rebuild()
+        if incremental:
+            removed = EquivalentIndexState.get().removed_predicates()
+            if removed:
+                click.echo('Warning: {} no longer equivalent; drop and '
+                           'reindex to split the clusters.'.format(
+                               ', '.join(removed)))
+            claims = EquivalentIdentifier.incremental_claims()
+        else:
+            claims = EquivalentIdentifier.equivalence_claims()
+        with click.progressbar(length=claims.count(),
+                               label='Processing claims') as bar:
+            if incremental:
+                EquivalentIdentifier.rebuild_incremental(progress=bar.update)
+            else:
+                relinked = EquivalentIdentifier.rebuild(engine=engine,
+                                                        progress=bar.update)
+        if not incremental:
+            click.echo('{} claim(s) relinked.'.format(relinked))
+        unlinked = EquivalentIdentifier.unlinked_claims().count()
+        if unlinked:
+            click.echo('Warning: {} claim(s) not linked to their equivalent '
+                       'identifiers.'.format(unlinked))
         click.echo('Index rebuilt.')
     else:
         click.echo('Command aborted')
 
 
+@eqid_cli.command()
+@with_appcontext
+def replay():
+    """Rebuild the eqid index from its event log.
+
+    It is much cheaper than `reindex` since the claims are not scanned. The
+    event log is not modified.
+    """
+    if click.confirm('Are you sure to rebuild the eqid index?'):
+        with click.progressbar(length=EquivalentEvent.query.count(),
+                               label='Replaying events') as bar:
+            relinked = EquivalentIdentifier.replay(progress=bar.update)
+        click.echo('{} claim(s) relinked.'.format(relinked))
+        click.echo('Index rebuilt.')
+    else:
+        click.echo('Command aborted')
+
+
+@eqid_cli.command()
+@click.option('--until', type=click.DateTime(), required=True,
+              help='Keep the events recorded until this UTC datetime')
+@with_appcontext
+def truncate(until):
+    """Delete the later events of the log and rebuild the eqid index.
+
+    The index is rebuilt as it was at the given datetime. The deleted events
+    cannot be recovered and the next incremental reindex processes all the
+    claims.
+    """
+    until = loc_date_utc(until)
+    count = EquivalentEvent.query.filter(
+        EquivalentEvent.recorded > until
+    ).count()
+    if click.confirm('Are you sure to permanently delete {} event(s) '
+                     'recorded after {}?'.format(count, until)):
+        EquivalentEvent.truncate(until)
+        with click.progressbar(length=EquivalentEvent.query.count(),
+                               label='Replaying events') as bar:
+            relinked = EquivalentIdentifier.replay(progress=bar.update)
+        click.echo('{} event(s) deleted.'.format(count))
+        click.echo('{} claim(s) relinked.'.format(relinked))
+        click.echo('Index rebuilt.')
+    else:
+        click.echo('Command aborted')
+
+
+@eqid_cli.command()
+@click.argument('type_name')
+@click.argument('value')
+@click.option('--at', type=click.DateTime(),
+              help='Show the cluster as it was at this UTC datetime')
+@with_appcontext
+def show(type_name, value, at):
+    """Show the cluster of an identifier from the event log."""
+    if at is not None:
+        at = loc_date_utc(at)
+    type_id = identifier_type_cache.get_id(type_name)
+    cluster = EquivalentEvent.cluster_at(type_id, value, until=at) \
+        if type_id else None
+    if cluster is None:
+        click.echo('Unknown identifier.')
+        return
+    eqid, identifiers = cluster
+    click.echo(eqid)
+    for type_id, value in identifiers:
+        click.echo('  {} {}'.format(identifier_type_cache.get_name(type_id),
+                                    value))
+
+
+@eqid_cli.command()
+@with_appcontext
+def compact():
+    """Link every eqid cluster directly to its canonical cluster.
+
+    The clusters missing for identifiers recorded before the cluster table
+    existed are created first, so that they are listed by the API.
+    """
+    count = EquivalentCluster.compact()
+    click.echo('{} cluster(s) compacted.'.format(count))
+
+
+@eqid_cli.command()
+@click.option('--batch-size', type=int,
+              help='Claims indexed per transaction '
+                   '(CFG_EQUIVALENT_QUEUE_BATCH_SIZE by default)')
+@click.option('--interval', default=1.0, show_default=True,
+              help='Seconds to wait when the queue is empty')
+@click.option('--once', is_flag=True,
+              help='Stop when the queue is empty')
+@with_appcontext
+def worker(batch_size, interval, once):
+    """Index the claims queued when `CFG_EQUIVALENT_ASYNC` is enabled.
+
+    Many workers can run concurrently.
+    """
+    batch_size = batch_size or \
+        current_app.config['CFG_EQUIVALENT_QUEUE_BATCH_SIZE']
+    retries = current_app.config['CFG_DATABASE_RETRIES']
+    while True:
+        processed = run_in_transaction(
+            db.session,
+            lambda: EquivalentQueue.process(batch_size),
+            retries=retries
+        )
+        if processed:
+            click.echo('{} claim(s) indexed, {pending} pending, lag '
+                       '{lag:.1f}s.'.format(processed,
+                                            **EquivalentQueue.status()))
+        elif once:
+            click.echo('Queue empty.')
+            break
+        else:
+            time.sleep(interval)
+
+
+@eqid_cli.command()
+@click.option('--top', default=10, show_default=True,
+              help='Number of largest clusters to show')
+@click.option('--days', default=30, show_default=True,
+              help='Number of days of history to show')
+@with_appcontext
+def stats(top, days):
+    """Show statistics about the eqid clusters."""
+    statistics = EquivalentCluster.statistics(top=top, days=days)
+    click.echo('{clusters} cluster(s), {identifiers} identifier(s), '
+               '{hot_clusters} hot cluster(s).'.format(**statistics))
+    click.echo('Queue: {pending} claim(s) pending, lag {lag:.1f}s.'.format(
+        **statistics['queue']))
+    click.echo('Sizes:')
+    for bucket in statistics['histogram']:
+        click.echo('  {min:>8}-{max:<8} {clusters}'.format(**bucket))
+    click.echo('Largest clusters:')
+    for cluster in statistics['largest']:
+        click.echo('  {eqid} {size}'.format(**cluster))
+    click.echo('History (created/merged):')
+    for day in statistics['history']:
+        click.echo('  {date} {created}/{merged}'.format(**day))
+    if statistics['hot_clusters']:
+        click.echo('Warning: {} cluster(s) with at least {} '
+                   'identifiers.'.format(
+                       statistics['hot_clusters'],
+                       current_app.config['CFG_EQUIVALENT_HOT_CLUSTER_SIZE']))
+
+
+@click.group('index')
+@with_appcontext
+def index_cli():
+    """Command providing actions to manage the database indexes."""
+    pass
+
+
+def _format_size(size):
+    """Return a human readable size."""
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'TB'
+    return '{:.0f} {}'.format(size, unit)
+
+
+@index_cli.command('create')
+@click.option('--concurrently', is_flag=True,
+              help='Build the indexes without locking writes on the tables')
+@click.option('--trigram', is_flag=True,
+              help='Also create pg_trgm indexes for LIKE searches')
+@with_appcontext
+def create_indexes(concurrently, trigram):
+    """Create the indexes defined in the models that do not exist yet.
+
+    With `--trigram`, GIN indexes using the `pg_trgm` extension are created
+    for the identifier values, actor and role of the claims, so that LIKE
+    searches with wildcards do not scan the whole table.
+    """
+    indexes = missing_indexes(db.engine, db.metadata.sorted_tables)
+    for index in indexes:
+        click.echo('Creating index {}.'.format(index.name))
+        create_index(db.engine, index, concurrently=concurrently)
+    click.echo('{} index(es) created.'.format(len(indexes)))
+    if trigram:
+        for column in Claim.trigram_columns:
+            name = create_trigram_index(db.engine,
+                                        Claim.__table__.columns[column],
+                                        concurrently=concurrently)
+            click.echo('Trigram index {} is available.'.format(name))
+
+
+@index_cli.command('list')
+@with_appcontext
+def list_indexes():
+    """List the indexes with their size and usage statistics."""
+    row = '{:<24} {:<48} {:>8} {:>12} {:>14}  {}'
+    click.echo(row.format('TABLE', 'INDEX', 'SIZE', 'SCANS', 'TUPLES READ',
+                          'FLAGS').rstrip())
+    for stats in index_stats(db.engine, db.metadata.sorted_tables):
+        flags = [flag for flag in ('primary', 'unique') if stats[flag]]
+        if not stats['valid']:
+            flags.append('invalid')
+        click.echo(row.format(
+            stats['table'],
+            stats['name'],
+            _format_size(stats['size']),
+            stats['scans'],
+            stats['tuples_read'],
+            ','.join(flags)
+        ).rstrip())
+
+
+@index_cli.command('drop-unused')
+@click.option('--max-scans', default=0, show_default=True,
+              help='Indexes scanned at most this number of times are unused')
+@click.option('--concurrently', is_flag=True,
+              help='Drop the indexes without locking the tables')
+@click.option('--dry-run', is_flag=True,
+              help='Only list the indexes that would be dropped')
+@with_appcontext
+def drop_unused_indexes(max_scans, concurrently, dry_run):
+    """Drop the indexes that are not used by the queries.
+
+    Primary keys and unique indexes are never dropped. Statistics are
+    collected since the last reset, so make sure that they cover a
+    representative period of activity.
+    """
+    unused = [
+        stats for stats in index_stats(db.engine, db.metadata.sorted_tables)
+        if not (stats['primary'] or stats['unique']) and
+        stats['scans'] <= max_scans
+    ]
+    for stats in unused:
+        click.echo('{} ({}, {} scans)'.format(
+            stats['name'], _format_size(stats['size']), stats['scans']
+        ))
+    if not unused:
+        click.echo('There are no unused indexes.')
+    elif dry_run:
+        click.echo('{} index(es) would be dropped.'.format(len(unused)))
+    elif click.confirm('Are you sure to drop these indexes?'):
+        for stats in unused:
+            drop_index(db.engine, stats['name'], concurrently=concurrently)
+        click.echo('{} index(es) dropped.'.format(len(unused)))
+    else:
+        click.echo('Command aborted')
+
+
 def clifactory():
     """Create a click CLI application based on configuration.
 
@@ -171,6 +460,7 @@ def clifactory():
     # Register CLI modules from packages.
     cli.add_command(database_cli)
     cli.add_command(eqid_cli)
+    cli.add_command(index_cli)
 
     return cli
 
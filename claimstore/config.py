@@ -49,6 +49,8 @@ else:
 # Define the database as environment variable
 if 'SQLALCHEMY_DATABASE_URI' in os.environ:
     SQLALCHEMY_DATABASE_URI = os.environ['SQLALCHEMY_DATABASE_URI']
+# Times a transaction is retried after a serialization failure or a deadlock.
+CFG_DATABASE_RETRIES = 3
 
 
 # -----------------------------------------------------------------------------
@@ -64,10 +66,67 @@ else:
     CLAIMSTORE_ALLOWED_IPS = ['0.0.0.0/0']
 
 
+# -----------------------------------------------------------------------------
+# JSON SCHEMAS
+# -----------------------------------------------------------------------------
+
+# Reload the JSON schemas when their files change (useful for development).
+CFG_JSON_SCHEMA_AUTO_RELOAD = CLAIMSTORE_DEBUG
+# Schemas validated with generated code if `fastjsonschema` is installed.
+CFG_JSON_SCHEMA_CODEGEN = ['claims.claim']
+# Encoder of the claim listings: `json`, `orjson`, the import path of a
+# function object -> str or None for `orjson` if it is installed.
+CFG_JSON_ENCODER = None
+
+
+# -----------------------------------------------------------------------------
+# CACHE
+# -----------------------------------------------------------------------------
+
+# Seconds during which claimants, identifier types and predicates are cached.
+CFG_REFERENCE_CACHE_TTL = 300
+# Maximum number of unknown names remembered by each reference cache.
+CFG_REFERENCE_CACHE_NEGATIVE_SIZE = 1000
+# Backend caching the responses of GET /api/claims: `lru` (in-process),
+# `filesystem` (shared by the workers of a host), the import path of a
+# :class:`claimstore.core.cache.BaseCache` subclass or None to disable it.
+CFG_CLAIMS_CACHE_BACKEND = 'lru'
+# Maximum number of responses kept by the cache.
+CFG_CLAIMS_CACHE_SIZE = 1000
+# Seconds after which a cached response expires, 0 for never.
+CFG_CLAIMS_CACHE_TIMEOUT = 300
+# Seconds during which the version of the claims validating the cached
+# responses is reused by a process. Claims recorded by other processes may be
+# missed for that long; 0 reads the version on every request.
+CFG_CLAIMS_VERSION_TTL = 1
+# Directory of the `filesystem` cache backend. Entries are unpickled, so it
+# must only be writable by the user running ClaimStore.
+CFG_CLAIMS_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'claims')
+
+
 # -----------------------------------------------------------------------------
 # CLAIMS
 # -----------------------------------------------------------------------------
 
 CFG_EQUIVALENT_PREDICATES = ['is_same_as', 'is_variant_of']
+# Record the claims without their eqids and index them with
+# `claimstore eqid worker`, so that the eqid index is eventually consistent.
+CFG_EQUIVALENT_ASYNC = False
+# Queued claims indexed per transaction by `claimstore eqid worker`.
+CFG_EQUIVALENT_QUEUE_BATCH_SIZE = 1000
+# Rows streamed or written per round trip when rebuilding the eqid index.
+CFG_EQUIVALENT_REBUILD_CHUNK_SIZE = 10000
+# Clusters with at least this number of identifiers are reported as hot.
+CFG_EQUIVALENT_HOT_CLUSTER_SIZE = 1000
+# Maximum number of identifiers resolved by POST /api/eqids/resolve.
+CFG_EQIDS_RESOLVE_MAX_SIZE = 1000
 CFG_PAGINATION_ARG_PAGE = 1
 CFG_PAGINATION_ARG_PER_PAGE = 20
+# Default way of counting claims for the `last` link: exact, estimate or none.
+CFG_PAGINATION_COUNT = 'exact'
+CFG_CLAIMS_BATCH_MAX_SIZE = 10000
+CFG_CLAIMS_BATCH_COMMIT_SIZE = 1000
+# Claims fetched from the database per round trip when streaming.
+CFG_CLAIMS_STREAM_CHUNK_SIZE = 1000
+# Maximum number of identifiers looked up by POST /api/claims/lookup.
+CFG_CLAIMS_LOOKUP_MAX_SIZE = 1000
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Size-bounded caches of HTTP responses."""
+
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+
+class BaseCache(object):
+
+    """Interface of the response cache backends.
+
+    Backends store picklable values under string keys and evict entries
+    once they hold more than `max_size` of them or after `timeout` seconds.
+    Other backends can be plugged with `CFG_CLAIMS_CACHE_BACKEND` set to the
+    import path of a subclass.
+    """
+
+    def __init__(self, max_size=1000, timeout=300):
+        """Initialise the cache.
+
+        :param max_size: maximum number of cached entries.
+        :param timeout: seconds after which an entry expires, 0 for never.
+        """
+        self.max_size = max_size
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the cache from the application configuration."""
+        return cls(
+            max_size=config['CFG_CLAIMS_CACHE_SIZE'],
+            timeout=config['CFG_CLAIMS_CACHE_TIMEOUT']
+        )
+
+    def _expires(self):
+        """Return the expiration time of an entry stored now."""
+        return time.time() + self.timeout if self.timeout else None
+
+    def get(self, key):
+        """Return the value stored under `key` or None if there is none."""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting entries if needed."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all the entries."""
+        raise NotImplementedError
+
+
+class LRUCache(BaseCache):
+
+    """In-process cache evicting the least recently used entries.
+
+    Every worker of a deployment has its own copy of the entries.
+    """
+
+    def __init__(self, max_size=1000, timeout=300):
+        """Initialise the cache."""
+        super(LRUCache, self).__init__(max_size, timeout)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the value stored under `key` or None if there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting entries if needed."""
+        with self._lock:
+            self._entries[key] = (value, self._expires())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache(BaseCache):
+
+    """Cache shared by the workers of a host through a local directory.
+
+    Each entry is a file written atomically. Reading an entry refreshes its
+    modification time, so that the least recently used files are removed
+    first when the directory holds more than `max_size` entries. Each
+    process counts the entries it adds and only lists the directory once
+    the count goes over `max_size`; it then removes a tenth of the entries,
+    so that the directory is not listed again on the following writes.
+
+    Entries are unpickled, so anyone able to write in the directory can run
+    code in ClaimStore: the directory must only be writable by the user
+    running it. It is created with mode 0700, and a directory writable by
+    its group or by other users is rejected.
+    """
+
+    suffix = '.cache'
+
+    def __init__(self, directory, max_size=1000, timeout=300):
+        """Initialise the cache.
+
+        :param directory: directory of the entries, created if needed.
+        :raises: ValueError if the directory is writable by other users.
+        """
+        super(FileSystemCache, self).__init__(max_size, timeout)
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise ValueError('Cache directory {} is writable by other '
+                             'users'.format(directory))
+        self._count = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the cache from the application configuration."""
+        return cls(
+            config['CFG_CLAIMS_CACHE_DIR'],
+            max_size=config['CFG_CLAIMS_CACHE_SIZE'],
+            timeout=config['CFG_CLAIMS_CACHE_TIMEOUT']
+        )
+
+    def _path(self, key):
+        """Return the path of the file of an entry."""
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    def _files(self):
+        """Return the paths of the entries."""
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(self.suffix)
+        ]
+
+    def get(self, key):
+        """Return the value stored under `key` or None if there is none."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value, expires = pickle.load(f)
+            if expires is not None and expires < time.time():
+                os.remove(path)
+                return None
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting entries if needed."""
+        path = self._path(key)
+        new = not os.path.exists(path)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value, self._expires()), f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        if self._count is None:
+            self._count = len(self._files())
+        elif new:
+            self._count += 1
+        if self._count > self.max_size:
+            self._count = self._prune(self.max_size - self.max_size // 10)
+
+    def _prune(self, size):
+        """Remove the least recently used entries above `size`.
+
+        :returns: the number of entries left.
+        :rtype: int
+        """
+        files = self._files()
+        if len(files) <= size:
+            return len(files)
+        mtimes = []
+        for path in files:
+            try:
+                mtimes.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        mtimes.sort()
+        for _, path in mtimes[:len(mtimes) - size]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return min(len(mtimes), size)
+
+    def clear(self):
+        """Remove all the entries."""
+        for path in self._files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._count = 0
+
+
+BACKENDS = {
+    'lru': LRUCache,
+    'filesystem': FileSystemCache,
+}
+"""Backends selected by name with `CFG_CLAIMS_CACHE_BACKEND`."""
+
+
+def make_cache(config):
+    """Create the response cache configured for an application.
+
+    :param config: configuration of the application.
+    :returns: the cache or None if `CFG_CLAIMS_CACHE_BACKEND` is not set.
+    :rtype: :class:`BaseCache`
+    """
+    backend = config['CFG_CLAIMS_CACHE_BACKEND']
+    if not backend:
+        return None
+    if backend in BACKENDS:
+        backend = BACKENDS[backend]
+    else:
+        backend = import_string(backend)
+    return backend.from_config(config)
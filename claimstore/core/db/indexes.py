@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Management of the database indexes."""
+
+import re
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+
+def _autocommit(engine):
+    """Return a connection outside of any transaction.
+
+    It is required by `CREATE INDEX CONCURRENTLY` and `DROP INDEX
+    CONCURRENTLY`.
+    """
+    return engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def missing_indexes(engine, tables):
+    """Return the indexes defined in the models that are not in the database.
+
+    :param engine: SQLAlchemy engine.
+    :param tables: list of :class:`sqlalchemy.schema.Table`.
+    :returns: list of :class:`sqlalchemy.schema.Index`.
+    :rtype: list.
+    """
+    inspector = inspect(engine)
+    missing = []
+    for table in tables:
+        existing = set(i['name'] for i in inspector.get_indexes(table.name))
+        missing.extend(
+            index for index in sorted(table.indexes, key=lambda i: i.name)
+            if index.name not in existing
+        )
+    return missing
+
+
+def create_index(engine, index, concurrently=False):
+    """Create an index.
+
+    :param engine: SQLAlchemy engine.
+    :param index: :class:`sqlalchemy.schema.Index` to be created.
+    :param concurrently: build the index without locking writes on the table.
+    """
+    ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+    if concurrently:
+        ddl = re.sub(r'^CREATE (UNIQUE )?INDEX ', r'\g<0>CONCURRENTLY ', ddl)
+    with _autocommit(engine) as connection:
+        connection.execute(ddl)
+
+
+def create_trigram_index(engine, column, concurrently=False):
+    """Create a pg_trgm GIN index on a text column if it does not exist.
+
+    These indexes speed up LIKE searches with leading or inner wildcards.
+    The `pg_trgm` extension is created if needed, which requires the
+    appropriate privileges.
+
+    :param engine: SQLAlchemy engine.
+    :param column: :class:`sqlalchemy.schema.Column` to be indexed.
+    :param concurrently: build the index without locking writes on the table.
+    :returns: the name of the index.
+    :rtype: str.
+    """
+    preparer = engine.dialect.identifier_preparer
+    name = 'ix_{}_{}_trgm'.format(column.table.name, column.name)
+    with _autocommit(engine) as connection:
+        connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        connection.execute(
+            'CREATE INDEX {}IF NOT EXISTS {} ON {} '
+            'USING gin ({} gin_trgm_ops)'.format(
+                'CONCURRENTLY ' if concurrently else '',
+                preparer.quote(name),
+                preparer.format_table(column.table),
+                preparer.quote(column.name)
+            )
+        )
+    return name
+
+
+def drop_index(engine, name, concurrently=False):
+    """Drop an index.
+
+    :param engine: SQLAlchemy engine.
+    :param name: name of the index.
+    :param concurrently: drop the index without locking the table.
+    """
+    with _autocommit(engine) as connection:
+        connection.execute('DROP INDEX {}{}'.format(
+            'CONCURRENTLY ' if concurrently else '',
+            engine.dialect.identifier_preparer.quote(name)
+        ))
+
+
+def index_stats(engine, tables):
+    """Return the size and usage statistics of the indexes of some tables.
+
+    Usage statistics are collected by PostgreSQL since the last statistics
+    reset (see `pg_stat_reset()`).
+
+    :param engine: SQLAlchemy engine.
+    :param tables: list of :class:`sqlalchemy.schema.Table`.
+    :returns: list of dictionaries with the keys `table`, `name`, `size`
+              (bytes), `scans`, `tuples_read`, `unique`, `primary` and
+              `valid`.
+    :rtype: list.
+    """
+    query = text(
+        'SELECT s.relname AS table, s.indexrelname AS name, '
+        'pg_relation_size(s.indexrelid) AS size, s.idx_scan AS scans, '
+        's.idx_tup_read AS tuples_read, i.indisunique AS unique, '
+        'i.indisprimary AS primary, i.indisvalid AS valid '
+        'FROM pg_stat_user_indexes s '
+        'JOIN pg_index i ON i.indexrelid = s.indexrelid '
+        'WHERE s.relname IN :tables '
+        'ORDER BY s.relname, s.indexrelname'
+    ).bindparams(bindparam('tables', expanding=True))
+    return [
+        dict(row) for row in engine.execute(
+            query, tables=[table.name for table in tables]
+        )
+    ]
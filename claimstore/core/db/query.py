@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Query helpers."""
+
+from sqlalchemy import bindparam
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+
+    """EXPLAIN of a statement, with the plan formatted as JSON."""
+
+    def __init__(self, statement):
+        """Initialise the EXPLAIN construct.
+
+        :param statement: SQLAlchemy statement to be explained.
+        """
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    """Compile an :class:`Explain` construct for PostgreSQL."""
+    return 'EXPLAIN (FORMAT JSON) {}'.format(
+        compiler.process(element.statement, **kwargs)
+    )
+
+
+def is_like_pattern(pattern):
+    """Return True if a string contains a LIKE special character.
+
+    :param pattern: LIKE pattern.
+    :type pattern: str.
+    """
+    return any(char in pattern for char in ('%', '_', '\\'))
+
+
+def like_or_equal(column, pattern, param=None):
+    """Return a condition matching a column with a LIKE pattern.
+
+    If the pattern does not contain any LIKE special character, an equality
+    is returned instead, so that the condition can use B-tree indexes.
+
+    :param column: column to be filtered.
+    :param pattern: LIKE pattern.
+    :type pattern: str.
+    :param param: name of a bind parameter compared instead of the pattern,
+                  for statements compiled once for many patterns. Only the
+                  kind of comparison is then chosen from `pattern`.
+    :type param: str.
+    """
+    value = pattern if param is None else bindparam(param)
+    if is_like_pattern(pattern):
+        return column.like(value)
+    return column == value
+
+
+def estimate_count(query):
+    """Return the number of rows of a query estimated by the planner.
+
+    It is much cheaper than a `COUNT(*)` on big tables, but its precision
+    depends on the freshness of the table statistics.
+
+    :param query: query object from SQLAlchemy.
+    :returns: estimated number of rows.
+    :rtype: int.
+    """
+    plan = query.session.execute(
+        Explain(query.order_by(None).statement)
+    ).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
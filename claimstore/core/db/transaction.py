@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Transaction helpers."""
+
+import random
+import time
+
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+RETRYABLE_ERRORS = (
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+)
+"""PostgreSQL error codes of the transactions that can be retried."""
+
+
+def is_retryable(error):
+    """Return whether a database error is a transient conflict.
+
+    :param error: :exc:`sqlalchemy.exc.DBAPIError`.
+    :rtype: bool
+    """
+    return getattr(error.orig, 'pgcode', None) in RETRYABLE_ERRORS
+
+
+def run_in_transaction(session, func, retries=3, backoff=0.05):
+    """Call a function and commit, retrying on transient conflicts.
+
+    When the transaction fails with a serialization failure or a deadlock,
+    it is rolled back and `func` is called again after a random delay that
+    grows exponentially. `func` must therefore do all the work of the
+    transaction and be safe to call again. Other database errors are raised
+    once the transaction has been rolled back, so the session can still be
+    used.
+
+    :param session: SQLAlchemy session.
+    :param func: callable without arguments.
+    :param retries: maximum number of retries.
+    :param backoff: base delay between retries, in seconds.
+    :returns: the value returned by `func`.
+    """
+    attempt = 0
+    while True:
+        try:
+            result = func()
+            session.commit()
+            return result
+        except SQLAlchemyError as e:
+            session.rollback()
+            if attempt >= retries or not isinstance(e, DBAPIError) or \
+                    not is_retryable(e):
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
@@ -20,12 +20,62 @@
 
 """Useful JSON-related methods."""
 
+import glob
 import json
 import os
 import pathlib
+import threading
+from copy import deepcopy
+from urllib.parse import urldefrag, urljoin
 
 import jsonschema
 from flask import current_app
+from werkzeug.utils import import_string
+
+try:
+    import fastjsonschema
+except ImportError:  # pragma: no cover
+    fastjsonschema = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_validators = {}
+_validators_lock = threading.Lock()
+_validators_mtime = None
+
+
+def _schemas_dir():
+    """Return the directory containing the JSON schemas."""
+    return os.path.join(
+        current_app.config['BASE_DIR'],
+        'claimstore',
+        'static',
+        'json',
+        'schemas'
+    )
+
+
+def _base_uri():
+    """Return the URI from which the `$ref` of the schemas are resolved."""
+    return '{}/'.format(
+        pathlib.Path(
+            os.path.join(
+                current_app.config['BASE_DIR'],
+                'claimstore'
+            )
+        ).as_uri()
+    )
+
+
+def _schemas_mtime():
+    """Return the last modification time of the JSON schemas."""
+    return max(
+        os.path.getmtime(path)
+        for path in glob.glob(os.path.join(_schemas_dir(), '*.json'))
+    )
 
 
 def get_json_schema(schema):
@@ -40,11 +90,7 @@ def get_json_schema(schema):
     module_name, schema_name = schema.split(".")
 
     schema_file_path = os.path.join(
-        current_app.config['BASE_DIR'],
-        'claimstore',
-        'static',
-        'json',
-        'schemas',
+        _schemas_dir(),
         '{}.json'.format(schema_name)
     )
 
@@ -52,6 +98,127 @@ def get_json_schema(schema):
         return f.read()
 
 
+def _inline_refs(node, base_uri, store, resolver, seen=()):
+    """Replace every `$ref` of a schema by the schema it points to.
+
+    As in the rest of ClaimStore, references are relative to `base_uri`.
+
+    References that would lead to an infinite recursion are kept, so they are
+    resolved by the validator's `RefResolver` at validation time.
+    """
+    if isinstance(node, list):
+        return [_inline_refs(item, base_uri, store, resolver, seen)
+                for item in node]
+    if not isinstance(node, dict):
+        return node
+    if '$ref' in node:
+        url = urljoin(base_uri, node['$ref'])
+        document_url, fragment = urldefrag(url)
+        if url not in seen and document_url in store:
+            target = resolver.resolve_fragment(store[document_url], fragment)
+            return _inline_refs(deepcopy(target), base_uri, store, resolver,
+                                seen + (url, ))
+        return node
+    return {key: _inline_refs(value, base_uri, store, resolver, seen)
+            for key, value in node.items()}
+
+
+class CompiledValidator(object):
+
+    """Validator based on the code generated by `fastjsonschema`.
+
+    It exposes the same `validate` method as :class:`jsonschema.Validator`,
+    raising :exc:`jsonschema.ValidationError` for invalid instances.
+
+    Like :class:`jsonschema.Draft4Validator` without a `FormatChecker`, it
+    does not check the `format` keyword, so both validators accept the same
+    instances.
+    """
+
+    def __init__(self, schema):
+        """Generate the validation code of a schema.
+
+        :param schema: JSON schema without `$ref`.
+        :type schema: dict.
+        """
+        self.schema = schema
+        self._validate = fastjsonschema.compile(schema, use_formats=False)
+
+    def validate(self, instance):
+        """Validate an instance.
+
+        :raises: :exc:`ValidationError` if the instance is invalid.
+        """
+        try:
+            self._validate(instance)
+        except fastjsonschema.JsonSchemaException as e:
+            raise jsonschema.ValidationError(e.message)
+
+
+def load_validators():
+    """Load and compile all the JSON schemas.
+
+    Every schema in `static/json/schemas` is parsed once, its references are
+    inlined and it is compiled into a :class:`jsonschema.Draft4Validator`.
+    The schemas listed in `CFG_JSON_SCHEMA_CODEGEN` use a generated
+    :class:`CompiledValidator` instead when `fastjsonschema` is installed.
+
+    :returns: a dictionary schema_name -> validator.
+    :rtype: dict.
+    """
+    base_uri = _base_uri()
+    store = {}
+    for path in glob.glob(os.path.join(_schemas_dir(), '*.json')):
+        with open(path) as f:
+            store[urljoin(base_uri, 'static/json/schemas/{}'.format(
+                os.path.basename(path)))] = json.load(f)
+
+    validators = {}
+    codegen = current_app.config['CFG_JSON_SCHEMA_CODEGEN']
+    for url, schema in store.items():
+        schema_name = os.path.splitext(url.rsplit('/', 1)[-1])[0]
+        resolver = jsonschema.RefResolver(base_uri, schema, store=store)
+        schema = _inline_refs(schema, base_uri, store, resolver)
+        if fastjsonschema and \
+                any(name.split('.')[1] == schema_name for name in codegen):
+            validators[schema_name] = CompiledValidator(schema)
+        else:
+            validators[schema_name] = jsonschema.Draft4Validator(
+                schema,
+                resolver=resolver
+            )
+    return validators
+
+
+def reload_validators():
+    """Reload all the JSON schemas.
+
+    It is called automatically on validation when
+    `CFG_JSON_SCHEMA_AUTO_RELOAD` is enabled and a schema file has changed,
+    which is convenient during development.
+    """
+    global _validators, _validators_mtime
+    with _validators_lock:
+        _validators_mtime = _schemas_mtime()
+        _validators = load_validators()
+
+
+def get_validator(schema):
+    """Return the compiled validator of a given schema.
+
+    :param schema: JSON schema to use in the validation. It must be a string
+                   with the format module.schema_name (e.g. claims.claimants).
+    :type schema: str.
+    :returns: a validator with a `validate(instance)` method.
+    """
+    if not _validators or (
+            current_app.config['CFG_JSON_SCHEMA_AUTO_RELOAD'] and
+            _schemas_mtime() != _validators_mtime):
+        reload_validators()
+    module_name, schema_name = schema.split(".")
+    return _validators[schema_name]
+
+
 def validate_json(json_input, schema):
     """Validate JSON against a given schema.
 
@@ -62,17 +229,48 @@ def validate_json(json_input, schema):
     :type schema: str.
     :raises: :exc:`ValidationError` if the instance is invalid.
     """
-    schema_content = get_json_schema(schema)
-    resolver = jsonschema.RefResolver('{}/'.format(
-        pathlib.Path(
-            os.path.join(
-                current_app.config['BASE_DIR'],
-                'claimstore'
-            )
-        ).as_uri()),
-        schema_content
-    )
-    jsonschema.Draft4Validator(
-        json.loads(schema_content),
-        resolver=resolver
-    ).validate(json_input)
+    get_validator(schema).validate(json_input)
+
+
+def orjson_dumps(obj):
+    """Encode JSON with `orjson`, which is several times faster than `json`.
+
+    :param obj: object to encode.
+    :returns: the JSON document.
+    :rtype: str.
+    """
+    return orjson.dumps(obj).decode('utf-8')
+
+
+ENCODERS = {
+    'json': json.dumps,
+    'orjson': orjson_dumps,
+}
+"""Encoders selected by name with `CFG_JSON_ENCODER`."""
+
+
+def get_encoder():
+    """Return the function encoding the JSON responses.
+
+    It is the encoder named by `CFG_JSON_ENCODER` or, if it is not set,
+    `orjson` when it is installed and the standard `json` module otherwise.
+    `CFG_JSON_ENCODER` can also be the import path of any function encoding
+    an object into a `str`.
+
+    :returns: a function object -> str.
+    """
+    name = current_app.config['CFG_JSON_ENCODER']
+    if not name:
+        return orjson_dumps if orjson else json.dumps
+    if name in ENCODERS:
+        return ENCODERS[name]
+    return import_string(name)
+
+
+def dumps(obj):
+    """Encode JSON with the encoder of :func:`get_encoder`.
+
+    :param obj: object to encode.
+    :rtype: str.
+    """
+    return get_encoder()(obj)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""In-process metrics."""
+
+import threading
+from collections import Counter
+
+
+class Counters(object):
+
+    """Thread-safe named counters.
+
+    Counters live in the memory of the process: every worker of a deployment
+    has its own values, counted since it started or since the last
+    :meth:`reset`. They are cheap enough to be incremented on every write and
+    are meant to be scraped, e.g. through `/api/eqids/stats`.
+    """
+
+    def __init__(self):
+        """Initialise the counters at zero."""
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def incr(self, name, amount=1):
+        """Increment a counter.
+
+        :param name: name of the counter, e.g. `eqid.merge`.
+        :param amount: value to add.
+        """
+        with self._lock:
+            self._values[name] += amount
+
+    def get(self, name):
+        """Return the value of a counter."""
+        with self._lock:
+            return self._values[name]
+
+    def snapshot(self, prefix=''):
+        """Return the current values of the counters.
+
+        :param prefix: only return the counters whose name starts with it.
+        :returns: a dictionary name -> value.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                name: value for name, value in self._values.items()
+                if name.startswith(prefix)
+            }
+
+    def reset(self):
+        """Reset all the counters to zero."""
+        with self._lock:
+            self._values.clear()
+
+
+counters = Counters()
+"""Counters of the process."""
@@ -20,8 +20,104 @@
 
 """Restful pagination."""
 
+import base64
+import binascii
+import json
+from datetime import datetime
+from math import ceil
+
+import isodate
 from flask import current_app, request, url_for
 from flask_restful import reqparse
+from sqlalchemy import types
+
+from claimstore.core.exception import InvalidRequest
+
+COUNT_MODES = ('exact', 'estimate', 'none')
+"""Ways of counting the total amount of data in page/per_page mode."""
+
+
+def encode_cursor(order, values):
+    """Encode the position of a row as an opaque cursor.
+
+    :param order: name of the order used to paginate.
+    :type order: str.
+    :param values: values of the order columns in the last fetched row.
+    :type values: list.
+    :returns: URL-safe cursor.
+    :rtype: str.
+    """
+    values = [v.isoformat() if isinstance(v, datetime) else v
+              for v in values]
+    return base64.urlsafe_b64encode(
+        json.dumps([order, values]).encode('utf-8')
+    ).decode('ascii')
+
+
+def decode_cursor(cursor, order, columns):
+    """Decode a cursor generated by :func:`encode_cursor`.
+
+    :param cursor: cursor received from the client.
+    :type cursor: str.
+    :param order: name of the order used to paginate.
+    :type order: str.
+    :param columns: columns of the order.
+    :returns: list with the values of the columns.
+    :rtype: list.
+    :raises: :exc:`InvalidRequest` if the cursor is not valid for the order.
+    """
+    try:
+        cursor_order, values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        )
+        if cursor_order != order or len(values) != len(columns):
+            raise ValueError('Cursor does not match the requested order')
+        return [
+            isodate.parse_datetime(value)
+            if isinstance(getattr(column.type, 'impl', column.type),
+                          types.DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except (binascii.Error, TypeError, ValueError, isodate.ISO8601Error):
+        raise InvalidRequest('Invalid pagination cursor')
+
+
+class Page(object):
+
+    """Page of results whose total amount of data may be unknown.
+
+    It offers the same attributes as Flask-SQLAlchemy's `Pagination` that are
+    needed to generate the links.
+    """
+
+    def __init__(self, page, per_page, items, has_next, total=None):
+        """Initialise the page.
+
+        :param page: number of the page.
+        :param per_page: amount of data per page.
+        :param items: data of the page.
+        :param has_next: whether there is a next page.
+        :param total: total amount of data (possibly estimated) or `None` if
+                      it is unknown.
+        """
+        self.page = page
+        self.per_page = per_page
+        self.items = items
+        self.has_next = has_next
+        self.total = total
+
+    @property
+    def has_prev(self):
+        """True if a previous page exists."""
+        return self.page > 1
+
+    @property
+    def pages(self):
+        """Total number of pages or `None` if it is unknown."""
+        if self.total is None or not self.per_page:
+            return None
+        pages = int(ceil(self.total / float(self.per_page)))
+        return max(pages, self.page + 1 if self.has_next else self.page)
 
 
 class RestfulSQLAlchemyPaginationMixIn(object):
@@ -34,15 +130,36 @@ class RestfulSQLAlchemyPaginationMixIn(object):
 
     :param page: page from which to fetch the data
     :param per_page: amout of data per page
+    :param count: how to count the total amount of data in order to generate
+                  the `last` link: `exact` (`COUNT(*)`), `estimate` (planner
+                  estimation) or `none` (no `last` link).
+
+    If the resource defines `cursor_orders`, two more query fields are added
+    to support keyset (cursor) pagination, which neither uses OFFSET nor
+    counts the results:
+
+    :param cursor: opaque position returned in the `next` link. An empty
+                   cursor fetches the first page.
+    :param sort: name of one of the `cursor_orders`.
     """
 
+    cursor_orders = {}
+    """Orders available for pagination: name -> tuple of columns.
+
+    The columns of an order must identify a row uniquely.
+    """
+
+    default_cursor_order = None
+    """Name of the order used when none is given."""
+
     def __init__(self):
         """Initialize pagination property."""
         self.args_parser = reqparse.RequestParser()
-        self._query = None
         self._page = None
         self._per_page = None
         self._pagination = None
+        self._order = None
+        self._next_cursor = None
 
         # Add extra arguments to Restful Resource
         self.args_parser.add_argument(
@@ -57,22 +174,87 @@ class RestfulSQLAlchemyPaginationMixIn(object):
             location='args', trim=True,
             help='Amount of data per page'
         )
+        self.args_parser.add_argument(
+            'count', dest='count', type=str,
+            default=current_app.config['CFG_PAGINATION_COUNT'],
+            choices=COUNT_MODES,
+            location='args', trim=True,
+            help='How to count the total amount of data'
+        )
+        if self.cursor_orders:
+            self.args_parser.add_argument(
+                'cursor', dest='cursor', type=str,
+                location='args', trim=True,
+                help='Position from where to fetch data'
+            )
+            self.args_parser.add_argument(
+                'sort', dest='sort', type=str,
+                default=self.default_cursor_order,
+                choices=sorted(self.cursor_orders),
+                location='args', trim=True,
+                help='Order of the data'
+            )
+
+    def paginate_with(self, fetch, page, per_page, total=None):
+        """Paginate the data returned by a callable.
 
-    def paginate(self, query, page, per_page):
-        """Paginate query.
+        Resources fetch the data themselves, e.g. with a compiled query. One
+        extra row is fetched to know if there is a next page.
 
-        :param query: query object from SQLAlchemy.
+        :param fetch: callable receiving the maximum amount of data and the
+                      offset from which to fetch it.
         :param page: page from which to fetch data.
         :param per_page: amount of data per page.
+        :param total: callable returning the total amount of data (possibly
+                      estimated), or `None` if it is not counted.
         """
-        self._query = query
+        if page < 1 or per_page < 0:
+            raise InvalidRequest('Invalid page or per_page')
         self._page = page
         self._per_page = per_page
-        self._pagination = self._query.paginate(self._page,
-                                                self._per_page,
-                                                False)
+        items = fetch(per_page + 1, (page - 1) * per_page)
+        self._pagination = Page(
+            page,
+            per_page,
+            items[:per_page],
+            len(items) > per_page,
+            total() if total else None
+        )
         return self._pagination.items
 
+    def paginate_cursor_with(self, fetch, cursor, per_page, order):
+        """Paginate with a cursor the data returned by a callable.
+
+        Only the data after the cursor is fetched, so the cost of a page does
+        not depend on its position. One extra row is fetched to know if there
+        is a next page.
+
+        :param fetch: callable receiving the values of the columns of `order`
+                      after which to fetch data (`None` for the first page)
+                      and the maximum amount of data. It must return the
+                      data sorted by `order`, with the columns as attributes.
+        :param cursor: cursor from which to fetch data. `None` or an empty
+                       string fetch the first page.
+        :param per_page: amount of data per page.
+        :param order: name of one of the `cursor_orders`.
+        :raises: :exc:`InvalidRequest` if `per_page` is not positive.
+        """
+        if per_page < 1:
+            raise InvalidRequest('Invalid per_page')
+        columns = self.cursor_orders[order]
+        self._per_page = per_page
+        self._order = order
+        values = decode_cursor(cursor, order, columns) if cursor else None
+        items = fetch(values, per_page + 1)
+        self._next_cursor = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            self._next_cursor = encode_cursor(
+                order,
+                [getattr(items[-1], column.key) for column in columns]
+            )
+        return items
+
     def set_link_header(self, response, **kwargs):
         """Set Link details in the response header.
 
@@ -100,9 +282,25 @@ class RestfulSQLAlchemyPaginationMixIn(object):
 
         # arguments to stick to the URL
         url_args = dict(args)
+        url_args['per_page'] = self._per_page
+
+        if self._order:
+            # cursor pagination only knows the first and the next pages
+            url_args.pop('page', None)
+            url_args['sort'] = self._order
+            url_args['cursor'] = ''
+            links['first'] = link_template.format(
+                url_for(endpoint, **url_args), "first"
+            )
+            if self._next_cursor:
+                url_args['cursor'] = self._next_cursor
+                links['next'] = link_template.format(
+                    url_for(endpoint, **url_args), "next"
+                )
+            return links
+
         # url_args['page'] will be updated for every link
         url_args['page'] = 1
-        url_args['per_page'] = self._per_page
 
         # generate link for rel first
         links['first'] = link_template.format(
@@ -123,9 +321,10 @@ class RestfulSQLAlchemyPaginationMixIn(object):
                 url_for(endpoint, **url_args), "next"
             )
 
-        # generate link for last
-        url_args['page'] = self._pagination.pages
-        links['last'] = link_template.format(
-            url_for(endpoint, **url_args), "last"
-        )
+        # generate link for last if the amount of data is known
+        if self._pagination.pages is not None:
+            url_args['page'] = self._pagination.pages
+            links['last'] = link_template.format(
+                url_for(endpoint, **url_args), "last"
+            )
         return links
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""Union-find (disjoint sets) data structure."""
+
+from array import array
+
+
+class UnionFind(object):
+
+    """Disjoint sets of hashable keys.
+
+    Keys are interned into consecutive integers when they are added, so that
+    the forest is stored in two compact arrays (parents and sizes) instead of
+    one Python object per key. Sets are merged by size and paths are halved
+    while searching, so operations run in almost constant time.
+    """
+
+    def __init__(self):
+        """Initialise an empty structure."""
+        self.keys = []
+        self._indexes = {}
+        self._parents = array('l')
+        self._sizes = array('l')
+
+    def __len__(self):
+        """Return the number of keys."""
+        return len(self.keys)
+
+    def __contains__(self, key):
+        """Return whether the key has been added."""
+        return key in self._indexes
+
+    def add(self, key):
+        """Add a key in its own set, if it is not known yet.
+
+        :param key: hashable key.
+        :returns: the index of the key.
+        :rtype: int
+        """
+        index = self._indexes.get(key)
+        if index is None:
+            index = len(self.keys)
+            self._indexes[key] = index
+            self.keys.append(key)
+            self._parents.append(index)
+            self._sizes.append(1)
+        return index
+
+    def index(self, key):
+        """Return the index of a key.
+
+        :raises: KeyError if the key has not been added.
+        """
+        return self._indexes[key]
+
+    def root(self, index):
+        """Return the index of the root of the set of an index."""
+        parents = self._parents
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def find(self, key):
+        """Return the index of the root of the set of a key."""
+        return self.root(self._indexes[key])
+
+    def union(self, key1, key2):
+        """Merge the sets of two keys, adding them if necessary.
+
+        :returns: the index of the root of the merged set.
+        :rtype: int
+        """
+        root1 = self.root(self.add(key1))
+        root2 = self.root(self.add(key2))
+        if root1 == root2:
+            return root1
+        if self._sizes[root1] < self._sizes[root2]:
+            root1, root2 = root2, root1
+        self._parents[root2] = root1
+        self._sizes[root1] += self._sizes[root2]
+        return root1
+
+    def size(self, key):
+        """Return the number of keys in the set of a key."""
+        return self._sizes[self.find(key)]
+
+    def components(self):
+        """Return the sets as a dictionary of root index -> key indexes."""
+        components = {}
+        for index in range(len(self.keys)):
+            components.setdefault(self.root(index), []).append(index)
+        return components
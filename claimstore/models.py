@@ -20,15 +20,24 @@
 
 """ClaimStore data model."""
 
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
 from uuid import uuid4
 
 from flask import current_app
-from sqlalchemy import or_
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import Date, and_, bindparam, case, cast, false, func, \
+    literal, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, REGCLASS, UUID, \
+    array, insert
+from sqlalchemy.sql.expression import ClauseElement
 
 from claimstore.app import db
 from claimstore.core.datetime import now_utc
 from claimstore.core.db.types import UTCDateTime
+from claimstore.core.metrics import counters
+from claimstore.core.unionfind import UnionFind
 
 
 class Claim(db.Model):
@@ -37,6 +46,28 @@ class Claim(db.Model):
 
     Each claim is associated to a specific Claimant and references some already
     existing Identifier Types and predicate.
+
+    Claims are indexed following the filters of the REST API. Existing
+    databases can be brought up to date with `claimstore index create`, which
+    optionally creates trigram indexes for LIKE searches.
+    """
+
+    __table_args__ = (
+        db.Index('ix_claim_subject_value_subject_type_id',
+                 'subject_value', 'subject_type_id'),
+        db.Index('ix_claim_object_value_object_type_id',
+                 'object_value', 'object_type_id'),
+        db.Index('ix_claim_subject_type_id_id', 'subject_type_id', 'id'),
+        db.Index('ix_claim_object_type_id_id', 'object_type_id', 'id'),
+        db.Index('ix_claim_received_id', 'received', 'id'),
+        db.Index('ix_claim_claimant_id_created', 'claimant_id', 'created'),
+        db.Index('ix_claim_predicate_id_created', 'predicate_id', 'created'),
+    )
+
+    trigram_columns = ('subject_value', 'object_value', 'actor', 'role')
+    """Columns indexed by `claimstore index create --trigram`.
+
+    These columns can be searched with LIKE patterns in the REST API.
     """
 
     id = db.Column(
@@ -62,7 +93,8 @@ class Claim(db.Model):
 
     created = db.Column(
         UTCDateTime,
-        nullable=False
+        nullable=False,
+        index=True
     )
     """Datetime in which the claim has been created by the claimant."""
 
@@ -88,7 +120,8 @@ class Claim(db.Model):
 
     subject_eqid = db.Column(
         db.Integer,
-        db.ForeignKey('equivalent_identifier.id', ondelete='SET NULL')
+        db.ForeignKey('equivalent_identifier.id', ondelete='SET NULL'),
+        index=True
     )
     """Unique identifier for this subject (type, value)."""
 
@@ -101,17 +134,18 @@ class Claim(db.Model):
 
     certainty = db.Column(
         db.Float,
-        nullable=False
+        nullable=False,
+        index=True
     )
     """Certainty of the claim. It must be a float between 0 and 1.0."""
 
-    human = db.Column(db.Integer)
+    human = db.Column(db.Integer, index=True)
     """Whether the claims has been done by a human (1) or not (0)."""
 
-    actor = db.Column(db.String)
+    actor = db.Column(db.String, index=True)
     """`Human` that has performed the claim."""
 
-    role = db.Column(db.String)
+    role = db.Column(db.String, index=True)
     """Role of the `human` who has performed the claim."""
 
     object_type_id = db.Column(
@@ -129,7 +163,8 @@ class Claim(db.Model):
 
     object_eqid = db.Column(
         db.Integer,
-        db.ForeignKey('equivalent_identifier.id', ondelete='SET NULL')
+        db.ForeignKey('equivalent_identifier.id', ondelete='SET NULL'),
+        index=True
     )
     """Unique identifier for this object (type, value)."""
 
@@ -138,16 +173,149 @@ class Claim(db.Model):
 
     @classmethod
     def equivalents(cls, type_name, value):
-        """Get claims with the all the equivalent subjects or objects."""
-        all_eqids = EquivalentIdentifier.equivalent_ids(type_name, value)
-        if all_eqids:
-            return cls.query.filter(
-                or_(
-                    cls.subject_eqid.in_(all_eqids),
-                    cls.object_eqid.in_(all_eqids)
-                )
-            ).all()
-        return []
+        """Get claims with the all the equivalent subjects or objects.
+
+        The returned query is a single SQL statement: it resolves the cluster
+        of the given identifier and joins the claims through
+        `equivalent_identifier`, so that it can be further filtered and
+        paginated. The subject and the object of an equivalence claim always
+        belong to the same cluster, so only the subjects are joined.
+        """
+        type_id = identifier_type_cache.get_id(type_name)
+        if not type_id:
+            return cls.query.filter(false())
+        return cls.filter_equivalents(cls.query, type_id, value)
+
+    @classmethod
+    def filter_equivalents(cls, query, type_id, value):
+        """Filter claims with the equivalent subjects or objects.
+
+        :param query: query of the claims, see :meth:`equivalents`.
+        :param type_id: id of the type of the identifier or a bind parameter.
+        :param value: value of the identifier or a bind parameter.
+        :returns: the filtered query.
+        """
+        eqid = db.session.query(EquivalentIdentifier.eqid).filter(
+            EquivalentIdentifier.type_id == type_id,
+            EquivalentIdentifier.value == value
+        ).limit(1).as_scalar()
+        members = EquivalentCluster.members(
+            EquivalentCluster.root_expression(eqid)
+        )
+        return query.join(
+            EquivalentIdentifier,
+            cls.subject_eqid == EquivalentIdentifier.id
+        ).filter(EquivalentIdentifier.eqid.in_(members))
+
+    @classmethod
+    def join_lookup(cls, query, recurse=False):
+        """Join a query of claims with the identifiers of a lookup.
+
+        The identifiers are not part of the statement: they are bound as
+        arrays to the parameters `lookup_type_ids` and `lookup_values`, each
+        identifier being matched through the identifiers at the same position
+        of `lookup_member_type_ids` and `lookup_member_values`. The statement
+        is therefore the same whatever the number of identifiers.
+
+        :param query: query of the claims.
+        :param recurse: if True, the members are the identifiers of the
+            cluster of each identifier and the claims are joined through
+            their subject eqid, as in :meth:`equivalents`. Otherwise the
+            members are the identifiers themselves and they are matched with
+            the subjects and the objects of the claims.
+        :returns: the query with the columns `lookup_type_id` and
+            `lookup_value` added.
+        """
+        lookup = select([
+            func.unnest(bindparam(
+                'lookup_type_ids', type_=ARRAY(db.Integer)
+            )).label('type_id'),
+            func.unnest(bindparam(
+                'lookup_values', type_=ARRAY(db.String)
+            )).label('value'),
+            func.unnest(bindparam(
+                'lookup_member_type_ids', type_=ARRAY(db.Integer)
+            )).label('member_type_id'),
+            func.unnest(bindparam(
+                'lookup_member_values', type_=ARRAY(db.String)
+            )).label('member_value'),
+        ]).alias('lookup')
+        columns = [lookup.c.type_id, lookup.c.value, cls.id.label('claim_id')]
+        if recurse:
+            matches = select(columns).select_from(
+                lookup.join(
+                    EquivalentIdentifier,
+                    and_(
+                        EquivalentIdentifier.type_id ==
+                        lookup.c.member_type_id,
+                        EquivalentIdentifier.value == lookup.c.member_value
+                    )
+                ).join(cls, cls.subject_eqid == EquivalentIdentifier.id)
+            )
+        else:
+            matches = select(columns).select_from(
+                lookup.join(cls, and_(
+                    cls.subject_type_id == lookup.c.member_type_id,
+                    cls.subject_value == lookup.c.member_value
+                ))
+            ).union(select(columns).select_from(
+                lookup.join(cls, and_(
+                    cls.object_type_id == lookup.c.member_type_id,
+                    cls.object_value == lookup.c.member_value
+                ))
+            ))
+        matches = matches.alias('matches')
+        return query.join(matches, cls.id == matches.c.claim_id).add_columns(
+            matches.c.type_id.label('lookup_type_id'),
+            matches.c.value.label('lookup_value')
+        )
+
+    @staticmethod
+    def equivalence_predicate_ids():
+        """Return the ids of the predicates in `CFG_EQUIVALENT_PREDICATES`."""
+        predicate_ids = [
+            predicate_cache.get_id(name)
+            for name in current_app.config['CFG_EQUIVALENT_PREDICATES']
+        ]
+        return [id_ for id_ in predicate_ids if id_]
+
+    @classmethod
+    def reserve_ids(cls, count):
+        """Return new claim ids, fetched from the sequence with one query.
+
+        It allows to refer to claims before inserting them.
+
+        :param count: number of ids.
+        :rtype: list
+        """
+        sequence = cast(
+            func.pg_get_serial_sequence(cls.__tablename__, 'id'), REGCLASS
+        )
+        return [id_ for id_, in db.session.query(func.nextval(sequence)).
+                select_from(func.generate_series(1, count))]
+
+    @classmethod
+    def version(cls):
+        """Return a cheap version of the claims and of their eqids.
+
+        It changes whenever a claim is recorded, the eqid index changes or
+        the queue of claims waiting for their eqids moves. Every part is read
+        from the end of a primary key index, from the (small) queue or from
+        the single row of :class:`EquivalentIndexState`, so it does not scan
+        the claims.
+
+        :returns: the last claim id, the last eqid event id, the last queued
+            claim id, the length of the queue and the generation of the
+            index.
+        :rtype: tuple
+        """
+        return db.session.query(
+            select([func.max(cls.id)]).as_scalar(),
+            select([func.max(EquivalentEvent.id)]).as_scalar(),
+            select([func.max(EquivalentQueue.id)]).as_scalar(),
+            select([func.count(EquivalentQueue.id)]).as_scalar(),
+            select([func.max(EquivalentIndexState.generation)]).as_scalar()
+        ).one()
 
     def __repr__(self):
         """Printable version of the Claim object."""
@@ -369,8 +537,18 @@ class EquivalentIdentifier(db.Model):
        same data resource.
     #. It will simplify the recursive query by type/value in any
        subject/object claim.
+
+    An identifier keeps the eqid it was given when inserted. When a claim
+    links two existing clusters, they are merged in :class:`EquivalentCluster`
+    instead of rewriting the eqid of all the identifiers of one of them, so
+    equivalent identifiers must be looked up through their canonical eqid.
     """
 
+    __table_args__ = (
+        db.Index('uq_equivalent_identifier_type_id_value',
+                 'type_id', 'value', unique=True),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -382,20 +560,18 @@ class EquivalentIdentifier(db.Model):
         nullable=False,
         index=True
     )
-    """Universally Unique Identifier that represents a single data resource."""
+    """Eqid of the cluster in which the identifier was inserted."""
 
     type_id = db.Column(
         db.Integer,
         db.ForeignKey('identifier_type.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     """The id of a given IdentifierType."""
 
     value = db.Column(
         db.String,
-        nullable=False,
-        index=True
+        nullable=False
     )
     """A given value for the IdentifierType."""
 
@@ -403,19 +579,21 @@ class EquivalentIdentifier(db.Model):
     def equivalents(cls, type_name, value):
         """Return all the equivalent identifiers.
 
-        This method fetches the eqid for a given (type_name, value) and uses it
-        to find all the equivalent identifiers.
+        This method fetches the eqid for a given (type_name, value), resolves
+        its cluster and uses it to find all the equivalent identifiers.
         """
-        type_ = IdentifierType.query.filter_by(name=type_name).first()
-        if type_:
+        type_id = identifier_type_cache.get_id(type_name)
+        if type_id:
             eqi = cls.query.with_entities(
                 cls.eqid).filter_by(
-                    type_id=type_.id,
+                    type_id=type_id,
                     value=value
             ).first()
             if eqi:
                 return cls.query.filter(
-                    cls.eqid == eqi.eqid
+                    cls.eqid.in_(EquivalentCluster.members(
+                        EquivalentCluster.root(eqi.eqid)
+                    ))
                 )
         return []
 
@@ -432,70 +610,1535 @@ class EquivalentIdentifier(db.Model):
             return eqs.with_entities(cls.id)
         return []
 
+    @classmethod
+    def clusters(cls, keys):
+        """Return the clusters of many identifiers.
+
+        The identifiers are fetched with a single query using the composite
+        (type_id, value) index, their canonical eqids are resolved with a
+        single query and so are the members of all the clusters.
+
+        :param keys: iterable of tuples (type_id, value).
+        :returns: a dictionary (type_id, value) -> (canonical eqid, list of
+                  tuples (type_id, value) of the cluster). Unknown identifiers
+                  are not included.
+        :rtype: dict.
+        """
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        eqids = {
+            (type_id, value): eqid
+            for type_id, value, eqid in db.session.query(
+                cls.type_id, cls.value, cls.eqid
+            ).filter(tuple_(cls.type_id, cls.value).in_(keys))
+        }
+        if not eqids:
+            return {}
+        roots = EquivalentCluster.roots(eqids.values())
+        members = cls.cluster_members(set(roots.values()))
+        return {
+            key: (roots[eqid], members[roots[eqid]])
+            for key, eqid in eqids.items()
+        }
+
+    @classmethod
+    def cluster_members(cls, roots):
+        """Return the identifiers of many clusters with a single query.
+
+        :param roots: iterable of canonical eqids.
+        :returns: a dictionary canonical eqid -> list of tuples (type_id,
+                  value), sorted like `roots`.
+        :rtype: collections.OrderedDict.
+        """
+        roots = list(roots)
+        members = OrderedDict((root, []) for root in roots)
+        if not roots:
+            return members
+        trees = EquivalentCluster.trees(roots)
+        for root, type_id, value in db.session.query(
+                trees.c.root, cls.type_id, cls.value
+        ).filter(cls.eqid == trees.c.eqid).order_by(cls.type_id, cls.value):
+            members[root].append((type_id, value))
+        return members
+
+    @classmethod
+    def _fetch(cls, keys):
+        """Return the identifiers of many (type_id, value) with one query.
+
+        :param keys: iterable of tuples (type_id, value).
+        :returns: a dictionary (type_id, value) -> EquivalentIdentifier.
+        :rtype: dict.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        return {
+            (eqi.type_id, eqi.value): eqi
+            for eqi in cls.query.filter(
+                tuple_(cls.type_id, cls.value).in_(keys)
+            )
+        }
+
+    @classmethod
+    def _insert_missing(cls, eqids):
+        """Insert identifiers unless they already exist.
+
+        The rows are inserted with a single `INSERT ... ON CONFLICT DO
+        NOTHING` on the unique (type_id, value) index, so an identifier
+        inserted meanwhile by a concurrent transaction is skipped instead of
+        being duplicated or raising an integrity error. The caller must fetch
+        the identifiers again to get their actual eqids.
+
+        :param eqids: dictionary (type_id, value) -> eqid to insert.
+        :type eqids: dict.
+        """
+        if not eqids:
+            return
+        db.session.execute(
+            insert(cls.__table__).values([
+                {'eqid': eqid, 'type_id': type_id, 'value': value}
+                for (type_id, value), eqid in eqids.items()
+            ]).on_conflict_do_nothing(
+                index_elements=[cls.type_id, cls.value]
+            )
+        )
+
     @classmethod
     def set_equivalent_id(cls, subject_id, subject_value, object_id,
-                          object_value):
-        """Store and return the equivalent identifiers as required."""
-        subject_eqid = cls.query.filter_by(
-            type_id=subject_id,
-            value=subject_value
-        ).first()
-        object_eqid = cls.query.filter_by(
-            type_id=object_id,
-            value=object_value
-        ).first()
-        if not (subject_eqid or object_eqid):
+                          object_value, claim_id=None):
+        """Store and return the equivalent identifiers as required.
+
+        Both identifiers are looked up with a single query and the missing
+        ones are inserted with :meth:`_insert_missing`. If one of them has
+        been inserted concurrently in another cluster, both clusters are
+        merged.
+
+        The counters `eqid.new`, `eqid.extend` and `eqid.merge` (see
+        :mod:`claimstore.core.metrics`) record whether a cluster has been
+        created, extended with a new identifier or merged with another one.
+        These changes are also recorded in the :class:`EquivalentEvent` log,
+        along with `claim_id`.
+        """
+        subject_key = (subject_id, subject_value)
+        object_key = (object_id, object_value)
+        known = cls._fetch([subject_key, object_key])
+        subject_eqid = known.get(subject_key)
+        object_eqid = known.get(object_key)
+        if subject_eqid and object_eqid:
+            if subject_eqid.eqid != object_eqid.eqid:
+                EquivalentCluster.link(subject_eqid.eqid, object_eqid.eqid,
+                                       claim_id)
+            return subject_eqid, object_eqid
+        if subject_eqid or object_eqid:
+            counters.incr('eqid.extend')
+            kind = 'extend'
+            eqid_uuid = (subject_eqid or object_eqid).eqid
+        else:
+            counters.incr('eqid.new')
+            kind = 'new'
             eqid_uuid = str(uuid4())
-            subject_eqid = cls(
-                eqid=eqid_uuid,
-                type_id=subject_id,
-                value=subject_value
+            db.session.add(EquivalentCluster(eqid=eqid_uuid))
+        missing = {
+            key: eqid_uuid for key in (subject_key, object_key)
+            if key not in known
+        }
+        cls._insert_missing(missing)
+        known.update(cls._fetch(missing))
+        EquivalentEvent.record(kind, eqid_uuid, claim_id=claim_id,
+                               identifiers=[key for key in missing
+                                            if known[key].eqid == eqid_uuid])
+        for key in missing:
+            if known[key].eqid != eqid_uuid:
+                EquivalentCluster.link(eqid_uuid, known[key].eqid, claim_id)
+        return known[subject_key], known[object_key]
+
+    @classmethod
+    def set_equivalent_ids(cls, pairs, claim_ids=None):
+        """Store and return the equivalent identifiers of many claims at once.
+
+        It is the bulk version of :meth:`set_equivalent_id`. All the existing
+        identifiers referenced in `pairs` are fetched with a single query, new
+        identifiers are inserted together and clusters are linked at the end.
+
+        :param pairs: list of tuples (subject_type_id, subject_value,
+                      object_type_id, object_value).
+        :type pairs: list.
+        :param claim_ids: optional list with the id of the claim of each pair,
+                          recorded in the :class:`EquivalentEvent` log.
+        :type claim_ids: list.
+        :returns: a list with a tuple (subject_eqid, object_eqid) per pair.
+        :rtype: list.
+        """
+        if not pairs:
+            return []
+        if claim_ids is None:
+            claim_ids = [None] * len(pairs)
+        keys = set()
+        for subject_id, subject_value, object_id, object_value in pairs:
+            keys.add((subject_id, subject_value))
+            keys.add((object_id, object_value))
+        known = cls._fetch(keys)
+        # Eqids given to the identifiers that are not stored yet.
+        missing = {}
+        # Maps every eqid linked in this batch to the eqid it was linked to.
+        merged = {}
+
+        def find(eqid):
+            while eqid in merged:
+                eqid = merged[eqid]
+            return eqid
+
+        def eqid_of(key):
+            eqi = known.get(key)
+            return eqi.eqid if eqi else missing.get(key)
+
+        new_clusters, links, events = [], [], []
+        for (subject_id, subject_value, object_id, object_value), claim_id in \
+                zip(pairs, claim_ids):
+            subject_key = (subject_id, subject_value)
+            object_key = (object_id, object_value)
+            subject_eqid = eqid_of(subject_key)
+            object_eqid = eqid_of(object_key)
+            if subject_eqid and object_eqid:
+                subject_root = find(subject_eqid)
+                object_root = find(object_eqid)
+                if subject_root != object_root:
+                    merged[object_root] = subject_root
+                    links.append((subject_root, object_root, claim_id))
+                continue
+            if subject_eqid or object_eqid:
+                counters.incr('eqid.extend')
+                kind = 'extend'
+                eqid_uuid = find(subject_eqid or object_eqid)
+            else:
+                counters.incr('eqid.new')
+                kind = 'new'
+                eqid_uuid = str(uuid4())
+                new_clusters.append(EquivalentCluster(eqid=eqid_uuid))
+            added = [key for key in (subject_key, object_key)
+                     if eqid_of(key) is None]
+            for key in added:
+                missing[key] = eqid_uuid
+            events.append((kind, eqid_uuid, added, claim_id))
+
+        db.session.add_all(new_clusters)
+        cls._insert_missing(missing)
+        known.update(cls._fetch(missing))
+        for kind, eqid, added, claim_id in events:
+            EquivalentEvent.record(kind, eqid, claim_id=claim_id, identifiers=[
+                key for key in added if known[key].eqid == eqid
+            ])
+            for key in added:
+                if known[key].eqid != eqid:
+                    links.append((eqid, known[key].eqid, claim_id))
+        for subject_root, object_root, claim_id in links:
+            EquivalentCluster.link(subject_root, object_root, claim_id)
+        return [
+            (known[(subject_id, subject_value)],
+             known[(object_id, object_value)])
+            for subject_id, subject_value, object_id, object_value in pairs
+        ]
+
+    @classmethod
+    def clear(cls):
+        """Delete all the entries of the table equivalent_identifiers."""
+        cls.query.delete()
+        EquivalentCluster.query.delete()
+        EquivalentIndexState.query.delete()
+        EquivalentEvent.query.delete()
+        db.session.commit()
+
+    @staticmethod
+    def equivalence_claims():
+        """Return the identifiers of the claims using equivalence predicates.
+
+        The query returns tuples (subject_type_id, subject_value,
+        object_type_id, object_value).
+        """
+        return db.session.query(
+            Claim.subject_type_id,
+            Claim.subject_value,
+            Claim.object_type_id,
+            Claim.object_value
+        ).filter(
+            Claim.predicate_id.in_(Claim.equivalence_predicate_ids())
+        ).order_by(Claim.id)
+
+    @classmethod
+    def rebuild(cls, engine='unionfind', progress=None):
+        """Rebuild index based on claims.
+
+        Existing entries are kept: rebuilding only adds the missing
+        identifiers and merges the clusters linked by the claims.
+
+        :param engine: `unionfind` computes all the clusters in memory and
+                       writes them back in bulk, `legacy` records the claims
+                       one by one with :meth:`set_equivalent_id`.
+        :type engine: str.
+        :param progress: optional callable receiving the number of claims
+                         processed since its previous call.
+        :returns: the number of claims relinked by :meth:`relink_claims`.
+        :rtype: int
+        """
+        if engine not in ('legacy', 'unionfind'):
+            raise ValueError('Unknown rebuild engine: {}'.format(engine))
+        last_claim_id = db.session.query(func.max(Claim.id)).scalar() or 0
+        if engine == 'legacy':
+            cls._rebuild_legacy(progress)
+        else:
+            cls._rebuild_unionfind(progress)
+        EquivalentCluster.backfill()
+        db.session.commit()
+        relinked = cls.relink_claims()
+        EquivalentIndexState.get().complete(last_claim_id)
+        db.session.commit()
+        return relinked
+
+    @classmethod
+    def relink_claims(cls, min_claim_id=0):
+        """Link the equivalence claims to their equivalent identifiers.
+
+        `Claim.subject_eqid` and `Claim.object_eqid` are set with
+        `UPDATE claim ... FROM equivalent_identifier` statements, each of
+        them covering a range of `CFG_EQUIVALENT_REBUILD_CHUNK_SIZE` claim
+        ids and committed on its own. Claims that are already correctly
+        linked are not written.
+
+        :param min_claim_id: only claims with a greater id are relinked.
+        :type min_claim_id: int.
+        :returns: the number of relinked claims.
+        :rtype: int
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        claim = Claim.__table__
+        subject = cls.__table__.alias('subject')
+        object_ = cls.__table__.alias('object')
+        statement = claim.update().where(and_(
+            claim.c.predicate_id.in_(Claim.equivalence_predicate_ids()),
+            claim.c.id > bindparam('low'),
+            claim.c.id <= bindparam('high'),
+            subject.c.type_id == claim.c.subject_type_id,
+            subject.c.value == claim.c.subject_value,
+            object_.c.type_id == claim.c.object_type_id,
+            object_.c.value == claim.c.object_value,
+            or_(
+                claim.c.subject_eqid.is_distinct_from(subject.c.id),
+                claim.c.object_eqid.is_distinct_from(object_.c.id)
+            )
+        )).values(subject_eqid=subject.c.id, object_eqid=object_.c.id)
+
+        last_claim_id = db.session.query(func.max(Claim.id)).scalar() or 0
+        relinked = 0
+        for low in range(min_claim_id, last_claim_id, chunk_size):
+            result = db.session.execute(
+                statement, {'low': low, 'high': low + chunk_size}
+            )
+            db.session.commit()
+            relinked += result.rowcount
+        EquivalentIndexState.bump()
+        db.session.commit()
+        return relinked
+
+    @staticmethod
+    def unlinked_claims():
+        """Return the equivalence claims missing their equivalent identifiers.
+
+        It is used to verify the index after a rebuild.
+        """
+        return Claim.query.filter(
+            Claim.predicate_id.in_(Claim.equivalence_predicate_ids()),
+            or_(Claim.subject_eqid.is_(None), Claim.object_eqid.is_(None))
+        )
+
+    @classmethod
+    def incremental_claims(cls):
+        """Return the claims that an incremental reindex has to process.
+
+        These are the claims received after the watermark of the index and
+        the older claims using predicates that were not equivalence
+        predicates when they were processed. If a previous incremental
+        reindex was interrupted, it is resumed from its last checkpoint.
+
+        The query returns tuples (subject_type_id, subject_value,
+        object_type_id, object_value, id).
+        """
+        state = EquivalentIndexState.get()
+        new_predicate_ids = [
+            predicate_cache.get_id(name) for name in state.new_predicates()
+        ]
+        new_predicate_ids = [id_ for id_ in new_predicate_ids if id_]
+        query = cls.equivalence_claims().add_columns(Claim.id)
+        if new_predicate_ids:
+            query = query.filter(or_(
+                Claim.id > state.claim_id,
+                Claim.predicate_id.in_(new_predicate_ids)
+            ))
+        else:
+            query = query.filter(Claim.id > state.claim_id)
+        if state.resume_claim_id is not None and \
+                state.resume_predicates == state.target_predicates():
+            query = query.filter(Claim.id > state.resume_claim_id)
+        return query
+
+    @classmethod
+    def rebuild_incremental(cls, progress=None):
+        """Update the index with the claims it has not processed yet.
+
+        The claims returned by :meth:`incremental_claims` are recorded in
+        batches of `CFG_EQUIVALENT_REBUILD_CHUNK_SIZE` with
+        :meth:`set_equivalent_ids`. Each batch is committed together with a
+        checkpoint, so that an interrupted reindex can be resumed.
+
+        The processed claims are then linked to their identifiers with
+        :meth:`relink_claims`. Clusters are never split: removing a predicate
+        from `CFG_EQUIVALENT_PREDICATES` requires a full rebuild.
+
+        :param progress: optional callable receiving the number of claims
+                         processed since its previous call.
+        :returns: the number of processed claims.
+        :rtype: int
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        last_claim_id = db.session.query(func.max(Claim.id)).scalar() or 0
+        state = EquivalentIndexState.get()
+        relink_from = 0 if state.new_predicates() else state.claim_id
+        query = cls.incremental_claims().filter(Claim.id <= last_claim_id)
+        position, count = 0, 0
+        while True:
+            rows = query.filter(Claim.id > position).limit(chunk_size).all()
+            if not rows:
+                break
+            cls.set_equivalent_ids([row[:4] for row in rows],
+                                   [row[4] for row in rows])
+            position = rows[-1][4]
+            EquivalentIndexState.get().checkpoint(position)
+            db.session.commit()
+            count += len(rows)
+            if progress:
+                progress(len(rows))
+        cls.relink_claims(relink_from)
+        EquivalentIndexState.get().complete(last_claim_id)
+        db.session.commit()
+        return count
+
+    @classmethod
+    def replay(cls, progress=None):
+        """Rebuild the index from the :class:`EquivalentEvent` log.
+
+        The clusters are computed in memory with
+        :meth:`EquivalentEvent.clusters` and the index is rewritten in bulk,
+        with every cluster linked directly to its canonical cluster. The
+        clusters keep the creation and merge datetimes of their events, so
+        that the history of :meth:`EquivalentCluster.statistics` survives.
+        The claims are then linked to their equivalent identifiers.
+
+        The log is never modified: to rebuild the index as it was at some
+        point in time, the later events have to be deleted first with
+        :meth:`EquivalentEvent.truncate`.
+
+        :param progress: optional callable receiving the number of events
+                         replayed since its previous call.
+        :returns: the number of claims relinked by :meth:`relink_claims`.
+        :rtype: int
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        times = {}
+        roots, identifiers = EquivalentEvent.clusters(progress=progress,
+                                                      times=times)
+        cls.query.delete()
+        EquivalentCluster.query.delete()
+
+        linked = set(
+            root for eqid, root in roots.items() if eqid != root
+        )
+        clusters = [
+            {'eqid': root, 'rank': 1 if root in linked else 0,
+             'created': times[root][0]}
+            for root in set(roots.values())
+        ] + [
+            {'eqid': eqid, 'parent_eqid': root, 'rank': 0,
+             'created': times[eqid][0], 'linked': times[eqid][1]}
+            for eqid, root in roots.items() if eqid != root
+        ]
+        for start in range(0, len(clusters), chunk_size):
+            db.session.bulk_insert_mappings(
+                EquivalentCluster, clusters[start:start + chunk_size]
             )
-            db.session.add(subject_eqid)
-            object_eqid = cls(
-                eqid=eqid_uuid,
-                type_id=object_id,
-                value=object_value
+        eqids = [
+            {'eqid': eqid, 'type_id': type_id, 'value': value}
+            for (type_id, value), eqid in identifiers.items()
+        ]
+        for start in range(0, len(eqids), chunk_size):
+            db.session.bulk_insert_mappings(cls,
+                                            eqids[start:start + chunk_size])
+        db.session.commit()
+        return cls.relink_claims()
+
+    @classmethod
+    def _rebuild_legacy(cls, progress):
+        """Rebuild the index recording the claims one by one."""
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        count = 0
+        for row in cls.equivalence_claims().add_columns(Claim.id).all():
+            cls.set_equivalent_id(*row[:4], claim_id=row[4])
+            count += 1
+            if progress and count % chunk_size == 0:
+                progress(chunk_size)
+        if progress:
+            progress(count % chunk_size)
+
+    @classmethod
+    def _rebuild_unionfind(cls, progress):
+        """Rebuild the index computing the clusters in memory.
+
+        The existing entries, grouped by canonical eqid, and the equivalence
+        claims are streamed into a
+        :class:`~claimstore.core.unionfind.UnionFind`. The existing clusters
+        that end up connected are linked under the one with the highest rank
+        and the new identifiers are bulk inserted.
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        clusters = UnionFind()
+        roots = EquivalentCluster.root_map()
+        ranks = dict(
+            db.session.query(EquivalentCluster.eqid, EquivalentCluster.rank).
+            filter(EquivalentCluster.parent_eqid.is_(None))
+        )
+
+        # Existing entries get the first indexes of the union-find.
+        root_indexes, missing = {}, []
+        existing = db.session.query(cls.type_id, cls.value, cls.eqid). \
+            yield_per(chunk_size)
+        for type_id, value, eqid in existing:
+            index = clusters.add((type_id, value))
+            root = roots.get(eqid)
+            if root is None:
+                # Identifier recorded before its cluster.
+                root = roots[eqid] = eqid
+                ranks[eqid] = 0
+                missing.append({'eqid': eqid, 'rank': 0})
+            if root in root_indexes:
+                clusters.union(clusters.keys[root_indexes[root]],
+                               clusters.keys[index])
+            else:
+                root_indexes[root] = index
+        existing_count = len(clusters)
+        for start in range(0, len(missing), chunk_size):
+            db.session.bulk_insert_mappings(
+                EquivalentCluster, missing[start:start + chunk_size]
+            )
+
+        count = 0
+        for subject_id, subject_value, object_id, object_value in \
+                cls.equivalence_claims().yield_per(chunk_size):
+            clusters.union((subject_id, subject_value),
+                           (object_id, object_value))
+            count += 1
+            if progress and count % chunk_size == 0:
+                progress(chunk_size)
+        if progress:
+            progress(count % chunk_size)
+
+        # Link the existing clusters under the one with the highest rank.
+        cluster_eqids = {}
+        for root, index in root_indexes.items():
+            component = clusters.root(index)
+            best = cluster_eqids.get(component)
+            if best is None or ranks[root] > ranks[best]:
+                cluster_eqids[component] = root
+        parents, new_ranks = [], []
+        for root, index in root_indexes.items():
+            best = cluster_eqids[clusters.root(index)]
+            if best != root:
+                parents.append((root, best))
+                if ranks[root] == ranks[best]:
+                    ranks[best] += 1
+                    new_ranks.append({'eqid': best, 'rank': ranks[best]})
+        for start in range(0, len(parents), chunk_size):
+            EquivalentCluster.set_parents(
+                dict(parents[start:start + chunk_size])
             )
-            db.session.add(object_eqid)
-        elif subject_eqid and object_eqid and \
-                subject_eqid.eqid != object_eqid.eqid:
-            cls.query.filter_by(eqid=object_eqid.eqid).update({
-                cls.eqid: subject_eqid.eqid
+            db.session.bulk_insert_mappings(EquivalentEvent, [
+                {'kind': 'merge', 'eqid': best, 'old_eqids': [root, best]}
+                for root, best in parents[start:start + chunk_size]
+            ])
+        db.session.bulk_update_mappings(EquivalentCluster, new_ranks)
+
+        new_clusters, new_eqids = [], []
+        # Identifiers added to every cluster, recorded as events at the end.
+        added = OrderedDict()
+        for index in range(existing_count, len(clusters)):
+            component = clusters.root(index)
+            if component not in cluster_eqids:
+                cluster_eqids[component] = str(uuid4())
+                new_clusters.append({
+                    'eqid': cluster_eqids[component],
+                    'rank': 0
+                })
+                added[cluster_eqids[component]] = ('new', [])
+            eqid = cluster_eqids[component]
+            type_id, value = clusters.keys[index]
+            new_eqids.append({
+                'eqid': eqid,
+                'type_id': type_id,
+                'value': value
             })
-        elif subject_eqid and not object_eqid:
-            object_eqid = cls(
-                eqid=subject_eqid.eqid,
-                type_id=object_id,
-                value=object_value
+            added.setdefault(eqid, ('extend', []))[1].append([type_id, value])
+            if len(new_eqids) >= chunk_size:
+                db.session.bulk_insert_mappings(EquivalentCluster,
+                                                new_clusters)
+                db.session.bulk_insert_mappings(cls, new_eqids)
+                new_clusters, new_eqids = [], []
+        if new_eqids:
+            db.session.bulk_insert_mappings(EquivalentCluster, new_clusters)
+            db.session.bulk_insert_mappings(cls, new_eqids)
+        events = [
+            {'kind': kind, 'eqid': eqid, 'identifiers': keys}
+            for eqid, (kind, keys) in added.items()
+        ]
+        for start in range(0, len(events), chunk_size):
+            db.session.bulk_insert_mappings(
+                EquivalentEvent, events[start:start + chunk_size]
             )
-            db.session.add(object_eqid)
-        elif object_eqid and not subject_eqid:
-            subject_eqid = cls(
-                eqid=object_eqid.eqid,
-                type_id=subject_id,
-                value=subject_value
+
+
+class EquivalentCluster(db.Model):
+
+    """Represents a cluster of equivalent identifiers.
+
+    Clusters form a union-find forest stored in the database: every cluster
+    points to the cluster it has been merged into, and the eqid of the root
+    reached following these pointers is the canonical eqid of all the
+    identifiers of the tree. Linking two clusters only writes the root of
+    one of them (and possibly the rank of the other), whatever the number of
+    identifiers involved.
+
+    Roots are merged by rank so that trees stay shallow. The paths are
+    compressed offline with :meth:`compact` (`claimstore eqid compact`).
+
+    Identifiers whose eqid has no row in this table, e.g. recorded before the
+    table existed, are considered to be roots. Their rows are created by
+    :meth:`backfill` when the index is rebuilt or compacted.
+    """
+
+    eqid = db.Column(
+        UUID,
+        primary_key=True
+    )
+    """Eqid of the cluster."""
+
+    parent_eqid = db.Column(
+        UUID,
+        db.ForeignKey('equivalent_cluster.eqid'),
+        index=True
+    )
+    """Eqid of the cluster it has been merged into (`None` for roots)."""
+
+    rank = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    """Upper bound of the height of the tree (only maintained on roots)."""
+
+    created = db.Column(
+        UTCDateTime,
+        default=now_utc,
+        nullable=False
+    )
+    """Datetime in which the cluster has been created."""
+
+    linked = db.Column(
+        UTCDateTime
+    )
+    """Datetime in which the cluster has been merged into another one."""
+
+    @classmethod
+    def _tree(cls):
+        """Return a recursive CTE with the root of every cluster."""
+        tree = db.session.query(
+            cls.eqid.label('eqid'),
+            cls.eqid.label('root')
+        ).filter(cls.parent_eqid.is_(None)).cte('tree', recursive=True)
+        return tree.union_all(
+            db.session.query(cls.eqid, tree.c.root).filter(
+                cls.parent_eqid == tree.c.eqid
             )
-            db.session.add(subject_eqid)
+        )
+
+    @classmethod
+    def roots(cls, eqids):
+        """Return the canonical eqids of some eqids.
+
+        :param eqids: iterable of eqids.
+        :returns: a dictionary eqid -> canonical eqid.
+        :rtype: dict.
+        """
+        eqids = set(eqids)
+        chain = db.session.query(
+            cls.eqid.label('start'),
+            cls.eqid.label('eqid'),
+            cls.parent_eqid.label('parent_eqid')
+        ).filter(cls.eqid.in_(list(eqids))).cte('chain', recursive=True)
+        chain = chain.union_all(
+            db.session.query(chain.c.start, cls.eqid, cls.parent_eqid).
+            filter(cls.eqid == chain.c.parent_eqid)
+        )
+        output = {eqid: eqid for eqid in eqids}
+        output.update(
+            db.session.query(chain.c.start, chain.c.eqid).
+            filter(chain.c.parent_eqid.is_(None))
+        )
+        return output
+
+    @classmethod
+    def root(cls, eqid):
+        """Return the canonical eqid of an eqid."""
+        return cls.roots([eqid])[eqid]
+
+    @classmethod
+    def root_map(cls):
+        """Return a dictionary eqid -> canonical eqid of all the clusters."""
+        tree = cls._tree()
+        return dict(db.session.query(tree.c.eqid, tree.c.root))
+
+    @classmethod
+    def root_expression(cls, eqid):
+        """Return a SQL expression of the canonical eqid of an eqid.
+
+        It is the SQL counterpart of :meth:`root`, so that the canonical eqid
+        can be resolved within a bigger statement.
+
+        :param eqid: SQL expression of an eqid.
+        """
+        chain = db.session.query(
+            cls.eqid.label('eqid'),
+            cls.parent_eqid.label('parent_eqid')
+        ).filter(cls.eqid == eqid).cte('chain', recursive=True)
+        chain = chain.union_all(
+            db.session.query(cls.eqid, cls.parent_eqid).
+            filter(cls.eqid == chain.c.parent_eqid)
+        )
+        return func.coalesce(
+            db.session.query(chain.c.eqid).
+            filter(chain.c.parent_eqid.is_(None)).as_scalar(),
+            eqid
+        )
+
+    @classmethod
+    def members(cls, root):
+        """Return a query of the eqids of all the clusters of a tree.
+
+        :param root: canonical eqid of the tree, either a value or a SQL
+                     expression.
+        """
+        if not isinstance(root, ClauseElement):
+            root = cast(literal(root), UUID)
+        tree = db.session.query(root.label('eqid')).cte('members',
+                                                        recursive=True)
+        tree = tree.union_all(
+            db.session.query(cls.eqid).filter(cls.parent_eqid == tree.c.eqid)
+        )
+        return db.session.query(tree.c.eqid)
+
+    @classmethod
+    def trees(cls, roots):
+        """Return a recursive CTE with the eqids of many trees.
+
+        :param roots: iterable of canonical eqids.
+        :returns: a CTE with the columns `root` and `eqid`.
+        """
+        seed = db.session.query(
+            func.unnest(
+                cast(array(list(roots)), ARRAY(UUID)), type_=UUID
+            ).label('root')
+        ).subquery()
+        tree = db.session.query(
+            seed.c.root.label('root'),
+            seed.c.root.label('eqid')
+        ).cte('trees', recursive=True)
+        return tree.union_all(
+            db.session.query(tree.c.root, cls.eqid).filter(
+                cls.parent_eqid == tree.c.eqid
+            )
+        )
+
+    @classmethod
+    def sizes(cls, roots):
+        """Return the number of identifiers of many clusters.
+
+        :param roots: iterable of canonical eqids.
+        :rtype: dict.
+        """
+        trees = cls.trees(roots)
+        return dict(
+            db.session.query(trees.c.root,
+                             func.count(EquivalentIdentifier.id)).
+            filter(EquivalentIdentifier.eqid == trees.c.eqid).
+            group_by(trees.c.root)
+        )
+
+    @classmethod
+    def page(cls, after=None, limit=20, min_size=None):
+        """Return the canonical eqids of a page of clusters.
+
+        Roots are sorted by eqid and read from the index of the clusters, so
+        identifiers whose eqid has no cluster row are only listed once
+        :meth:`backfill` has created it. If `min_size` is given, roots are
+        fetched in batches of `limit` and the clusters with fewer identifiers
+        are skipped, so a restrictive `min_size` may scan many clusters.
+
+        :param after: only eqids greater than this one are returned.
+        :param limit: maximum number of roots.
+        :param min_size: minimum number of identifiers of the clusters.
+        :returns: list of rows with an `eqid` attribute.
+        :rtype: list.
+        """
+        query = db.session.query(cls.eqid).filter(
+            cls.parent_eqid.is_(None)
+        ).order_by(cls.eqid)
+        output = []
+        while len(output) < limit:
+            batch = query
+            if after is not None:
+                batch = batch.filter(cls.eqid > after)
+            batch = batch.limit(limit).all()
+            if not batch:
+                break
+            if min_size:
+                sizes = cls.sizes(row.eqid for row in batch)
+                output.extend(row for row in batch
+                              if sizes.get(row.eqid, 0) >= min_size)
+            else:
+                output.extend(batch)
+            after = batch[-1].eqid
+        return output[:limit]
+
+    @staticmethod
+    def lock_key(eqid):
+        """Return the key of the advisory lock of an eqid.
+
+        :returns: the first 64 bits of the UUID as a signed integer.
+        :rtype: int
+        """
+        key = int(str(eqid).replace('-', '')[:16], 16)
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    @classmethod
+    def lock(cls, eqids):
+        """Lock some clusters until the end of the transaction.
+
+        PostgreSQL transaction-level advisory locks are used instead of row
+        locks, since the row of a cluster may not exist yet. They are taken
+        in the order of their keys, so that two transactions locking the
+        same clusters cannot deadlock.
+
+        :param eqids: iterable of eqids.
+        """
+        for key in sorted(set(cls.lock_key(eqid) for eqid in eqids)):
+            db.session.execute(select([func.pg_advisory_xact_lock(key)]))
+
+    @classmethod
+    def link(cls, eqid1, eqid2, claim_id=None):
+        """Merge the clusters of two eqids.
+
+        The two roots are locked with :meth:`lock`, so that concurrent
+        merges of the same clusters are serialised, and the root with the
+        lowest rank is linked to the other one. The merge is recorded in the
+        :class:`EquivalentEvent` log along with `claim_id`.
+
+        :returns: the canonical eqid of the merged cluster.
+        """
+        while True:
+            roots = cls.roots([eqid1, eqid2])
+            root1, root2 = roots[eqid1], roots[eqid2]
+            if root1 == root2:
+                return root1
+            cls.lock([root1, root2])
+            locked = {
+                cluster.eqid: cluster
+                for cluster in cls.query.filter(
+                    cls.eqid.in_([root1, root2])
+                ).populate_existing()
+            }
+            # Retry if one of them has been linked in the meantime.
+            if all(cluster.parent_eqid is None
+                   for cluster in locked.values()):
+                break
+        for root in (root1, root2):
+            if root not in locked:
+                locked[root] = cls(eqid=root, rank=0)
+                db.session.add(locked[root])
+        parent, child = locked[root1], locked[root2]
+        if parent.rank < child.rank:
+            parent, child = child, parent
+        child.parent_eqid = parent.eqid
+        child.linked = now_utc()
+        EquivalentEvent.record('merge', parent.eqid, claim_id=claim_id,
+                               old_eqids=[root1, root2])
+        counters.incr('eqid.merge')
+        counters.incr('eqid.rows_rewritten')
+        if parent.rank == child.rank:
+            parent.rank += 1
+            counters.incr('eqid.rows_rewritten')
         db.session.flush()
-        return subject_eqid, object_eqid
+        return parent.eqid
 
     @classmethod
-    def clear(cls):
-        """Delete all the entries of the table equivalent_identifiers."""
-        cls.query.delete()
-        db.session.commit()
+    def set_parents(cls, parents):
+        """Link many clusters with a single UPDATE statement.
+
+        :param parents: dictionary of eqid -> parent eqid.
+        :type parents: dict.
+        """
+        cls.query.filter(cls.eqid.in_(list(parents))).update(
+            {cls.parent_eqid: cast(case(parents, value=cls.eqid), UUID),
+             cls.linked: now_utc()},
+            synchronize_session=False
+        )
 
     @classmethod
-    def rebuild(cls):
-        """Rebuild index based on claims."""
-        for claim in Claim.query.all():
-            if claim.predicate.name in \
-               current_app.config['CFG_EQUIVALENT_PREDICATES']:
-                cls.set_equivalent_id(
-                    claim.subject_type_id,
-                    claim.subject_value,
-                    claim.object_type_id,
-                    claim.object_value
-                )
+    def backfill(cls):
+        """Create the missing clusters of the identifiers.
+
+        Identifiers recorded before this table existed have no cluster row,
+        so they are missing from :meth:`page`. A root cluster is inserted
+        for each of their eqids with a single INSERT statement.
+
+        :returns: the number of created clusters.
+        :rtype: int
+        """
+        missing = db.session.query(EquivalentIdentifier.eqid).outerjoin(
+            cls, cls.eqid == EquivalentIdentifier.eqid
+        ).filter(cls.eqid.is_(None)).distinct()
+        result = db.session.execute(
+            insert(cls.__table__).from_select(
+                ['eqid', 'rank', 'created'],
+                missing.add_columns(literal(0),
+                                    literal(now_utc(), UTCDateTime)).statement
+            ).on_conflict_do_nothing(index_elements=[cls.eqid])
+        )
+        return result.rowcount
+
+    @classmethod
+    def compact(cls):
+        """Compress the paths of all the trees.
+
+        The missing clusters are created first with :meth:`backfill`. Every
+        cluster is then linked directly to its root with a single UPDATE
+        statement.
+
+        :returns: the number of updated clusters.
+        :rtype: int
+        """
+        cls.backfill()
+        tree = cls._tree()
+        result = db.session.execute(
+            cls.__table__.update().where(
+                and_(cls.eqid == tree.c.eqid, cls.parent_eqid != tree.c.root)
+            ).values(parent_eqid=tree.c.root)
+        )
+        EquivalentIndexState.bump()
         db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def _sizes(cls):
+        """Return a subquery with the root and size of every cluster."""
+        tree = cls._tree()
+        root = func.coalesce(tree.c.root, EquivalentIdentifier.eqid)
+        return db.session.query(
+            root.label('root'),
+            func.count(EquivalentIdentifier.id).label('size')
+        ).select_from(EquivalentIdentifier).outerjoin(
+            tree, tree.c.eqid == EquivalentIdentifier.eqid
+        ).group_by(root).subquery('sizes')
+
+    @classmethod
+    def statistics(cls, top=10, days=30):
+        """Return statistics about the clusters of the index.
+
+        Sizes are grouped in a histogram of powers of two, and clusters with
+        at least `CFG_EQUIVALENT_HOT_CLUSTER_SIZE` identifiers are counted as
+        hot clusters. The history counts the clusters created and merged per
+        day; a rebuild of the index shows up as a spike on the day it ran.
+        The counters are the ones of the current process. The status of the
+        :class:`EquivalentQueue` reports how far behind the claims the index
+        is.
+
+        :param top: number of largest clusters to return.
+        :param days: number of days of history to return.
+        :rtype: dict
+        """
+        sizes = cls._sizes()
+        hot_size = current_app.config['CFG_EQUIVALENT_HOT_CLUSTER_SIZE']
+        buckets = OrderedDict()
+        clusters = identifiers = hot = 0
+        for size, count in db.session.query(
+                sizes.c.size, func.count()).group_by(
+                    sizes.c.size).order_by(sizes.c.size):
+            low = 1 << (size.bit_length() - 1)
+            buckets[low] = buckets.get(low, 0) + count
+            clusters += count
+            identifiers += size * count
+            if size >= hot_size:
+                hot += count
+        largest = db.session.query(sizes.c.root, sizes.c.size).order_by(
+            sizes.c.size.desc(), sizes.c.root
+        ).limit(top)
+
+        since = (now_utc() - timedelta(days=days - 1)).date()
+        history = {}
+        for column, key in ((cls.created, 'created'),
+                            (cls.linked, 'merged')):
+            day = cast(column, Date)
+            for date, count in db.session.query(day, func.count()).filter(
+                    day >= since).group_by(day):
+                history.setdefault(date, {'created': 0, 'merged': 0})
+                history[date][key] = count
+
+        return {
+            'clusters': clusters,
+            'identifiers': identifiers,
+            'hot_clusters': hot,
+            'histogram': [
+                {'min': low, 'max': 2 * low - 1, 'clusters': count}
+                for low, count in buckets.items()
+            ],
+            'largest': [
+                {'eqid': root, 'size': size} for root, size in largest
+            ],
+            'history': [
+                dict(history[date], date=date.isoformat())
+                for date in sorted(history)
+            ],
+            'queue': EquivalentQueue.status(),
+            'counters': counters.snapshot('eqid.'),
+        }
+
+
+class EquivalentIndexState(db.Model):
+
+    """Represents the progress of the equivalent identifier index.
+
+    A single row records the watermark of the last complete reindex, i.e. the
+    highest processed claim id and the equivalence predicates at that time,
+    so that later reindexes only process new claims and claims using new
+    equivalence predicates. While an incremental reindex is running, it also
+    records its last checkpoint.
+    """
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    """Unique id of the state (there is only one)."""
+
+    claim_id = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    """Highest claim id processed by the last complete reindex."""
+
+    predicates = db.Column(
+        JSONB,
+        nullable=False,
+        default=list
+    )
+    """Equivalence predicates used by the last complete reindex."""
+
+    resume_claim_id = db.Column(db.Integer)
+    """Last claim id processed by an unfinished incremental reindex."""
+
+    resume_predicates = db.Column(JSONB)
+    """Equivalence predicates used by an unfinished incremental reindex."""
+
+    updated = db.Column(
+        UTCDateTime,
+        default=now_utc,
+        onupdate=now_utc,
+        nullable=False
+    )
+    """Datetime of the last update of the state."""
+
+    generation = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    """Number of rewrites of the index, see :meth:`bump`."""
+
+    @classmethod
+    def get(cls):
+        """Return the state, creating it if it does not exist yet."""
+        state = cls.query.get(1)
+        if state is None:
+            state = cls(id=1, claim_id=0, predicates=[], generation=0)
+            db.session.add(state)
+        return state
+
+    @classmethod
+    def bump(cls):
+        """Record that the index has been rewritten.
+
+        Replays, relinks and compactions change what the claims resolve to
+        without adding claims or events, so they increment the generation,
+        which is part of :meth:`Claim.version`.
+        """
+        state = cls.get()
+        state.generation = (state.generation or 0) + 1
+
+    @staticmethod
+    def target_predicates():
+        """Return the sorted names of the current equivalence predicates."""
+        return sorted(current_app.config['CFG_EQUIVALENT_PREDICATES'])
+
+    def new_predicates(self):
+        """Return the equivalence predicates added since the watermark."""
+        return sorted(set(self.target_predicates()) - set(self.predicates))
+
+    def removed_predicates(self):
+        """Return the equivalence predicates removed since the watermark."""
+        return sorted(set(self.predicates) - set(self.target_predicates()))
+
+    def checkpoint(self, claim_id):
+        """Record the progress of an incremental reindex."""
+        self.resume_claim_id = claim_id
+        self.resume_predicates = self.target_predicates()
+
+    def complete(self, claim_id):
+        """Move the watermark after a complete reindex."""
+        self.claim_id = max(self.claim_id or 0, claim_id)
+        self.predicates = self.target_predicates()
+        self.resume_claim_id = None
+        self.resume_predicates = None
+
+
+class EquivalentQueue(db.Model):
+
+    """Represents the claims whose equivalent identifiers are pending.
+
+    When `CFG_EQUIVALENT_ASYNC` is enabled, claims using an equivalence
+    predicate are recorded without their eqids and an entry of this queue is
+    written in the same transaction. The entries are processed in batches by
+    `claimstore eqid worker` with :meth:`process`, so that the index is
+    eventually consistent with the claims.
+    """
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    """Unique id of the entry, i.e. its position in the queue."""
+
+    claim_id = db.Column(
+        db.Integer,
+        db.ForeignKey('claim.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    """Id of the claim to be indexed."""
+
+    enqueued = db.Column(
+        UTCDateTime,
+        default=now_utc,
+        nullable=False
+    )
+    """Datetime in which the claim has been queued."""
+
+    claim = db.relationship(Claim)
+    """Claim to be indexed."""
+
+    @classmethod
+    def process(cls, limit):
+        """Index the claims of the oldest entries of the queue.
+
+        Entries are locked with `SELECT ... FOR UPDATE SKIP LOCKED`, so that
+        many workers can drain the queue concurrently without processing the
+        same claims. The equivalent identifiers of the claims are stored with
+        :meth:`EquivalentIdentifier.set_equivalent_ids`, the eqids of the
+        claims are backfilled and the entries are deleted. The caller must
+        commit the transaction.
+
+        :param limit: maximum number of entries to process.
+        :returns: the number of processed entries.
+        :rtype: int
+        """
+        entries = db.session.query(
+            cls.id,
+            Claim.id,
+            Claim.subject_type_id,
+            Claim.subject_value,
+            Claim.object_type_id,
+            Claim.object_value
+        ).join(Claim, cls.claim_id == Claim.id).order_by(cls.id).limit(
+            limit
+        ).with_for_update(skip_locked=True, of=cls).all()
+        if not entries:
+            return 0
+        eqids = EquivalentIdentifier.set_equivalent_ids(
+            [entry[2:] for entry in entries],
+            [entry[1] for entry in entries]
+        )
+        db.session.bulk_update_mappings(Claim, [
+            {'id': entry[1], 'subject_eqid': subject_eqid.id,
+             'object_eqid': object_eqid.id}
+            for entry, (subject_eqid, object_eqid) in zip(entries, eqids)
+        ])
+        cls.query.filter(cls.id.in_([entry[0] for entry in entries])).delete(
+            synchronize_session=False
+        )
+        counters.incr('eqid.queue.processed', len(entries))
+        return len(entries)
+
+    @classmethod
+    def status(cls):
+        """Return the size of the queue and its lag.
+
+        :returns: a dictionary with the number of `pending` entries and the
+                  `lag`, i.e. the age in seconds of the oldest entry.
+        :rtype: dict
+        """
+        pending, oldest = db.session.query(
+            func.count(cls.id), func.min(cls.enqueued)
+        ).one()
+        lag = 0.0
+        if oldest is not None:
+            lag = max((now_utc() - oldest).total_seconds(), 0.0)
+        return {'pending': pending, 'lag': lag}
+
+
+class EquivalentEvent(db.Model):
+
+    """Represents a change of the equivalent identifier index.
+
+    The creation and extension of clusters with new identifiers and the
+    merges of clusters are appended to this log in the same transaction as
+    the change itself. Replaying the log with :meth:`clusters` gives the
+    clusters at any point in time, and the index can be rebuilt from it with
+    :meth:`EquivalentIdentifier.replay` without scanning the claims.
+
+    The log starts with the first change recorded after the table was
+    created: an index built before that must be dropped and rebuilt to be
+    fully recorded.
+    """
+
+    __table_args__ = (
+        db.Index('ix_equivalent_event_old_eqids', 'old_eqids',
+                 postgresql_using='gin'),
+        db.Index('ix_equivalent_event_identifiers', 'identifiers',
+                 postgresql_using='gin'),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    """Unique id of the event, i.e. its position in the log."""
+
+    recorded = db.Column(
+        UTCDateTime,
+        default=now_utc,
+        nullable=False,
+        index=True
+    )
+    """Datetime in which the event has been recorded."""
+
+    claim_id = db.Column(
+        db.Integer,
+        db.ForeignKey('claim.id', ondelete='SET NULL', deferrable=True,
+                      initially='DEFERRED')
+    )
+    """Id of the claim that caused the change, if any.
+
+    The constraint is checked at commit time, since the event is recorded
+    before the claim is inserted.
+    """
+
+    kind = db.Column(
+        db.String,
+        nullable=False
+    )
+    """Kind of change: `new`, `extend` or `merge`."""
+
+    eqid = db.Column(
+        UUID,
+        nullable=False,
+        index=True
+    )
+    """Eqid of the cluster that has been created, extended or merged into."""
+
+    old_eqids = db.Column(JSONB)
+    """Canonical eqids of the two clusters before a merge."""
+
+    identifiers = db.Column(JSONB)
+    """List of [type_id, value] added to the cluster."""
+
+    @classmethod
+    def record(cls, kind, eqid, claim_id=None, old_eqids=None,
+               identifiers=None):
+        """Append an event to the log.
+
+        Creations and extensions that did not add any identifier, e.g. lost
+        to a concurrent transaction, are not recorded.
+        """
+        if kind != 'merge' and not identifiers:
+            return
+        db.session.add(cls(
+            kind=kind,
+            eqid=eqid,
+            claim_id=claim_id,
+            old_eqids=old_eqids,
+            identifiers=[list(key) for key in identifiers or ()] or None
+        ))
+
+    @classmethod
+    def clusters(cls, until=None, progress=None, times=None):
+        """Replay the log in memory.
+
+        Merges are replayed in the direction in which they were recorded, so
+        the canonical eqids are the same as in the index.
+
+        :param until: only replay the events recorded until this datetime.
+        :param progress: optional callable receiving the number of events
+                         replayed since its previous call.
+        :param times: optional dictionary filled with eqid -> [created,
+                      linked], the datetimes of the first event of the
+                      eqid and of the merge into another cluster (`None` for
+                      roots).
+        :returns: a tuple with a dictionary eqid -> canonical eqid and a
+                  dictionary (type_id, value) -> eqid.
+        :rtype: tuple
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        query = cls._events(until)
+        return cls._replay(query.yield_per(chunk_size), progress, times)
+
+    @classmethod
+    def _events(cls, until=None):
+        """Return the query of the events recorded until a datetime."""
+        query = db.session.query(
+            cls.eqid, cls.old_eqids, cls.identifiers, cls.recorded
+        ).order_by(cls.id)
+        if until is not None:
+            query = query.filter(cls.recorded <= until)
+        return query
+
+    @staticmethod
+    def _replay(events, progress=None, times=None):
+        """Replay a sequence of (eqid, old_eqids, identifiers, recorded).
+
+        See :meth:`clusters`.
+        """
+        chunk_size = current_app.config['CFG_EQUIVALENT_REBUILD_CHUNK_SIZE']
+        parents, identifiers = {}, {}
+        if times is None:
+            times = {}
+
+        def find(eqid, recorded):
+            if eqid not in parents:
+                parents[eqid] = eqid
+                times[eqid] = [recorded, None]
+            while parents[eqid] != eqid:
+                parents[eqid] = parents[parents[eqid]]
+                eqid = parents[eqid]
+            return eqid
+
+        count = 0
+        for eqid, old_eqids, keys, recorded in events:
+            root = find(eqid, recorded)
+            for old_eqid in old_eqids or ():
+                old_root = find(old_eqid, recorded)
+                if old_root != root:
+                    parents[old_root] = root
+                    times[old_root][1] = recorded
+            for type_id, value in keys or ():
+                identifiers.setdefault((type_id, value), eqid)
+            count += 1
+            if progress and count % chunk_size == 0:
+                progress(chunk_size)
+        if progress:
+            progress(count % chunk_size)
+        return (dict((eqid, find(eqid, None)) for eqid in list(parents)),
+                identifiers)
+
+    @classmethod
+    def cluster_at(cls, type_id, value, until=None):
+        """Return the cluster of an identifier at some point in time.
+
+        Only the events of the cluster are read: the event that added the
+        identifier, the merges that connect its eqid to other eqids, found
+        one step at a time, and the events that added identifiers to any of
+        these eqids. They are then replayed as in :meth:`clusters`. Each
+        identifier is recorded once, when it is inserted.
+
+        :param until: datetime of the cluster (now by default).
+        :returns: a tuple (canonical eqid, sorted list of tuples (type_id,
+                  value)), or `None` if the identifier was unknown.
+        :rtype: tuple
+        """
+        query = cls._events(until)
+        first = query.filter(
+            cls.identifiers.contains([[type_id, value]])
+        ).first()
+        if first is None:
+            return None
+        eqids, new, merges = set(), {first.eqid}, {}
+        while new:
+            eqids |= new
+            for row in query.add_columns(cls.id).filter(
+                    cls.kind == 'merge',
+                    or_(cls.eqid.in_(new),
+                        cls.old_eqids.has_any(array(list(new))))):
+                merges[row.id] = row[:4]
+            new = set()
+            for eqid, old_eqids, keys, recorded in merges.values():
+                new.add(eqid)
+                new.update(old_eqids)
+            new -= eqids
+        events = dict(merges)
+        for row in query.add_columns(cls.id).filter(
+                cls.kind != 'merge', cls.eqid.in_(eqids)):
+            events[row.id] = row[:4]
+        roots, identifiers = cls._replay(
+            events[id_] for id_ in sorted(events)
+        )
+        root = roots[first.eqid]
+        return root, sorted(
+            key for key, key_eqid in identifiers.items()
+            if roots[key_eqid] == root
+        )
+
+    @classmethod
+    def truncate(cls, until):
+        """Delete the events recorded after a datetime.
+
+        The watermark of the index is reset as well, so that the next
+        incremental reindex processes all the claims. The index itself is
+        not changed: it has to be rebuilt with
+        :meth:`EquivalentIdentifier.replay` to match the truncated log.
+
+        :param until: datetime of the last event to keep.
+        :returns: the number of deleted events.
+        :rtype: int
+        """
+        count = cls.query.filter(
+            cls.recorded > until
+        ).delete(synchronize_session=False)
+        EquivalentIndexState.query.delete()
+        return count
+
+
+class ReferenceCache(object):
+
+    """In-process name <-> id cache of a small reference table.
+
+    Claimants, identifier types and predicates are looked up by name on every
+    request, but these tables only contain a few dozens of rows that almost
+    never change. The whole table is loaded on first use and kept for
+    `CFG_REFERENCE_CACHE_TTL` seconds, so that rows added by other processes
+    are eventually seen. Names that are not found are remembered in a bounded
+    negative cache of `CFG_REFERENCE_CACHE_NEGATIVE_SIZE` entries.
+
+    The cache must be invalidated with :meth:`invalidate` (or
+    :func:`invalidate_reference_caches`) whenever rows are added to the table.
+    """
+
+    def __init__(self, model):
+        """Initialise the cache.
+
+        :param model: model with `id` and `name` columns.
+        """
+        self.model = model
+        self._lock = threading.Lock()
+        self._ids = None
+        self._names = None
+        self._missing = OrderedDict()
+        self._expires = 0
+
+    def invalidate(self):
+        """Forget all the cached entries."""
+        with self._lock:
+            self._ids = None
+            self._names = None
+            self._missing.clear()
+
+    def get_id(self, name):
+        """Return the id of the row with the given name.
+
+        :param name: unique name of the row.
+        :type name: str.
+        :returns: the id of the row or None if it does not exist.
+        :rtype: int.
+        """
+        ids, names = self._load()
+        if name in ids:
+            return ids[name]
+        with self._lock:
+            if name in self._missing:
+                self._missing.move_to_end(name)
+                return None
+        row = db.session.query(self.model.id).filter(
+            self.model.name == name
+        ).first()
+        with self._lock:
+            if row:
+                ids[name] = row.id
+                names[row.id] = name
+                return row.id
+            self._missing[name] = True
+            while len(self._missing) > \
+                    current_app.config['CFG_REFERENCE_CACHE_NEGATIVE_SIZE']:
+                self._missing.popitem(last=False)
+        return None
+
+    def get_name(self, id_):
+        """Return the name of the row with the given id.
+
+        :param id_: id of the row.
+        :type id_: int.
+        :returns: the name of the row or None if it does not exist.
+        :rtype: str.
+        """
+        ids, names = self._load()
+        if id_ not in names:
+            row = db.session.query(self.model.name).filter(
+                self.model.id == id_
+            ).first()
+            if not row:
+                return None
+            with self._lock:
+                ids[row.name] = id_
+                names[id_] = row.name
+        return names[id_]
+
+    def _load(self):
+        """Load the whole table if it is not cached or it has expired."""
+        ids, names = self._ids, self._names
+        if ids is not None and time.time() < self._expires:
+            return ids, names
+        rows = db.session.query(self.model.name, self.model.id).all()
+        with self._lock:
+            self._ids = ids = dict(rows)
+            self._names = names = {id_: name for name, id_ in rows}
+            self._missing.clear()
+            self._expires = time.time() + \
+                current_app.config['CFG_REFERENCE_CACHE_TTL']
+        return ids, names
+
+
+claimant_cache = ReferenceCache(Claimant)
+"""Cache of claimant names."""
+
+identifier_type_cache = ReferenceCache(IdentifierType)
+"""Cache of identifier type names."""
+
+predicate_cache = ReferenceCache(Predicate)
+"""Cache of predicate names."""
+
+
+def invalidate_reference_caches():
+    """Invalidate the caches of claimants, identifier types and predicates."""
+    for cache in (claimant_cache, identifier_type_cache, predicate_cache):
+        cache.invalidate()
@@ -20,25 +20,38 @@
 
 """Restful resources for the claims module."""
 
+import hashlib
 import json
-from collections import defaultdict
+import time
+from collections import OrderedDict
 from functools import wraps
 from ipaddress import ip_address, ip_network
+from urllib.parse import urlencode
+from uuid import uuid4
 
 import isodate  # noqa
-from flask import Blueprint, current_app, make_response, request
-from flask_restful import Api, Resource, abort, inputs
+from flask import Blueprint, Response, current_app, make_response, \
+    request, stream_with_context
+from flask_restful import Api, Resource, abort, inputs, reqparse
 from jsonschema import ValidationError
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, bindparam, or_, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext import baked
 
 from claimstore.app import db
+from claimstore.core.cache import make_cache
 from claimstore.core.datetime import loc_date_utc
+from claimstore.core.db.query import estimate_count, is_like_pattern, \
+    like_or_equal
+from claimstore.core.db.transaction import run_in_transaction
 from claimstore.core.exception import InvalidJSONData, InvalidRequest, \
     RestApiException
-from claimstore.core.json import validate_json
+from claimstore.core.json import dumps, get_encoder, validate_json
+from claimstore.core.metrics import counters
 from claimstore.core.pagination import RestfulSQLAlchemyPaginationMixIn
-from claimstore.models import Claim, Claimant, EquivalentIdentifier, \
-    IdentifierType, Predicate
+from claimstore.models import Claim, Claimant, EquivalentCluster, \
+    EquivalentIdentifier, EquivalentQueue, IdentifierType, Predicate, \
+    claimant_cache, identifier_type_cache, predicate_cache
 
 blueprint = Blueprint(
     'claims_restful',
@@ -47,6 +60,24 @@ blueprint = Blueprint(
 
 claims_api = Api(blueprint)
 
+claims_bakery = baked.bakery()
+"""Cache of the compiled queries of the claim listings.
+
+The cache is keyed by the steps of the queries (i.e. by the filters present
+in the requests), so it holds a few dozens of entries in practice.
+"""
+
+
+def compile_claims_query(session):
+    """Start a baked query of claims.
+
+    It is only called when a query is not cached yet, so the metrics
+    `claims.query.compiled` and `claims.query.executed` give the hit rate of
+    :data:`claims_bakery`.
+    """
+    counters.incr('claims.query.compiled')
+    return session.query(Claim)
+
 
 def error_handler(f):
     """Decorator to handle restful exceptions.
@@ -95,6 +126,251 @@ def check_ip(f):
 restful_decorators = [error_handler, check_ip]
 
 
+def parse_created_datetime(json_data):
+    """Parse the creation datetime of a claim.
+
+    :param json_data: claim already validated against its JSON schema.
+    :type json_data: dict.
+    :returns: the creation datetime of the claim.
+    :rtype: datetime.
+    :raises: :exc:`InvalidJSONData` if the datetime is not ISO 8601 UTC.
+    """
+    try:
+        if not json_data['created'].endswith('Z'):
+            raise InvalidJSONData('Claim\'s `creation datetime` must have '
+                                  'timezone information and must be UTC')
+        return isodate.parse_datetime(json_data['created'])
+    except isodate.ISO8601Error as e:
+        raise InvalidJSONData(
+            'Claim\'s `creation datetime` does not follow ISO 8601 Z',
+            extra=str(e)
+        )
+
+
+def resolve_claim_names(json_data):
+    """Return the ids of the claimant, identifier types and predicate.
+
+    Names are resolved through the in-process reference caches.
+
+    :param json_data: claim already validated against its JSON schema.
+    :type json_data: dict.
+    :returns: a tuple (claimant_id, subject_type_id, predicate_id,
+              object_type_id).
+    :rtype: tuple.
+    :raises: :exc:`InvalidRequest` if any of the names is not registered.
+    """
+    claimant_id = claimant_cache.get_id(json_data['claimant'])
+    if not claimant_id:
+        raise InvalidRequest('Claimant not registered')
+    subject_type_id = identifier_type_cache.get_id(
+        json_data['subject']['type']
+    )
+    if not subject_type_id:
+        raise InvalidRequest('Subject Type not registered')
+    object_type_id = identifier_type_cache.get_id(json_data['object']['type'])
+    if not object_type_id:
+        raise InvalidRequest('Object Type not registered')
+    if subject_type_id == object_type_id:
+        raise InvalidRequest('Subject and Object cannot have the same '
+                             'identifier type')
+    predicate_id = predicate_cache.get_id(json_data['predicate'])
+    if not predicate_id:
+        raise InvalidRequest('Predicate not registered')
+    return claimant_id, subject_type_id, predicate_id, object_type_id
+
+
+def build_claim(json_data, created_dt, claimant_id, subject_type_id,
+                predicate_id, object_type_id, subject_eqid=None,
+                object_eqid=None):
+    """Create a new Claim object from its JSON representation.
+
+    :param json_data: claim already validated against its JSON schema.
+    :type json_data: dict.
+    :param created_dt: creation datetime of the claim.
+    :type created_dt: datetime.
+    :param subject_eqid: EquivalentIdentifier of the subject, if any.
+    :param object_eqid: EquivalentIdentifier of the object, if any.
+    :returns: a new Claim that has not been added to the session yet.
+    :rtype: :class:`claimstore.models.Claim`.
+    """
+    arguments = json_data.get('arguments', {})
+    return Claim(
+        uuid=str(uuid4()),
+        created=created_dt,
+        claimant_id=claimant_id,
+        subject_type_id=subject_type_id,
+        subject_value=json_data['subject']['value'],
+        subject_eqid=subject_eqid.id if subject_eqid else None,
+        predicate_id=predicate_id,
+        object_type_id=object_type_id,
+        object_value=json_data['object']['value'],
+        object_eqid=object_eqid.id if object_eqid else None,
+        certainty=json_data['certainty'],
+        human=arguments.get('human', None),
+        actor=arguments.get('actor', None),
+        role=arguments.get('role', None),
+        claim_details=json_data,
+    )
+
+
+def make_identifiers_output(identifiers):
+    """Return the output of a list of identifiers.
+
+    :param identifiers: list of tuples (type_id, value).
+    :returns: list of dictionaries with the `type` name and the `value`.
+    :rtype: list.
+    """
+    return [
+        {'type': identifier_type_cache.get_name(type_id), 'value': value}
+        for type_id, value in identifiers
+    ]
+
+
+def stream_mimetype(stream):
+    """Return the mimetype of the streamed response, if any.
+
+    Listings are streamed as NDJSON when the client accepts
+    `application/x-ndjson` and as chunked JSON when `stream` is set.
+
+    :param stream: value of the `stream` query argument.
+    :type stream: bool.
+    """
+    best = request.accept_mimetypes.best_match(
+        ['application/json', 'application/x-ndjson']
+    )
+    if best == 'application/x-ndjson':
+        return best
+    if stream:
+        return 'application/json'
+    return None
+
+
+def stream_json(entries, mimetype, chunk_size, brackets='[]'):
+    """Return a response streaming JSON entries as soon as they are encoded.
+
+    :param entries: iterable of JSON encoded entries.
+    :param mimetype: `application/x-ndjson` for one entry per line or
+        `application/json` for entries separated by commas within `brackets`.
+    :type mimetype: str
+    :param chunk_size: number of entries sent together.
+    :type chunk_size: int
+    :param brackets: opening and closing characters of the JSON container.
+    :type brackets: str
+    :rtype: flask.Response
+    """
+    ndjson = mimetype == 'application/x-ndjson'
+
+    def generate():
+        chunk = []
+        first = True
+        if not ndjson:
+            yield brackets[0]
+        for entry in entries:
+            if ndjson:
+                chunk.append(entry + '\n')
+            else:
+                chunk.append(entry if first else ',' + entry)
+                first = False
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+        if not ndjson:
+            yield brackets[1]
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def response_cache():
+    """Return the response cache of the application, if it is enabled.
+
+    :rtype: :class:`claimstore.core.cache.BaseCache`
+    """
+    if 'claimstore.response_cache' not in current_app.extensions:
+        current_app.extensions['claimstore.response_cache'] = \
+            make_cache(current_app.config)
+    return current_app.extensions['claimstore.response_cache']
+
+
+def claims_version():
+    """Return the version of the claims, memoized for a short time.
+
+    :meth:`claimstore.models.Claim.version` is queried at most once every
+    `CFG_CLAIMS_VERSION_TTL` seconds per process, so a change made by another
+    process may go unnoticed for that long. Claims recorded by this process
+    call :func:`invalidate_claims_version`.
+
+    :rtype: tuple
+    """
+    memo = current_app.extensions.get('claimstore.claims_version')
+    now = time.monotonic()
+    if memo is not None and memo[0] > now:
+        return memo[1]
+    version = Claim.version()
+    ttl = current_app.config['CFG_CLAIMS_VERSION_TTL']
+    if ttl:
+        current_app.extensions['claimstore.claims_version'] = \
+            (now + ttl, version)
+    return version
+
+
+def invalidate_claims_version():
+    """Forget the version memoized by :func:`claims_version`."""
+    current_app.extensions.pop('claimstore.claims_version', None)
+
+
+def cached_response(f):
+    """Decorator to answer GET requests with ETags and a response cache.
+
+    Responses are cached under the URL of the request with its arguments
+    sorted, and validated with :func:`claims_version`, which is read before
+    the claims so that an entry is never older than its version. The strong
+    ETag of a response is derived from both: a request whose `If-None-Match`
+    holds it is answered with 304 before any claim is queried. Streamed
+    responses are neither tagged nor cached.
+    """
+    @wraps(f)
+    def inner(self, *args, **kwargs):
+        key = '{} {}?{} {}'.format(
+            request.method,
+            request.base_url,
+            urlencode(sorted(request.args.items(multi=True))),
+            stream_mimetype(False)
+        )
+        version = claims_version()
+        etag = hashlib.sha1(
+            '{} {}'.format(key, version).encode('utf-8')
+        ).hexdigest()
+        if request.if_none_match.contains(etag):
+            counters.incr('claims.cache.not_modified')
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+
+        cache = response_cache()
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None and cached[0] == etag:
+            counters.incr('claims.cache.hit')
+            resp = Response(cached[1], headers=cached[2])
+            resp.set_etag(etag)
+            return resp
+
+        resp = f(self, *args, **kwargs)
+        if not isinstance(resp, Response):
+            resp = claims_api.make_response(resp, 200)
+        if resp.status_code != 200 or resp.is_streamed:
+            return resp
+        counters.incr('claims.cache.miss')
+        resp.set_etag(etag)
+        if cache is not None:
+            headers = [(name, value) for name, value in resp.headers
+                       if name in ('Content-Type', 'Link')]
+            cache.set(key, (etag, resp.get_data(), headers))
+        return resp
+    return inner
+
+
 class ClaimStoreResource(Resource):
 
     """Base class for REST resources."""
@@ -209,6 +485,8 @@ class ClaimantResource(ClaimStoreResource):
                         )
                         db.session.add(new_persistent_id)
             db.session.commit()
+            claimant_cache.invalidate()
+            identifier_type_cache.invalidate()
             return {'status': 'success', 'uuid': new_claimant.uuid}
         else:
             raise InvalidRequest('This claimant is already registered')
@@ -288,6 +566,64 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
     """Resource that handles all claims-related requests."""
 
     json_schema = 'claims.claim'
+    cursor_orders = {
+        'id': (Claim.id, ),
+        'received': (Claim.received, Claim.id),
+    }
+    default_cursor_order = 'id'
+    projections = OrderedDict([
+        ('claimant', (
+            (Claim.claimant_id, ),
+            lambda row: claimant_cache.get_name(row.claimant_id)
+        )),
+        ('subject', (
+            (Claim.subject_type_id, Claim.subject_value),
+            lambda row: {
+                'type': identifier_type_cache.get_name(row.subject_type_id),
+                'value': row.subject_value,
+            }
+        )),
+        ('predicate', (
+            (Claim.predicate_id, ),
+            lambda row: predicate_cache.get_name(row.predicate_id)
+        )),
+        ('object', (
+            (Claim.object_type_id, Claim.object_value),
+            lambda row: {
+                'type': identifier_type_cache.get_name(row.object_type_id),
+                'value': row.object_value,
+            }
+        )),
+        ('certainty', (
+            (Claim.certainty, ),
+            lambda row: row.certainty
+        )),
+        ('arguments', (
+            (Claim.human, Claim.actor, Claim.role),
+            lambda row: {
+                name: getattr(row, name) for name in ('human', 'actor', 'role')
+                if getattr(row, name) is not None
+            } or None
+        )),
+        ('created', (
+            (Claim.claim_details['created'].astext.label('created'), ),
+            lambda row: row.created
+        )),
+        ('recieved', (
+            (Claim.received, ),
+            lambda row: row.received.isoformat()
+        )),
+        ('uuid', (
+            (Claim.uuid, ),
+            lambda row: row.uuid
+        )),
+    ])
+    """Columns selected for each field of the `fields` argument.
+
+    Every field is output by a function of the selected row, so that listings
+    of a few fields neither load `claim_details` nor build :class:`Claim`
+    objects. Fields whose output is `None` are omitted.
+    """
 
     def __init__(self):
         """Initialise Claims Resource."""
@@ -370,6 +706,35 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
             help='True if fetching all equivalent identifiers',
             trim=True
         )
+        self.args_parser.add_argument(
+            'stream', dest='stream',
+            type=inputs.boolean, default=False, location='args',
+            help='True if streaming all the claims as a JSON array',
+            trim=True
+        )
+        self.args_parser.add_argument(
+            'fields', dest='fields',
+            type=self.parse_fields, location='args',
+            help='Comma separated fields of the claims: {}'.format(
+                ', '.join(self.projections)
+            ),
+            trim=True
+        )
+
+    @classmethod
+    def parse_fields(cls, value):
+        """Parse the `fields` argument.
+
+        :param value: comma separated names of `projections`.
+        :type value: str
+        :returns: the names of the fields.
+        :rtype: list
+        :raises: :exc:`ValueError` if a field is unknown.
+        """
+        fields = [field.strip() for field in value.split(',')]
+        if not all(field in cls.projections for field in fields):
+            raise ValueError('Unknown field')
+        return fields
 
     def post(self):
         """Record a new claim.
@@ -379,6 +744,10 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
             This resource is expecting JSON data with all the necessary
             information of a new claim.
 
+            If `CFG_EQUIVALENT_ASYNC` is enabled, claims using an equivalence
+            predicate are recorded without updating the equivalent identifiers
+            index, which is done later by `claimstore eqid worker`.
+
             **Request**:
 
             .. sourcecode:: http
@@ -450,75 +819,53 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
         json_data = request.get_json()
 
         self.validate_json(json_data)
-
-        try:
-            if not json_data['created'].endswith('Z'):
-                raise InvalidJSONData('Claim\'s `creation datetime` must have '
-                                      'timezone information and must be UTC')
-            created_dt = isodate.parse_datetime(json_data['created'])
-        except isodate.ISO8601Error as e:
-            raise InvalidJSONData(
-                'Claim\'s `creation datetime` does not follow ISO 8601 Z',
-                extra=str(e)
-            )
-
-        claimant = Claimant.query.filter_by(name=json_data['claimant']).first()
-        if not claimant:
-            raise InvalidRequest('Claimant not registered')
-
-        subject_type = IdentifierType.query.filter_by(
-            name=json_data['subject']['type']
-        ).first()
-        if not subject_type:
-            raise InvalidRequest('Subject Type not registered')
-
-        object_type = IdentifierType.query.filter_by(
-            name=json_data['object']['type']
-        ).first()
-        if not object_type:
-            raise InvalidRequest('Object Type not registered')
-
-        if subject_type.id == object_type.id:
-            raise InvalidRequest('Subject and Object cannot have the same \
-                identifier type')
-
-        predicate = Predicate.query.filter_by(
-            name=json_data['predicate']
-        ).first()
-        if not predicate:
-            raise InvalidRequest('Predicate not registered')
-
-        subject_eqid, object_eqid = None, None
-        if json_data['predicate'] in \
-                current_app.config['CFG_EQUIVALENT_PREDICATES']:
-            subject_eqid, object_eqid = EquivalentIdentifier.set_equivalent_id(
-                subject_type.id,
-                json_data['subject']['value'],
-                object_type.id,
-                json_data['object']['value']
+        created_dt = parse_created_datetime(json_data)
+
+        claimant_id, subject_type_id, predicate_id, object_type_id = \
+            resolve_claim_names(json_data)
+
+        equivalent = json_data['predicate'] in \
+            current_app.config['CFG_EQUIVALENT_PREDICATES']
+        queued = equivalent and current_app.config['CFG_EQUIVALENT_ASYNC']
+
+        def record():
+            claim_id, subject_eqid, object_eqid = None, None, None
+            if equivalent and not queued:
+                # The id of the claim is recorded in the eqid event log.
+                claim_id = Claim.reserve_ids(1)[0]
+                subject_eqid, object_eqid = \
+                    EquivalentIdentifier.set_equivalent_id(
+                        subject_type_id,
+                        json_data['subject']['value'],
+                        object_type_id,
+                        json_data['object']['value'],
+                        claim_id=claim_id
+                    )
+            new_claim = build_claim(
+                json_data,
+                created_dt,
+                claimant_id,
+                subject_type_id,
+                predicate_id,
+                object_type_id,
+                subject_eqid,
+                object_eqid
             )
-
-        arguments = json_data.get('arguments', {})
-        new_claim = Claim(
-            created=created_dt,
-            claimant=claimant,
-            subject_type_id=subject_type.id,
-            subject_value=json_data['subject']['value'],
-            subject_eqid=subject_eqid.id if subject_eqid else None,
-            predicate_id=predicate.id,
-            object_type_id=object_type.id,
-            object_value=json_data['object']['value'],
-            object_eqid=object_eqid.id if object_eqid else None,
-            certainty=json_data['certainty'],
-            human=arguments.get('human', None),
-            actor=arguments.get('actor', None),
-            role=arguments.get('role', None),
-            claim_details=json_data,
-        )
-        db.session.add(new_claim)
-        db.session.commit()
+            new_claim.id = claim_id
+            db.session.add(new_claim)
+            if queued:
+                db.session.add(EquivalentQueue(claim=new_claim))
+            return new_claim
+
+        # Concurrent merges of the same clusters may deadlock.
+        new_claim = run_in_transaction(
+            db.session, record,
+            retries=current_app.config['CFG_DATABASE_RETRIES']
+        )
+        invalidate_claims_version()
         return {'status': 'success', 'uuid': new_claim.uuid}
 
+    @cached_response
     def get(self, claim_id=None):
         """GET service that returns the stored claims.
 
@@ -543,6 +890,8 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
                     Host: localhost:5000
 
             :reqheader Content-Type: application/json
+            :reqheader If-None-Match: ETag of a previous response to the same
+                                      request.
             :query datetime since: it must have the format 'YYYY-MM-DD'. It
                                    fetches claims that were created from this
                                    given datetime.
@@ -568,14 +917,40 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
             :query string value: it fetches all the claims with that identifier
                                  value.
             :query boolean recurse: used in combination with `type` and `value`
-                                    will find all the equivalent identifiers to
-                                    the specified one.
+                                    will find the claims of all the
+                                    equivalent identifiers to the specified
+                                    one. They can be further filtered and
+                                    are paginated like any other listing.
             :query string subject: it fetches claims using the given identifier
                                    type as a subject type.
             :query string object: it fetches claims using the given identifier
                                   type as an object type.
             :query int page: page from which to fetch data.
             :query int per_page: amount of data per page.
+            :query string cursor: opaque position from which to fetch data,
+                                  as given in the `next` link. It enables
+                                  cursor pagination, which is much faster for
+                                  deep pages but does not provide `prev` and
+                                  `last` links. Use an empty value to fetch
+                                  the first page.
+            :query string count: how to compute the `last` link in page mode:
+                                 `exact` (default) counts all the matching
+                                 claims, `estimate` uses the estimation of
+                                 the database planner and `none` omits it.
+            :query string sort: order of the claims, either `id` (default) or
+                                `received`.
+            :query boolean stream: stream all the matching claims as a JSON
+                                   array, without pagination. Claims are
+                                   also streamed, one JSON object per line,
+                                   when the request accepts
+                                   `application/x-ndjson`.
+            :query string fields: comma separated fields of the claims to
+                                  output (e.g. `uuid,subject,object`) among
+                                  `claimant`, `subject`, `predicate`,
+                                  `object`, `certainty`, `arguments`,
+                                  `created`, `recieved` and `uuid`. Only
+                                  their columns are read. All the fields are
+                                  output by default.
 
             **Response**:
 
@@ -630,7 +1005,9 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
                     ]
 
             :resheader Content-Type: application/json
+            :resheader ETag: strong ETag of the response, unless streamed.
             :statuscode 200: no error
+            :statuscode 304: not modified since the `If-None-Match` ETag
             :statuscode 400: invalid request
             :statuscode 403: access denied
 
@@ -638,121 +1015,695 @@ class ClaimResource(ClaimStoreResource, RestfulSQLAlchemyPaginationMixIn):
         """
         if claim_id:
             claim = Claim.query.filter_by(uuid=str(claim_id))
-            return self._make_output(claim)
+            return self._make_output(
+                self._project(claim, None, self.default_cursor_order)
+            )
         else:
             args = self.args_parser.parse_args()
-            claims = Claim.query
-            if not all(x is None for x in args.values()):
-
-                if args.type and args.value:
-                    if args.recurse:
-                        claims = Claim.equivalents(args.type, args.value)
-                        # pagination is not done when using 'recurse'
-                        return self._make_output(claims)
-                    else:
-                        type_ = IdentifierType.query.filter_by(
-                            name=args.type
-                        ).first()
-                        if type_:
-                            claims = claims. \
-                                filter(
-                                    or_(
-                                        and_(
-                                            Claim.subject_type_id == type_.id,
-                                            Claim.subject_value.like(
-                                                args.value
-                                            )
-                                        ),
-                                        and_(
-                                            Claim.object_type_id == type_.id,
-                                            Claim.object_value.like(args.value)
-                                        )
-                                    )
-                                )
-                        else:
-                            return []
-                elif args.type:  # Only by type
-                        claims = claims. \
-                            join(
-                                IdentifierType,
-                                or_(
-                                    Claim.subject_type_id == IdentifierType.id,
-                                    Claim.object_type_id == IdentifierType.id
-                                )
-                            ).filter(IdentifierType.name == args.type)
+            mimetype = stream_mimetype(args.stream)
+            filtered = self._filter_claims(args)
+            if filtered is None:
+                if mimetype:
+                    return self._stream_output([], mimetype)
+                return []
+            claims, params = filtered
+            fields, sort = tuple(args.fields or ()), args.sort
+            claims += (lambda q: self._project(q, fields, sort), fields, sort)
+            ordered = claims + (
+                lambda q: q.order_by(*self.cursor_orders[sort]), sort
+            )
+            if mimetype:
+                # Streams are long enough for their compilation not to matter.
+                return self._stream_output(
+                    self._to_query(ordered, params),
+                    mimetype,
+                    args.fields
+                )
+
+            if args.cursor is not None:
+                items = self.paginate_cursor_with(
+                    lambda values, limit: self._fetch_after(
+                        claims, params, sort, values, limit
+                    ),
+                    args.cursor,
+                    args.per_page,
+                    sort
+                )
+            else:
+                total = {
+                    'exact': lambda: self._count(claims, params),
+                    'estimate': lambda: estimate_count(
+                        self._to_query(claims, params)
+                    ),
+                }.get(args.count)
+                page = ordered + (lambda q: q.limit(bindparam('limit')).
+                                  offset(bindparam('offset')))
+                items = self.paginate_with(
+                    lambda limit, offset: self._fetch(
+                        page, dict(params, limit=limit, offset=offset)
+                    ),
+                    args.page,
+                    args.per_page,
+                    total
+                )
+            output = self._make_output(items, args.fields)
+            resp = make_response(dumps(output))
+            self.set_link_header(resp)
+            return resp
 
-                elif args.value:  # Only by value
-                    claims = claims. \
-                        filter(
+    def _filter_claims(self, args):
+        """Build the baked query of the claims matching the request arguments.
+
+        Every filter is a step of the query that compares the columns with
+        bind parameters, so that the SQL of each combination of filters is
+        compiled once by :data:`claims_bakery` and reused with the values of
+        the following requests. Steps that depend on the values (e.g. LIKE
+        versus equality) add the choice to the cache key of the query.
+
+        :param args: parsed request arguments.
+        :type args: dict
+        :returns: the baked query and the values of its parameters, or `None`
+            if an unknown claimant, predicate or identifier type was
+            requested.
+        :rtype: tuple
+        """
+        claims = claims_bakery(compile_claims_query)
+        params = {}
+        if not all(x is None for x in args.values()):
+
+            if args.type and args.value:
+                type_id = identifier_type_cache.get_id(args.type)
+                if not type_id:
+                    return None
+                params.update(type_id=type_id, value=args.value)
+                if args.recurse:
+                    claims += lambda q: Claim.filter_equivalents(
+                        q, bindparam('type_id'), bindparam('value')
+                    )
+                else:
+                    value = args.value
+                    claims += (
+                        lambda q: q.filter(
                             or_(
-                                Claim.subject_value.like(args.value),
-                                Claim.object_value.like(args.value))
+                                and_(
+                                    Claim.subject_type_id ==
+                                    bindparam('type_id'),
+                                    like_or_equal(Claim.subject_value,
+                                                  value, 'value')
+                                ),
+                                and_(
+                                    Claim.object_type_id ==
+                                    bindparam('type_id'),
+                                    like_or_equal(Claim.object_value,
+                                                  value, 'value')
+                                )
+                            )
+                        ),
+                        is_like_pattern(value)
+                    )
+            elif args.type:  # Only by type
+                type_id = identifier_type_cache.get_id(args.type)
+                if not type_id:
+                    return None
+                params.update(type_id=type_id)
+                claims += lambda q: q.filter(
+                    or_(
+                        Claim.subject_type_id == bindparam('type_id'),
+                        Claim.object_type_id == bindparam('type_id')
+                    )
+                )
+
+            elif args.value:  # Only by value
+                value = args.value
+                params.update(value=value)
+                claims += (
+                    lambda q: q.filter(
+                        or_(
+                            like_or_equal(Claim.subject_value, value,
+                                          'value'),
+                            like_or_equal(Claim.object_value, value,
+                                          'value')
                         )
+                    ),
+                    is_like_pattern(value)
+                )
+
+            if args.since:
+                params.update(since=loc_date_utc(args.since))
+                claims += lambda q: q.filter(
+                    Claim.created >= bindparam('since')
+                )
+
+            if args.until:
+                params.update(until=loc_date_utc(args.until))
+                claims += lambda q: q.filter(
+                    Claim.created < bindparam('until')
+                )
+
+            if args.claimant:
+                claimant_id = claimant_cache.get_id(args.claimant)
+                if not claimant_id:
+                    return None
+                params.update(claimant_id=claimant_id)
+                claims += lambda q: q.filter(
+                    Claim.claimant_id == bindparam('claimant_id')
+                )
+
+            if args.predicate:
+                predicate_id = predicate_cache.get_id(args.predicate)
+                if not predicate_id:
+                    return None
+                params.update(predicate_id=predicate_id)
+                claims += lambda q: q.filter(
+                    Claim.predicate_id == bindparam('predicate_id')
+                )
+
+            if args.certainty is not None:
+                params.update(certainty=args.certainty)
+                claims += lambda q: q.filter(
+                    Claim.certainty >= bindparam('certainty')
+                )
+
+            if args.human is not None:
+                params.update(human=args.human)
+                claims += lambda q: q.filter(
+                    Claim.human == bindparam('human')
+                )
+
+            if args.actor:
+                actor = args.actor
+                params.update(actor=actor)
+                claims += (
+                    lambda q: q.filter(
+                        like_or_equal(Claim.actor, actor, 'actor')
+                    ),
+                    is_like_pattern(actor)
+                )
+
+            if args.role:
+                role = args.role
+                params.update(role=role)
+                claims += (
+                    lambda q: q.filter(
+                        like_or_equal(Claim.role, role, 'role')
+                    ),
+                    is_like_pattern(role)
+                )
+
+            if args.subject:
+                subject_type_id = identifier_type_cache.get_id(
+                    args.subject
+                )
+                if not subject_type_id:
+                    return None
+                params.update(subject_type_id=subject_type_id)
+                claims += lambda q: q.filter(
+                    Claim.subject_type_id == bindparam('subject_type_id')
+                )
+
+            if args.object:
+                object_type_id = identifier_type_cache.get_id(args.object)
+                if not object_type_id:
+                    return None
+                params.update(object_type_id=object_type_id)
+                claims += lambda q: q.filter(
+                    Claim.object_type_id == bindparam('object_type_id')
+                )
+
+        return claims, params
+
+    @staticmethod
+    def _fetch(claims, params):
+        """Execute a baked query of claims.
+
+        :param claims: baked query.
+        :param params: values of its parameters.
+        :rtype: list
+        """
+        counters.incr('claims.query.executed')
+        return claims(db.session()).params(**params).all()
+
+    @staticmethod
+    def _count(claims, params):
+        """Count the claims of a baked query."""
+        counters.incr('claims.query.executed')
+        return claims(db.session()).params(**params).count()
+
+    @staticmethod
+    def _to_query(claims, params):
+        """Return a baked query as a regular query, which is not cached."""
+        counters.incr('claims.query.executed')
+        return claims.to_query(db.session()).params(**params)
+
+    def _fetch_after(self, claims, params, sort, values, limit):
+        """Fetch the claims following a cursor.
+
+        :param claims: baked query.
+        :param params: values of its parameters.
+        :param sort: name of one of the `cursor_orders`.
+        :param values: values of the columns of `sort` after which to fetch
+            the claims, or None for the first claims.
+        :param limit: maximum number of claims.
+        :rtype: list
+        """
+        columns = self.cursor_orders[sort]
+        params = dict(params, limit=limit)
+        if values is not None:
+            params.update(
+                ('after_{}'.format(i), value) for i, value in enumerate(values)
+            )
+            claims = claims + (
+                lambda q: q.filter(
+                    tuple_(*columns) > tuple_(*(
+                        bindparam('after_{}'.format(i), type_=column.type)
+                        for i, column in enumerate(columns)
+                    ))
+                ),
+                sort
+            )
+        claims = claims + (
+            lambda q: q.order_by(*columns).limit(bindparam('limit')), sort
+        )
+        return self._fetch(claims, params)
 
-                if args.since:
-                    claims = claims.filter(
-                        Claim.created >= loc_date_utc(args.since)
-                    )
+    def _project(self, claims, fields, sort):
+        """Select only the columns of some fields of the claims.
 
-                if args.until:
-                    claims = claims.filter(
-                        Claim.created < loc_date_utc(args.until)
-                    )
+        Rows are plain tuples rather than :class:`Claim` objects, which are
+        much slower to build and are tracked by the session. The columns of
+        the `sort` order are always selected, for the cursor.
 
-                if args.claimant:
-                    claims = claims. \
-                        join(Claim.claimant). \
-                        filter(Claimant.name == args.claimant)
-
-                if args.predicate:
-                    claims = claims. \
-                        join(Claim.predicate). \
-                        filter(Predicate.name == args.predicate)
-
-                if args.certainty is not None:
-                    claims = claims.filter(Claim.certainty >= args.certainty)
-
-                if args.human is not None:
-                    claims = claims.filter(Claim.human == args.human)
-
-                if args.actor:
-                    claims = claims.filter(Claim.actor.like(args.actor))
-
-                if args.role:
-                    claims = claims.filter(Claim.role.like(args.role))
-
-                if args.subject or args.object:
-                    subject_type = db.aliased(IdentifierType,
-                                              name='SubjectType')
-                    object_type = db.aliased(IdentifierType,
-                                             name='ObjectType')
-                    if args.subject:
-                        claims = claims. \
-                            join(subject_type,
-                                 Claim.subject_type_id == subject_type.id). \
-                            filter(subject_type.name == args.subject)
-
-                    if args.object:
-                        claims = claims. \
-                            join(object_type,
-                                 Claim.object_type_id == object_type.id). \
-                            filter(object_type.name == args.object)
-
-            output = self._make_output(self.paginate(claims,
-                                                     args.page,
-                                                     args.per_page))
-            resp = make_response(json.dumps(output))
-            self.set_link_header(resp)
-            return resp
+        :param claims: query of the claims.
+        :param fields: names of `projections`, or None for the full claims.
+        :param sort: name of one of the `cursor_orders`.
+        :returns: query of the selected columns.
+        """
+        columns = OrderedDict(
+            (column.key, column) for column in self.cursor_orders[sort]
+        )
+        if fields:
+            for field in fields:
+                for column in self.projections[field][0]:
+                    columns.setdefault(column.key, column)
+        else:
+            for column in (Claim.claim_details, Claim.received, Claim.uuid):
+                columns.setdefault(column.key, column)
+        return claims.with_entities(*columns.values())
 
-    def _make_output(self, items):
+    @classmethod
+    def _make_item(cls, claim, fields=None):
+        """Create the output dictionary of a single claim.
+
+        :param claim: row selected by :meth:`_project`.
+        :param fields: names of the `projections` to output, or None for the
+            full claim.
+        """
+        if fields:
+            item = OrderedDict()
+            for field in fields:
+                value = cls.projections[field][1](claim)
+                if value is not None:
+                    item[field] = value
+            return item
+        # The document is decoded for every row, so it is not copied.
+        item = claim.claim_details
+        item['recieved'] = claim.received.isoformat()
+        item['uuid'] = claim.uuid
+        return item
+
+    def _make_output(self, items, fields=None):
         """Create output dictionary with all claims."""
-        output = []
-        for c in items:
-            item = c.claim_details
-            item['recieved'] = c.received.isoformat()
-            item['uuid'] = c.uuid
-            output.append(item)
+        return [self._make_item(c, fields) for c in items]
+
+    def _stream_output(self, items, mimetype, fields=None):
+        """Stream all the claims without holding them in memory.
+
+        Rows are fetched from a server-side cursor in chunks of
+        `CFG_CLAIMS_STREAM_CHUNK_SIZE` and sent as soon as they are encoded.
+
+        :param items: query (or list) of claims.
+        :param mimetype: `application/x-ndjson` for one claim per line or
+            `application/json` for a JSON array.
+        :type mimetype: str
+        :param fields: names of the `projections` to output, or None for the
+            full claims.
+        :returns: streamed response.
+        :rtype: flask.Response
+        """
+        chunk_size = current_app.config['CFG_CLAIMS_STREAM_CHUNK_SIZE']
+        if hasattr(items, 'yield_per'):
+            items = items.yield_per(chunk_size)
+        encode = get_encoder()
+        return stream_json(
+            (encode(self._make_item(claim, fields)) for claim in items),
+            mimetype,
+            chunk_size
+        )
+
+
+class ClaimBatchResource(ClaimStoreResource):
+
+    """Resource that records many claims in a single request."""
+
+    json_schema = 'claims.claim'
+
+    def post(self):
+        """Record a batch of new claims.
+
+        .. http:post:: /api/claims/batch
+
+            This resource is expecting either a JSON list of claims or one
+            claim per line (NDJSON). Every claim is validated and recorded
+            independently, so the response contains one result per claim in
+            the same order as they were submitted.
+
+            **Request**:
+
+            .. sourcecode:: http
+
+                POST /api/claims/batch HTTP/1.1
+                Accept: application/json
+                Content-Type: application/x-ndjson
+
+                {"claimant": "CDS", "subject": {...}, "predicate": ...}
+                {"claimant": "INSPIRE", "subject": {...}, "predicate": ...}
+
+            :reqheader Content-Type: application/json or application/x-ndjson
+            :json body: list of claims. Each claim should be valid according
+                        to the `JSON Schema for claims
+                        <https://goo.gl/C1f6vw>`_.
+
+            **Responses**:
+
+            .. sourcecode:: http
+
+                HTTP/1.0 200 OK
+                Content-Type: application/json
+
+                [
+                    {
+                        "status": "success",
+                        "uuid": "fad4ec9f-0e95-4a22-b65c-d01f15aba6be"
+                    },
+                    {
+                        "message": "Predicate not registered",
+                        "status": "error"
+                    }
+                ]
+
+            Claims are committed in chunks of
+            `CFG_CLAIMS_BATCH_COMMIT_SIZE`. If a chunk cannot be recorded,
+            the following ones are not recorded either, but the claims of the
+            previous chunks stay recorded and are reported as such.
+
+            :resheader Content-Type: application/json
+            :statuscode 200: no error - the batch was processed
+            :statuscode 400: invalid request - probably a malformed batch
+            :statuscode 403: access denied
+            :statuscode 500: the batch was partially recorded - the response
+                             tells which claims were recorded
+
+            .. see docs/users.rst for usage documenation.
+        """
+        items = self._load_batch()
+        max_size = current_app.config['CFG_CLAIMS_BATCH_MAX_SIZE']
+        if len(items) > max_size:
+            raise InvalidRequest(
+                'A batch cannot contain more than {} claims'.format(max_size)
+            )
+
+        results = [None] * len(items)
+        valid = []
+        for index, json_data in enumerate(items):
+            if isinstance(json_data, RestApiException):
+                results[index] = json_data.to_dict()
+                continue
+            try:
+                self.validate_json(json_data)
+                valid.append((index, json_data,
+                              parse_created_datetime(json_data)))
+            except RestApiException as e:
+                results[index] = e.to_dict()
+
+        # Names are resolved through the reference caches, so the database
+        # is queried at most once per table for the whole batch.
+        resolved = []
+        for index, json_data, created_dt in valid:
+            try:
+                resolved.append((index, json_data, created_dt,
+                                 resolve_claim_names(json_data)))
+            except RestApiException as e:
+                results[index] = e.to_dict()
+
+        chunk_size = current_app.config['CFG_CLAIMS_BATCH_COMMIT_SIZE']
+        retries = current_app.config['CFG_DATABASE_RETRIES']
+        status_code = 200
+        for start in range(0, len(resolved), chunk_size):
+            chunk = resolved[start:start + chunk_size]
+            try:
+                run_in_transaction(
+                    db.session,
+                    lambda chunk=chunk: self._record_chunk(chunk, results),
+                    retries=retries
+                )
+            except SQLAlchemyError:
+                # The previous chunks are committed: report them along with
+                # the claims that have not been recorded.
+                failed = RestApiException('Claim could not be recorded',
+                                          status_code=500)
+                skipped = RestApiException('Claim not recorded after a '
+                                           'previous failure',
+                                           status_code=500)
+                for index, _, _, _ in chunk:
+                    results[index] = failed.to_dict()
+                for index, _, _, _ in resolved[start + chunk_size:]:
+                    results[index] = skipped.to_dict()
+                status_code = 500
+                break
+        invalidate_claims_version()
+        return results, status_code
+
+    def _load_batch(self):
+        """Return the list of claims contained in the request.
+
+        Lines of a NDJSON request that are not valid JSON are returned as
+        :exc:`InvalidJSONData` instances so that they can be reported
+        independently.
+        """
+        if request.mimetype == 'application/x-ndjson':
+            items = []
+            for line in request.get_data(as_text=True).splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    items.append(
+                        InvalidJSONData('Claim is not valid JSON',
+                                        extra=str(e))
+                    )
+        else:
+            items = request.get_json()
+        if not isinstance(items, list) or not items:
+            raise InvalidRequest('A batch must be a non-empty list of claims')
+        return items
+
+    @staticmethod
+    def _record_chunk(chunk, results):
+        """Record a chunk of resolved claims in the current transaction."""
+        equivalent = [
+            (index, json_data, ids) for index, json_data, _, ids in chunk
+            if json_data['predicate'] in
+            current_app.config['CFG_EQUIVALENT_PREDICATES']
+        ]
+        eqids, claim_ids, queued = {}, {}, set()
+        if current_app.config['CFG_EQUIVALENT_ASYNC']:
+            queued = set(index for index, _, _ in equivalent)
+        elif equivalent:
+            claim_ids = dict(zip(
+                [index for index, _, _ in equivalent],
+                Claim.reserve_ids(len(equivalent))
+            ))
+            eqids = dict(zip(
+                [index for index, _, _ in equivalent],
+                EquivalentIdentifier.set_equivalent_ids([
+                    (ids[1], json_data['subject']['value'],
+                     ids[3], json_data['object']['value'])
+                    for _, json_data, ids in equivalent
+                ], [claim_ids[index] for index, _, _ in equivalent])
+            ))
+        new_claims, entries = [], []
+        for index, json_data, created_dt, ids in chunk:
+            subject_eqid, object_eqid = eqids.get(index, (None, None))
+            new_claim = build_claim(json_data, created_dt, *ids,
+                                    subject_eqid=subject_eqid,
+                                    object_eqid=object_eqid)
+            new_claim.id = claim_ids.get(index)
+            new_claims.append(new_claim)
+            if index in queued:
+                entries.append(EquivalentQueue(claim=new_claim))
+            results[index] = {'status': 'success', 'uuid': new_claim.uuid}
+        db.session.add_all(new_claims)
+        db.session.add_all(entries)
+
+
+class ClaimLookupResource(ClaimStoreResource):
+
+    """Resource that returns the claims of many identifiers at once."""
+
+    json_schema = 'claims.identifiers'
+
+    def __init__(self):
+        """Initialise Claim Lookup Resource."""
+        super(ClaimLookupResource, self).__init__()
+        # The lookups are filtered and output as the claim listings.
+        self.claims = ClaimResource()
+        self.args_parser = self.claims.args_parser.copy()
+        for name in ('type', 'value', 'page', 'per_page', 'count', 'cursor',
+                     'stream'):
+            self.args_parser.remove_argument(name)
+
+    def post(self):
+        """Return the claims of many identifiers.
+
+        .. http:post:: /api/claims/lookup
+
+            This resource is expecting a JSON list of identifiers. The
+            response contains the claims whose subject or object is each of
+            them, in the same order as they were submitted. All the
+            identifiers are looked up with a single query.
+
+            The claims can be filtered with the same query arguments as
+            `GET /api/claims`, except `type`, `value` and the pagination.
+
+            **Request**:
+
+            .. sourcecode:: http
+
+                POST /api/claims/lookup?fields=uuid,predicate HTTP/1.1
+                Accept: application/json
+                Content-Type: application/json
+
+                [
+                    {
+                        "type": "ARXIV_ID",
+                        "value": "cond-mat/9906097"
+                    },
+                    {
+                        "type": "DOI",
+                        "value": "10.1234/unknown"
+                    }
+                ]
+
+            :reqheader Content-Type: application/json
+            :query boolean recurse: also return the claims of the equivalent
+                                    identifiers, as `GET /api/claims`.
+            :query string fields: fields of the claims, as `GET /api/claims`.
+            :json body: list of at most `CFG_CLAIMS_LOOKUP_MAX_SIZE`
+                        identifiers with their `type` and `value`.
+
+            **Responses**:
+
+            .. sourcecode:: http
+
+                HTTP/1.0 200 OK
+                Content-Type: application/json
+
+                [
+                    {
+                        "type": "ARXIV_ID",
+                        "value": "cond-mat/9906097",
+                        "claims": [
+                            {
+                                "predicate": "is_same_as",
+                                "uuid": "27689445-02b9-4d5d-8f9b-da21970e2352"
+                            }
+                        ]
+                    },
+                    {
+                        "type": "DOI",
+                        "value": "10.1234/unknown",
+                        "claims": []
+                    }
+                ]
+
+            :resheader Content-Type: application/json
+            :statuscode 200: no error
+            :statuscode 400: invalid request - probably a malformed JSON
+            :statuscode 403: access denied
+
+            .. see docs/users.rst for usage documenation.
+        """
+        args = self.args_parser.parse_args()
+        json_data = request.get_json()
+        self.validate_json(json_data)
+        max_size = current_app.config['CFG_CLAIMS_LOOKUP_MAX_SIZE']
+        if len(json_data) > max_size:
+            raise InvalidRequest(
+                'Cannot look up more than {} identifiers'.format(max_size)
+            )
+
+        keys = [
+            (identifier_type_cache.get_id(item['type']), item['value'])
+            for item in json_data
+        ]
+        claims = self._lookup(
+            args, list(OrderedDict.fromkeys(key for key in keys if key[0]))
+        )
+        return [
+            {
+                'type': item['type'],
+                'value': item['value'],
+                'claims': claims.get(key, []),
+            }
+            for item, key in zip(json_data, keys)
+        ]
+
+    def _lookup(self, args, keys):
+        """Return the claims of some identifiers.
+
+        :param args: parsed request arguments.
+        :param keys: list of unique tuples (type_id, value).
+        :returns: a dictionary (type_id, value) -> list of claims.
+        :rtype: dict
+        """
+        recurse = args.recurse
+        args.update(type=None, value=None, recurse=False)
+        filtered = self.claims._filter_claims(args) if keys else None
+        if filtered is None:
+            return {}
+        claims, params = filtered
+
+        if recurse:
+            clusters = EquivalentIdentifier.clusters(keys)
+            members = [
+                (key, member)
+                for key in keys if key in clusters
+                for member in clusters[key][1]
+            ]
+        else:
+            members = [(key, key) for key in keys]
+        params.update(
+            lookup_type_ids=[key[0] for key, _ in members],
+            lookup_values=[key[1] for key, _ in members],
+            lookup_member_type_ids=[member[0] for _, member in members],
+            lookup_member_values=[member[1] for _, member in members]
+        )
+
+        resource = self.claims
+        fields, sort = tuple(args.fields or ()), args.sort
+        claims += (
+            lambda q: resource._project(q, fields, sort), fields, sort
+        )
+        claims += (lambda q: Claim.join_lookup(q, recurse), recurse)
+        claims += (
+            lambda q: q.order_by(*resource.cursor_orders[sort]), sort
+        )
+        output = {}
+        for row in resource._fetch(claims, params):
+            output.setdefault(
+                (row.lookup_type_id, row.lookup_value), []
+            ).append(resource._make_item(row, args.fields))
         return output
 
 
@@ -854,17 +1805,53 @@ class PredicateResource(ClaimStoreResource):
         return [pred.name for pred in predicates]
 
 
-class EquivalentIdResource(ClaimStoreResource):
+class EquivalentIdResource(ClaimStoreResource,
+                           RestfulSQLAlchemyPaginationMixIn):
 
     """Resource that handles Equivalent Identifier requests."""
 
+    cursor_orders = {
+        'eqid': (EquivalentCluster.eqid, ),
+    }
+    default_cursor_order = 'eqid'
+
+    def __init__(self):
+        """Initialise Equivalent Identifier Resource."""
+        super(ClaimStoreResource, self).__init__()
+        self.args_parser.add_argument(
+            'type', dest='type',
+            type=str, location='args',
+            help='Identifier Type (e.g. DOI)',
+            trim=True
+        )
+        self.args_parser.add_argument(
+            'value', dest='value',
+            type=str, location='args',
+            help='Value of an Identifier Type',
+            trim=True
+        )
+        self.args_parser.add_argument(
+            'min_size', dest='min_size',
+            type=int, location='args',
+            help='Minimum number of identifiers of the clusters',
+            trim=True
+        )
+        self.args_parser.add_argument(
+            'stream', dest='stream',
+            type=inputs.boolean, default=False, location='args',
+            help='True if streaming all the clusters as a JSON object',
+            trim=True
+        )
+
     def get(self, eqid=None):
         """GET service that returns all the stored Equivalent Identifiers.
 
         .. http:get:: /api/eqids/(uuid:eqid)
 
             Returns all the type/value entries in the index grouped by their
-            equivalent identifiers.
+            canonical equivalent identifiers. Clusters are sorted by their
+            canonical eqid and paginated with a cursor (see the `Link`
+            header).
 
             **Requests**:
 
@@ -880,9 +1867,31 @@ class EquivalentIdResource(ClaimStoreResource):
                     Accept: */*
                     Host: localhost:5000
 
+                .. sourcecode:: http
+
+                    GET /api/eqids?type=DOI&value=10.1103/PhysRevE.62.7422
+                    HTTP/1.1
+                    Accept: */*
+                    Host: localhost:5000
+
             :reqheader Content-Type: application/json
             :param eqid: query by a specific uuid which is shared by some
-                         equivalent identifiers
+                         equivalent identifiers. The entries of its whole
+                         cluster are returned under its canonical eqid.
+            :query string type: identifier type. Used in combination with
+                                `value`, only the cluster of this identifier
+                                is returned.
+            :query string value: identifier value.
+            :query int min_size: only return clusters with at least this
+                                 number of identifiers.
+            :query int per_page: amount of clusters per page.
+            :query string cursor: opaque position from which to fetch data,
+                                  as given in the `next` link.
+            :query boolean stream: stream all the clusters as a JSON object,
+                                   without pagination. Clusters are also
+                                   streamed, one JSON object with `eqid` and
+                                   `identifiers` per line, when the request
+                                   accepts `application/x-ndjson`.
 
             **Response**:
 
@@ -927,16 +1936,341 @@ class EquivalentIdResource(ClaimStoreResource):
             .. see docs/users.rst for usage documenation.
         """
         if eqid:
-            eqids = EquivalentIdentifier.query.filter_by(eqid=str(eqid))
-        else:
-            eqids = EquivalentIdentifier.query.all()
-        output_dict = defaultdict(list)
-        for eqi in eqids:
-            output_dict[eqi.eqid].append({
-                'type': eqi.type.name,
-                'value': eqi.value
+            root = EquivalentCluster.root(str(eqid))
+            members = EquivalentIdentifier.cluster_members([root])
+            if not members[root]:
+                return {}
+            return self._make_output(members)
+
+        args = self.args_parser.parse_args()
+        if args.type or args.value:
+            if not (args.type and args.value):
+                raise InvalidRequest('Both type and value are required')
+            return self._cluster_output(args.type, args.value)
+        if args.min_size is not None and args.min_size < 1:
+            raise InvalidRequest('min_size must be a positive integer')
+
+        mimetype = stream_mimetype(args.stream)
+        if mimetype:
+            return self._stream_output(args.min_size, mimetype)
+
+        def fetch(values, limit):
+            return EquivalentCluster.page(values[0] if values else None,
+                                          limit, args.min_size)
+
+        roots = self.paginate_cursor_with(fetch, args.cursor, args.per_page,
+                                          args.sort)
+        output = self._make_output(EquivalentIdentifier.cluster_members(
+            row.eqid for row in roots
+        ))
+        resp = make_response(json.dumps(output))
+        self.set_link_header(resp)
+        return resp
+
+    @staticmethod
+    def _make_output(members):
+        """Create the output dictionary of some clusters."""
+        return OrderedDict(
+            (root, make_identifiers_output(identifiers))
+            for root, identifiers in members.items()
+        )
+
+    @staticmethod
+    def _stream_output(min_size, mimetype):
+        """Stream all the clusters without holding them in memory.
+
+        Clusters are fetched in pages of `CFG_CLAIMS_STREAM_CHUNK_SIZE`.
+        """
+        chunk_size = current_app.config['CFG_CLAIMS_STREAM_CHUNK_SIZE']
+        ndjson = mimetype == 'application/x-ndjson'
+
+        def entries():
+            after = None
+            while True:
+                roots = EquivalentCluster.page(after, chunk_size, min_size)
+                if not roots:
+                    break
+                members = EquivalentIdentifier.cluster_members(
+                    row.eqid for row in roots
+                )
+                for root, identifiers in members.items():
+                    identifiers = make_identifiers_output(identifiers)
+                    if ndjson:
+                        yield json.dumps({'eqid': root,
+                                          'identifiers': identifiers})
+                    else:
+                        yield '{}:{}'.format(json.dumps(root),
+                                             json.dumps(identifiers))
+                after = roots[-1].eqid
+
+        return stream_json(entries(), mimetype, chunk_size, brackets='{}')
+
+    @staticmethod
+    def _cluster_output(type_name, value):
+        """Return the cluster of an identifier, if it is in the index."""
+        type_id = identifier_type_cache.get_id(type_name)
+        if not type_id:
+            return {}
+        clusters = EquivalentIdentifier.clusters([(type_id, value)])
+        if not clusters:
+            return {}
+        root, members = clusters[(type_id, value)]
+        return {root: make_identifiers_output(members)}
+
+
+class EquivalentIdResolveResource(ClaimStoreResource):
+
+    """Resource that resolves the clusters of many identifiers at once."""
+
+    json_schema = 'claims.identifiers'
+
+    def post(self):
+        """Return the equivalent identifiers of many identifiers.
+
+        .. http:post:: /api/eqids/resolve
+
+            This resource is expecting a JSON list of identifiers. The
+            response contains the cluster of each of them, in the same order
+            as they were submitted, and it is computed with a constant number
+            of queries whatever the number of identifiers.
+
+            **Request**:
+
+            .. sourcecode:: http
+
+                POST /api/eqids/resolve HTTP/1.1
+                Accept: application/json
+                Content-Type: application/json
+
+                [
+                    {
+                        "type": "ARXIV_ID",
+                        "value": "cond-mat/9906097"
+                    },
+                    {
+                        "type": "DOI",
+                        "value": "10.1234/unknown"
+                    }
+                ]
+
+            :reqheader Content-Type: application/json
+            :json body: list of at most `CFG_EQIDS_RESOLVE_MAX_SIZE`
+                        identifiers with their `type` and `value`.
+
+            **Responses**:
+
+            .. sourcecode:: http
+
+                HTTP/1.0 200 OK
+                Content-Type: application/json
+
+                [
+                    {
+                        "eqid": "36dfb125-5c35-4d3a-870c-76eb4bad498e",
+                        "identifiers": [
+                            {
+                                "type": "ARXIV_ID",
+                                "value": "cond-mat/9906097"
+                            },
+                            {
+                                "type": "DOI",
+                                "value": "C10.1103/PhysRevE.62.7422"
+                            }
+                        ],
+                        "type": "ARXIV_ID",
+                        "value": "cond-mat/9906097"
+                    },
+                    {
+                        "eqid": null,
+                        "identifiers": [],
+                        "type": "DOI",
+                        "value": "10.1234/unknown"
+                    }
+                ]
+
+            :resheader Content-Type: application/json
+            :statuscode 200: no error
+            :statuscode 400: invalid request - probably a malformed JSON
+            :statuscode 403: access denied
+
+            .. see docs/users.rst for usage documenation.
+        """
+        json_data = request.get_json()
+        self.validate_json(json_data)
+        max_size = current_app.config['CFG_EQIDS_RESOLVE_MAX_SIZE']
+        if len(json_data) > max_size:
+            raise InvalidRequest(
+                'Cannot resolve more than {} identifiers'.format(max_size)
+            )
+
+        keys = [
+            (identifier_type_cache.get_id(item['type']), item['value'])
+            for item in json_data
+        ]
+        clusters = EquivalentIdentifier.clusters(
+            key for key in keys if key[0]
+        )
+        output = []
+        for item, key in zip(json_data, keys):
+            root, members = clusters.get(key, (None, []))
+            output.append({
+                'type': item['type'],
+                'value': item['value'],
+                'eqid': root,
+                'identifiers': make_identifiers_output(members)
             })
-        return output_dict
+        return output
+
+
+class EquivalentIdStatsResource(ClaimStoreResource):
+
+    """Resource that reports statistics about the eqid clusters."""
+
+    def __init__(self):
+        """Initialise Equivalent Identifier Statistics Resource."""
+        super(EquivalentIdStatsResource, self).__init__()
+        self.args_parser = reqparse.RequestParser()
+        self.args_parser.add_argument(
+            'top', dest='top',
+            type=int, default=10, location='args',
+            help='Number of largest clusters',
+            trim=True
+        )
+        self.args_parser.add_argument(
+            'days', dest='days',
+            type=int, default=30, location='args',
+            help='Number of days of history',
+            trim=True
+        )
+
+    def get(self):
+        """GET service that returns statistics about the eqid clusters.
+
+        .. http:get:: /api/eqids/stats
+
+            Returns the number of clusters, a histogram of their sizes, the
+            largest clusters, the number of clusters created and merged per
+            day and the eqid counters of the process that served the
+            request. Clusters with at least `CFG_EQUIVALENT_HOT_CLUSTER_SIZE`
+            identifiers are counted in `hot_clusters`.
+
+            **Request**:
+
+                .. sourcecode:: http
+
+                    GET /api/eqids/stats?top=1 HTTP/1.1
+                    Accept: */*
+                    Host: localhost:5000
+
+            :reqheader Content-Type: application/json
+            :query int top: number of largest clusters (10 by default).
+            :query int days: number of days of history (30 by default).
+
+            **Response**:
+
+                .. sourcecode:: http
+
+                    HTTP/1.0 200 OK
+                    Content-Type: application/json
+
+                    {
+                        "clusters": 2,
+                        "identifiers": 5,
+                        "hot_clusters": 0,
+                        "histogram": [
+                            {"min": 2, "max": 3, "clusters": 2}
+                        ],
+                        "largest": [
+                            {
+                                "eqid": "36dfb125-5c35-4d3a-870c-76eb4bad498e",
+                                "size": 3
+                            }
+                        ],
+                        "history": [
+                            {"date": "2016-01-04", "created": 3, "merged": 1}
+                        ],
+                        "counters": {
+                            "eqid.extend": 1,
+                            "eqid.merge": 1,
+                            "eqid.new": 3,
+                            "eqid.rows_rewritten": 2
+                        }
+                    }
+
+            :resheader Content-Type: application/json
+            :statuscode 200: no error
+            :statuscode 400: invalid request
+            :statuscode 403: access denied
+
+            .. see docs/users.rst for usage documenation.
+        """
+        args = self.args_parser.parse_args()
+        if args.top < 0 or args.days < 1:
+            raise InvalidRequest('top and days must be positive integers')
+        return EquivalentCluster.statistics(top=args.top, days=args.days)
+
+
+class ClaimStatsResource(ClaimStoreResource):
+
+    """Resource that reports the metrics of the claim listings."""
+
+    def get(self):
+        """GET service that returns the metrics of the claim listings.
+
+        .. http:get:: /api/claims/stats
+
+            Returns the claim counters of the process that served the request
+            and the hit rates of its caches: the compiled queries of
+            :data:`claims_bakery` and the responses cached for
+            `CFG_CLAIMS_CACHE_BACKEND`, including the 304 answers.
+
+            **Request**:
+
+                .. sourcecode:: http
+
+                    GET /api/claims/stats HTTP/1.1
+                    Accept: */*
+                    Host: localhost:5000
+
+            :reqheader Content-Type: application/json
+
+            **Response**:
+
+                .. sourcecode:: http
+
+                    HTTP/1.0 200 OK
+                    Content-Type: application/json
+
+                    {
+                        "query_cache_hit_rate": 0.95,
+                        "response_cache_hit_rate": 0.5,
+                        "counters": {
+                            "claims.cache.hit": 10,
+                            "claims.cache.miss": 20,
+                            "claims.cache.not_modified": 10,
+                            "claims.query.compiled": 2,
+                            "claims.query.executed": 40
+                        }
+                    }
+
+            :resheader Content-Type: application/json
+            :statuscode 200: no error
+            :statuscode 403: access denied
+
+            .. see docs/users.rst for usage documenation.
+        """
+        values = counters.snapshot('claims.')
+        executed = values.get('claims.query.executed', 0)
+        compiled = values.get('claims.query.compiled', 0)
+        hits = values.get('claims.cache.hit', 0) + \
+            values.get('claims.cache.not_modified', 0)
+        requests = hits + values.get('claims.cache.miss', 0)
+        return {
+            'query_cache_hit_rate':
+                max(0.0, 1 - compiled / executed) if executed else None,
+            'response_cache_hit_rate': hits / requests if requests else None,
+            'counters': values,
+        }
 
 
 claims_api.add_resource(ClaimantResource,
@@ -947,6 +2281,15 @@ claims_api.add_resource(ClaimResource,
                         '/api/claims',
                         '/api/claims/<uuid:claim_id>',
                         endpoint='claims')
+claims_api.add_resource(ClaimStatsResource,
+                        '/api/claims/stats',
+                        endpoint='claims_stats')
+claims_api.add_resource(ClaimLookupResource,
+                        '/api/claims/lookup',
+                        endpoint='claims_lookup')
+claims_api.add_resource(ClaimBatchResource,
+                        '/api/claims/batch',
+                        endpoint='claims_batch')
 claims_api.add_resource(IdentifierResource,
                         '/api/identifiers',
                         endpoint='identifiers')
@@ -957,3 +2300,9 @@ claims_api.add_resource(EquivalentIdResource,
                         '/api/eqids',
                         '/api/eqids/<uuid:eqid>',
                         endpoint='eqids')
+claims_api.add_resource(EquivalentIdResolveResource,
+                        '/api/eqids/resolve',
+                        endpoint='eqids_resolve')
+claims_api.add_resource(EquivalentIdStatsResource,
+                        '/api/eqids/stats',
+                        endpoint='eqids_stats')
@@ -23,6 +23,8 @@
 import pytest
 
 from claimstore.app import db as db_
+from claimstore.models import invalidate_reference_caches
+from claimstore.restful import invalidate_claims_version, response_cache
 
 
 @pytest.yield_fixture(scope='session')
@@ -42,3 +44,8 @@ def db(database, monkeypatch):
     yield database
     database.session.rollback()
     database.session.remove()
+    # Rows added during the test are gone, so are their ids.
+    invalidate_reference_caches()
+    invalidate_claims_version()
+    if response_cache() is not None:
+        response_cache().clear()
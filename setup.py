@@ -109,6 +109,7 @@ setup(
     ],
     extras_require={
         'development': ['Flask-DebugToolbar'],
+        'speedups': ['fastjsonschema>=2.19', 'orjson'],
         'docs': [
             'sphinx',
             'sphinx_rtd_theme>=0.1.7',
@@ -56,3 +56,94 @@ def test_eqid_reindex(cli_runner, db):
     result = cli_runner(cli.eqid_cli, ['reindex'], input='y')
     assert result.exit_code == 0
     assert result.output.endswith('Index rebuilt.\n')
+    result = cli_runner(cli.eqid_cli, ['reindex', '--engine', 'legacy'],
+                        input='y')
+    assert result.exit_code == 0
+    assert result.output.endswith('Index rebuilt.\n')
+    result = cli_runner(cli.eqid_cli, ['reindex', '--incremental'],
+                        input='y')
+    assert result.exit_code == 0
+    assert result.output.endswith('Index rebuilt.\n')
+
+
+@populate_all
+def test_eqid_compact(cli_runner, db):
+    """Test `claimstore eqid compact` command."""
+    # keep `db` parameter to ensure database rollback.
+    result = cli_runner(cli.eqid_cli, ['compact'])
+    assert result.exit_code == 0
+    assert result.output.endswith('cluster(s) compacted.\n')
+
+
+@populate_all
+def test_eqid_replay(cli_runner, db):
+    """Test `claimstore eqid replay`, `truncate` and `show` commands."""
+    # keep `db` parameter to ensure database rollback.
+    result = cli_runner(cli.eqid_cli, ['replay'], input='y')
+    assert result.exit_code == 0
+    assert result.output.endswith('Index rebuilt.\n')
+
+    result = cli_runner(cli.eqid_cli, ['show', 'ARXIV_ID',
+                                       'cond-mat/9906097'])
+    assert result.exit_code == 0
+    assert 'DOI C10.1103/PhysRevE.62.7422' in result.output
+    result = cli_runner(cli.eqid_cli, ['show', 'ARXIV_ID', 'xxx',
+                                       '--at', '2015-01-01'])
+    assert result.output == 'Unknown identifier.\n'
+
+    result = cli_runner(cli.eqid_cli, ['truncate'])
+    assert result.exit_code != 0
+    result = cli_runner(cli.eqid_cli, ['truncate', '--until', '2015-01-01'],
+                        input='n')
+    assert result.output.endswith('Command aborted\n')
+    result = cli_runner(cli.eqid_cli, ['show', 'ARXIV_ID',
+                                       'cond-mat/9906097'])
+    assert 'DOI C10.1103/PhysRevE.62.7422' in result.output
+    result = cli_runner(cli.eqid_cli, ['truncate', '--until', '2015-01-01'],
+                        input='y')
+    assert result.exit_code == 0
+    assert result.output.endswith('Index rebuilt.\n')
+    result = cli_runner(cli.eqid_cli, ['show', 'ARXIV_ID',
+                                       'cond-mat/9906097'])
+    assert result.output == 'Unknown identifier.\n'
+
+
+def test_eqid_worker(cli_runner, db):
+    """Test `claimstore eqid worker --once` command."""
+    # keep `db` parameter to ensure database rollback.
+    result = cli_runner(cli.eqid_cli, ['worker', '--once'])
+    assert result.exit_code == 0
+    assert result.output.endswith('Queue empty.\n')
+
+
+@populate_all
+def test_eqid_stats(cli_runner, db):
+    """Test `claimstore eqid stats` command."""
+    # keep `db` parameter to ensure database rollback.
+    result = cli_runner(cli.eqid_cli, ['stats', '--top', '1'])
+    assert result.exit_code == 0
+    assert 'cluster(s)' in result.output
+    assert 'Largest clusters:' in result.output
+
+
+def test_index_create(cli_runner, db):
+    """Test `claimstore index create` command."""
+    result = cli_runner(cli.index_cli, ['create'])
+    assert result.exit_code == 0
+    assert result.output.endswith('0 index(es) created.\n')
+
+
+def test_index_list(cli_runner, db):
+    """Test `claimstore index list` command."""
+    result = cli_runner(cli.index_cli, ['list'])
+    assert result.exit_code == 0
+    assert 'ix_claim_received_id' in result.output
+
+
+def test_index_drop_unused(cli_runner, db):
+    """Test `claimstore index drop-unused --dry-run` command."""
+    result = cli_runner(cli.index_cli, ['drop-unused', '--dry-run',
+                                        '--max-scans', '1000000'])
+    assert result.exit_code == 0
+    assert 'ix_claim_received_id' in result.output
+    assert 'claim_uuid_key' not in result.output
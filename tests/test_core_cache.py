@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""claimstore.core.cache test suite."""
+
+import os
+import time
+
+import pytest
+
+from claimstore.core.cache import FileSystemCache, LRUCache, make_cache
+
+
+def test_lru_cache():
+    """Testing `LRUCache`."""
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    # `b` is the least recently used entry.
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    cache.clear()
+    assert cache.get('a') is None
+
+    cache = LRUCache(timeout=1)
+    cache.set('a', 1)
+    cache._entries['a'] = (1, time.time() - 1)
+    assert cache.get('a') is None
+
+
+def test_filesystem_cache(tmpdir):
+    """Testing `FileSystemCache`."""
+    cache = FileSystemCache(str(tmpdir), max_size=2)
+    cache.set('a', (1, b'x'))
+    cache.set('b', 2)
+    assert cache.get('a') == (1, b'x')
+    # Make `b` the least recently used entry.
+    os.utime(cache._path('b'), (0, 0))
+    cache.set('c', 3)
+    assert len(os.listdir(str(tmpdir))) == 2
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    # Another process sees the same entries.
+    assert FileSystemCache(str(tmpdir)).get('a') == (1, b'x')
+    cache.clear()
+    assert cache.get('a') is None and os.listdir(str(tmpdir)) == []
+
+
+def test_filesystem_cache_prune(tmpdir, monkeypatch):
+    """Testing that `FileSystemCache` lists its directory once in a while."""
+    cache = FileSystemCache(str(tmpdir), max_size=10)
+    listings = []
+    files = cache._files
+
+    def counted_files():
+        listings.append(None)
+        return files()
+
+    monkeypatch.setattr(cache, '_files', counted_files)
+    for key in range(10):
+        cache.set(str(key), key)
+    cache.set('0', 0)
+    assert len(listings) == 1
+    # Going over `max_size` removes a tenth of the entries.
+    cache.set('10', 10)
+    assert len(listings) == 2 and len(os.listdir(str(tmpdir))) == 9
+    cache.set('11', 11)
+    assert len(listings) == 2 and len(os.listdir(str(tmpdir))) == 10
+
+
+def test_filesystem_cache_permissions(tmpdir):
+    """Testing that `FileSystemCache` rejects directories shared by users."""
+    directory = tmpdir.join('cache')
+    FileSystemCache(str(directory))
+    assert directory.stat().mode & 0o777 == 0o700
+    directory.chmod(0o777)
+    with pytest.raises(ValueError):
+        FileSystemCache(str(directory))
+
+
+def test_make_cache(tmpdir):
+    """Testing `make_cache`."""
+    config = {
+        'CFG_CLAIMS_CACHE_BACKEND': 'lru',
+        'CFG_CLAIMS_CACHE_SIZE': 10,
+        'CFG_CLAIMS_CACHE_TIMEOUT': 0,
+        'CFG_CLAIMS_CACHE_DIR': str(tmpdir),
+    }
+    cache = make_cache(config)
+    assert isinstance(cache, LRUCache) and cache.max_size == 10
+    config['CFG_CLAIMS_CACHE_BACKEND'] = 'filesystem'
+    assert make_cache(config).directory == str(tmpdir)
+    config['CFG_CLAIMS_CACHE_BACKEND'] = 'claimstore.core.cache:LRUCache'
+    assert isinstance(make_cache(config), LRUCache)
+    config['CFG_CLAIMS_CACHE_BACKEND'] = None
+    assert make_cache(config) is None
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""claimstore.core.db test suite."""
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from claimstore.core.db.query import like_or_equal
+from claimstore.core.db.transaction import run_in_transaction
+from claimstore.models import Claim
+
+
+def _compile(condition):
+    """Compile a condition for PostgreSQL."""
+    return str(condition.compile(dialect=postgresql.dialect()))
+
+
+def test_like_or_equal():
+    """Testing `like_or_equal()`."""
+    assert _compile(like_or_equal(Claim.actor, 'John Doe')) == \
+        'claim.actor = %(actor_1)s'
+    for pattern in ('John%', 'CDS_submission', 'a\\%'):
+        assert _compile(like_or_equal(Claim.actor, pattern)) == \
+            'claim.actor LIKE %(actor_1)s'
+
+
+class _Session(object):
+
+    """Session recording its commits and rollbacks."""
+
+    def __init__(self):
+        """Initialise the session."""
+        self.calls = []
+
+    def commit(self):
+        """Record a commit."""
+        self.calls.append('commit')
+
+    def rollback(self):
+        """Record a rollback."""
+        self.calls.append('rollback')
+
+
+def test_run_in_transaction():
+    """Testing `run_in_transaction()`."""
+    deadlock = Exception()
+    deadlock.pgcode = '40P01'
+    errors = [OperationalError('UPDATE', {}, deadlock)]
+
+    def func():
+        if errors:
+            raise errors.pop()
+        return 1
+
+    session = _Session()
+    assert run_in_transaction(session, func, backoff=0) == 1
+    assert session.calls == ['rollback', 'commit']
+
+    # Other errors are raised after a rollback.
+    errors.append(IntegrityError('INSERT', {}, Exception()))
+    session = _Session()
+    with pytest.raises(IntegrityError):
+        run_in_transaction(session, func, backoff=0)
+    assert session.calls == ['rollback']
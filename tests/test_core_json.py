@@ -20,7 +20,18 @@
 
 """claimstore.core.json test suite."""
 
-from claimstore.core.json import get_json_schema
+import json
+
+import pytest
+from jsonschema import ValidationError
+
+from claimstore.core.json import CompiledValidator, dumps, \
+    fastjsonschema, get_encoder, get_json_schema, get_validator, orjson, \
+    orjson_dumps, reload_validators, validate_json
+
+pytest_plugins = (
+    'claimstore.testing.fixtures.claim',
+)
 
 
 def test_get_json_schema(app):
@@ -32,3 +43,66 @@ def test_get_json_schema(app):
     assert '"required": ["type", "description", "url", ' + \
         '"example_value", "example_url"],' in \
         get_json_schema('claims.persistent_id')
+
+
+@pytest.yield_fixture(params=['jsonschema', 'fastjsonschema'])
+def validator_backend(request, app, monkeypatch):
+    """Fixture that validates the claims with each validator backend."""
+    if request.param == 'fastjsonschema':
+        if not fastjsonschema:
+            pytest.skip('fastjsonschema is not installed')
+        monkeypatch.setitem(app.config, 'CFG_JSON_SCHEMA_CODEGEN',
+                            ['claims.claim'])
+    else:
+        monkeypatch.setitem(app.config, 'CFG_JSON_SCHEMA_CODEGEN', [])
+    reload_validators()
+    yield request.param
+    monkeypatch.undo()
+    reload_validators()
+
+
+def test_validate_json(validator_backend, dummy_claim):
+    """Testing `validate_json()` with cached validators."""
+    claimant = {
+        'name': 'CDS',
+        'url': 'http://cds.cern.ch',
+        'persistent_identifiers': [{'type': 'DOI'}]
+    }
+    # The reference to the persistent_id schema is inlined.
+    with pytest.raises(ValidationError):
+        validate_json(claimant, 'claims.claimant')
+    claimant['persistent_identifiers'] = []
+    validate_json(claimant, 'claims.claimant')
+
+    with pytest.raises(ValidationError):
+        validate_json({'claimant': 'CDS'}, 'claims.claim')
+    validate_json(dummy_claim, 'claims.claim')
+    with pytest.raises(ValidationError):
+        validate_json(dict(dummy_claim, certainty=2), 'claims.claim')
+    # Formats are not checked, whatever the validator backend.
+    validate_json(dict(dummy_claim, created='yesterday'), 'claims.claim')
+
+
+def test_get_validator(app):
+    """Testing that validators are compiled once until they are reloaded."""
+    validator = get_validator('claims.claimant')
+    assert get_validator('claims.claimant') is validator
+    assert '$ref' not in json.dumps(validator.schema)
+    reload_validators()
+    assert get_validator('claims.claimant') is not validator
+    if fastjsonschema:
+        assert isinstance(get_validator('claims.claim'), CompiledValidator)
+
+
+def test_dumps(app, monkeypatch):
+    """Testing the configurable JSON encoder."""
+    claim = {'subject': {'type': 'DOI', 'value': 'é'}, 'certainty': 0.8}
+    assert get_encoder() is (orjson_dumps if orjson else json.dumps)
+    assert json.loads(dumps(claim)) == claim
+    monkeypatch.setitem(app.config, 'CFG_JSON_ENCODER', 'json')
+    assert dumps(claim) == json.dumps(claim)
+    monkeypatch.setitem(app.config, 'CFG_JSON_ENCODER', 'json:dumps')
+    assert get_encoder() is json.dumps
+    if orjson:
+        monkeypatch.setitem(app.config, 'CFG_JSON_ENCODER', 'orjson')
+        assert json.loads(dumps(claim)) == claim
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""claimstore.core.unionfind test suite."""
+
+from claimstore.core.unionfind import UnionFind
+
+
+def test_union_find():
+    """Testing `UnionFind`."""
+    clusters = UnionFind()
+    assert clusters.add('a') == 0
+    assert clusters.add('a') == 0
+    clusters.union('a', 'b')
+    clusters.union('c', 'd')
+    clusters.union('e', 'e')
+    assert len(clusters) == 5
+    assert 'd' in clusters and 'x' not in clusters
+    assert clusters.find('a') == clusters.find('b')
+    assert clusters.find('a') != clusters.find('c')
+
+    clusters.union('d', 'b')
+    assert clusters.size('a') == 4
+    assert clusters.size('e') == 1
+    components = sorted(
+        sorted(clusters.keys[i] for i in indexes)
+        for indexes in clusters.components().values()
+    )
+    assert components == [['a', 'b', 'c', 'd'], ['e']]
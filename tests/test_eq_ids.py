@@ -20,12 +20,22 @@
 
 """Tests for equivalent identifiers logic."""
 
+import random
+import threading
 from copy import deepcopy
+from uuid import uuid4
 
 import pytest
+from flask import current_app
 from sqlalchemy.orm.exc import NoResultFound
 
-from claimstore.models import EquivalentIdentifier, IdentifierType
+from claimstore.app import db as db_
+from claimstore.core.datetime import now_utc
+from claimstore.core.db.transaction import run_in_transaction
+from claimstore.core.metrics import counters
+from claimstore.models import Claim, EquivalentCluster, EquivalentEvent, \
+    EquivalentIdentifier, EquivalentIndexState, EquivalentQueue, \
+    IdentifierType
 from claimstore.testing.fixtures.decorator import \
     populate_all_and_dummy_claimant
 
@@ -178,7 +188,7 @@ def test_existing_subject_object(webtest_app, dummy_claim, dummy_subject,
     """Test equivalence with an already existing subject and object.
 
     In this case, the subject and object already exist but the have different
-    eqid. All the eqids of one set should be udpated.
+    eqid. Their clusters should be merged without updating the identifiers.
     """
     sub_value = 'xxx'
     ob_value = 'yyy'
@@ -218,14 +228,463 @@ def test_existing_subject_object(webtest_app, dummy_claim, dummy_subject,
         '/api/claims',
         dummy_claim
     )
-    # After the previous claim submission, all the eqids equivalent to the
-    # object must have changed:
+    # After the previous claim submission, the identifiers keep their eqid but
+    # both eqids belong to the same cluster:
     new_random_equivalents_count = EquivalentIdentifier.query.filter_by(
         eqid=random_eqid
     ).count()
-    sub_equivalents_count = EquivalentIdentifier.query.filter_by(
-        eqid=sub_eq.eqid
+    sub_equivalents_count = EquivalentIdentifier.equivalents(
+        dummy_subject['type'], sub_value
     ).count()
 
-    assert new_random_equivalents_count == 0
+    assert new_random_equivalents_count == pre_random_equivalents_count
+    assert EquivalentCluster.root(random_eqid) == \
+        EquivalentCluster.root(sub_eq.eqid)
     assert sub_equivalents_count == pre_random_equivalents_count + 2
+
+
+@populate_all_and_dummy_claimant
+def test_set_equivalent_ids(dummy_subject, dummy_object):
+    """Test the bulk update of the equivalent identifiers.
+
+    The pairs (a, b), (c, d) and (a, d) create two clusters that end up merged
+    in the same batch, while (e, f) stays on its own.
+    """
+    sub_id = IdentifierType.query.filter_by(
+        name=dummy_subject['type']
+    ).one().id
+    ob_id = IdentifierType.query.filter_by(
+        name=dummy_object['type']
+    ).one().id
+    pre_all_eqs = EquivalentIdentifier.query.count()
+
+    output = EquivalentIdentifier.set_equivalent_ids([
+        (sub_id, 'a', ob_id, 'b'),
+        (sub_id, 'c', ob_id, 'd'),
+        (sub_id, 'a', ob_id, 'd'),
+        (sub_id, 'e', ob_id, 'f'),
+    ])
+    assert len(output) == 4
+    assert EquivalentIdentifier.query.count() == pre_all_eqs + 6
+
+    roots = EquivalentCluster.roots(
+        eqi.eqid for eqi in EquivalentIdentifier.query.filter(
+            EquivalentIdentifier.value.in_(['a', 'b', 'c', 'd'])
+        )
+    )
+    assert len(set(roots.values())) == 1
+    assert EquivalentCluster.root(output[3][0].eqid) not in roots.values()
+
+
+def _clusters():
+    """Return the clusters of (type_id, value) of the eqid index."""
+    clusters = {}
+    roots = EquivalentCluster.root_map()
+    for eqi in EquivalentIdentifier.query:
+        clusters.setdefault(roots.get(eqi.eqid, eqi.eqid), set()).add(
+            (eqi.type_id, eqi.value)
+        )
+    return set(frozenset(cluster) for cluster in clusters.values())
+
+
+@populate_all_and_dummy_claimant
+def test_rebuild(webtest_app, dummy_claim):
+    """Test that both rebuild engines recreate the same clusters."""
+    webtest_app.post_json('/api/claims', dummy_claim)
+    clusters = _clusters()
+    assert clusters
+
+    for engine in ('legacy', 'unionfind'):
+        EquivalentIdentifier.query.delete()
+        EquivalentIdentifier.rebuild(engine=engine)
+        assert _clusters() == clusters
+
+        # Rebuilding a complete index does not change anything.
+        EquivalentIdentifier.rebuild(engine=engine)
+        assert _clusters() == clusters
+
+    # Rebuilds are recorded in the event log.
+    EquivalentIdentifier.clear()
+    EquivalentIdentifier.rebuild()
+    EquivalentIdentifier.replay()
+    assert _clusters() == clusters
+
+    with pytest.raises(ValueError):
+        EquivalentIdentifier.rebuild(engine='unknown')
+
+
+@populate_all_and_dummy_claimant
+def test_compact(webtest_app, dummy_subject, dummy_object):
+    """Test that merges only link clusters and compaction flattens them."""
+    sub_id = IdentifierType.query.filter_by(
+        name=dummy_subject['type']
+    ).one().id
+    ob_id = IdentifierType.query.filter_by(
+        name=dummy_object['type']
+    ).one().id
+    pairs = [(sub_id, str(i), ob_id, str(i)) for i in range(4)]
+    eqids = [s.eqid for s, _ in EquivalentIdentifier.set_equivalent_ids(pairs)]
+    assert len(set(eqids)) == 4
+
+    for i, j in ((0, 1), (2, 3), (1, 3)):
+        EquivalentIdentifier.set_equivalent_id(sub_id, str(i), ob_id, str(j))
+    root = EquivalentCluster.root(eqids[0])
+    assert set(EquivalentCluster.roots(eqids).values()) == set([root])
+    assert EquivalentCluster.query.filter_by(parent_eqid=None).filter(
+        EquivalentCluster.eqid.in_(eqids)
+    ).count() == 1
+    # Identifiers are never rewritten.
+    assert [eqi.eqid for eqi in EquivalentIdentifier.query.filter(
+        EquivalentIdentifier.type_id == sub_id,
+        EquivalentIdentifier.value.in_(['0', '1', '2', '3'])
+    ).order_by(EquivalentIdentifier.value)] == eqids
+
+    assert EquivalentCluster.compact() == 1
+    assert set(
+        cluster.parent_eqid or cluster.eqid
+        for cluster in EquivalentCluster.query.filter(
+            EquivalentCluster.eqid.in_(eqids)
+        ).populate_existing()
+    ) == set([root])
+
+
+@populate_all_and_dummy_claimant
+def test_concurrent_insert(monkeypatch, webtest_app, dummy_subject,
+                           dummy_object):
+    """Test identifiers inserted concurrently in another cluster."""
+    sub_id = IdentifierType.query.filter_by(
+        name=dummy_subject['type']
+    ).one().id
+    ob_id = IdentifierType.query.filter_by(
+        name=dummy_object['type']
+    ).one().id
+    other, _ = EquivalentIdentifier.set_equivalent_id(sub_id, 'c0', ob_id,
+                                                      'c1')
+    EquivalentIdentifier._insert_missing({(sub_id, 'c0'): str(uuid4())})
+    assert EquivalentIdentifier.query.filter_by(
+        type_id=sub_id, value='c0'
+    ).count() == 1
+
+    # The first lookup misses `c0`, as if it was inserted right after it.
+    fetch = EquivalentIdentifier._fetch.__func__
+    calls = []
+
+    def racy_fetch(cls, keys):
+        calls.append(keys)
+        found = fetch(cls, keys)
+        if len(calls) == 1:
+            found.pop((sub_id, 'c0'), None)
+        return found
+
+    monkeypatch.setattr(EquivalentIdentifier, '_fetch',
+                        classmethod(racy_fetch))
+    subject, object_ = EquivalentIdentifier.set_equivalent_id(
+        sub_id, 'c0', ob_id, 'c2'
+    )
+    assert subject.id == other.id
+    assert EquivalentCluster.root(subject.eqid) == \
+        EquivalentCluster.root(object_.eqid)
+    assert EquivalentIdentifier.query.filter_by(
+        type_id=sub_id, value='c0'
+    ).count() == 1
+
+
+@populate_all_and_dummy_claimant
+def test_replay(webtest_app, dummy_subject, dummy_object):
+    """Test rebuilding the index and clusters from the event log."""
+    sub_id = IdentifierType.query.filter_by(
+        name=dummy_subject['type']
+    ).one().id
+    ob_id = IdentifierType.query.filter_by(
+        name=dummy_object['type']
+    ).one().id
+    set_equivalent_id = EquivalentIdentifier.set_equivalent_id
+    set_equivalent_id(sub_id, 'r0', ob_id, 'r0')
+    set_equivalent_id(sub_id, 'r1', ob_id, 'r1')
+    db_.session.flush()
+    middle = now_utc()
+    set_equivalent_id(sub_id, 'r0', ob_id, 'r1')
+    db_.session.flush()
+
+    def index():
+        identifiers = EquivalentIdentifier.query.all()
+        roots = EquivalentCluster.roots(eqi.eqid for eqi in identifiers)
+        return {(eqi.type_id, eqi.value): roots[eqi.eqid]
+                for eqi in identifiers}
+
+    before = index()
+    root, members = EquivalentEvent.cluster_at(sub_id, 'r0')
+    assert root == before[(sub_id, 'r0')]
+    assert members == sorted(key for key in before if before[key] == root)
+    root, members = EquivalentEvent.cluster_at(sub_id, 'r0', until=middle)
+    assert members == sorted([(sub_id, 'r0'), (ob_id, 'r0')])
+    assert EquivalentEvent.cluster_at(sub_id, 'r9') is None
+
+    roots, identifiers = EquivalentEvent.clusters()
+    for (type_id, value), eqid in identifiers.items():
+        root, members = EquivalentEvent.cluster_at(type_id, value)
+        assert root == roots[eqid]
+        assert members == sorted(
+            key for key in identifiers if roots[identifiers[key]] == root
+        )
+
+    events = EquivalentEvent.query.count()
+    EquivalentIdentifier.replay()
+    assert index() == before
+    assert EquivalentIdentifier.unlinked_claims().count() == 0
+    assert EquivalentEvent.query.count() == events
+
+    # The clusters keep the datetimes of their events.
+    merge = EquivalentEvent.query.filter_by(kind='merge').order_by(
+        EquivalentEvent.id.desc()
+    ).first()
+    new = EquivalentEvent.query.filter_by(kind='new', eqid=merge.eqid).one()
+    child, = set(merge.old_eqids) - {merge.eqid}
+    assert EquivalentCluster.query.get(merge.eqid).created == new.recorded
+    assert EquivalentCluster.query.get(child).linked == merge.recorded
+
+    assert EquivalentEvent.truncate(middle) == 1
+    assert EquivalentIndexState.query.count() == 0
+    assert index() == before
+    EquivalentIdentifier.replay()
+    after = index()
+    assert after[(sub_id, 'r0')] != after[(sub_id, 'r1')]
+
+
+@populate_all_and_dummy_claimant
+def test_async_indexing(monkeypatch, webtest_app, dummy_claim):
+    """Test claims indexed later from the queue."""
+    monkeypatch.setitem(current_app.config, 'CFG_EQUIVALENT_ASYNC', True)
+    dummy_claim['subject']['value'] = 'async-subject'
+    dummy_claim['object']['value'] = 'async-object'
+    other_claim = deepcopy(dummy_claim)
+    other_claim['subject']['value'] = 'async-other'
+    uuids = [webtest_app.post_json('/api/claims', dummy_claim).json['uuid']]
+    uuids.extend(r['uuid'] for r in webtest_app.post_json(
+        '/api/claims/batch', [other_claim]
+    ).json)
+    claims = Claim.query.filter(Claim.uuid.in_(uuids)).all()
+    assert all(claim.subject_eqid is None for claim in claims)
+    assert EquivalentIdentifier.query.filter_by(
+        value='async-subject'
+    ).count() == 0
+    status = EquivalentQueue.status()
+    assert status['pending'] == 2
+    assert status['lag'] >= 0
+
+    assert EquivalentQueue.process(1) == 1
+    assert EquivalentQueue.process(10) == 1
+    assert EquivalentQueue.process(10) == 0
+    assert EquivalentQueue.status() == {'pending': 0, 'lag': 0.0}
+    claims = Claim.query.filter(
+        Claim.uuid.in_(uuids)
+    ).populate_existing().all()
+    assert all(claim.subject_eqid and claim.object_eqid for claim in claims)
+    eqids = EquivalentIdentifier.query.filter(
+        EquivalentIdentifier.value.in_(
+            ['async-subject', 'async-object', 'async-other']
+        )
+    )
+    assert len(set(EquivalentCluster.roots(
+        eqi.eqid for eqi in eqids
+    ).values())) == 1
+
+
+@pytest.yield_fixture
+def committed_type(database):
+    """Commit an identifier type, deleting it and its eqid data after."""
+    id_type = IdentifierType(
+        name='STRESS_ID_{}'.format(uuid4().hex),
+        description='Stress test',
+        url='http://example.org/<STRESS_ID>',
+        example_value='1',
+        example_url='http://example.org/1'
+    )
+    database.session.add(id_type)
+    database.session.commit()
+    type_id = id_type.id
+    yield type_id
+    database.session.rollback()
+    roots = EquivalentCluster.roots(
+        eqid for eqid, in database.session.query(
+            EquivalentIdentifier.eqid
+        ).filter_by(type_id=type_id)
+    )
+    # Clusters created by lost races have no identifiers of their own.
+    trees = EquivalentCluster.trees(set(roots.values()))
+    eqids = [eqid for eqid, in database.session.query(trees.c.eqid)]
+    # Otherwise a later replay would recreate the identifiers.
+    EquivalentEvent.query.filter(EquivalentEvent.eqid.in_(eqids)).delete(
+        synchronize_session=False
+    )
+    EquivalentCluster.query.filter(EquivalentCluster.eqid.in_(eqids)).update(
+        {EquivalentCluster.parent_eqid: None}, synchronize_session=False
+    )
+    EquivalentCluster.query.filter(EquivalentCluster.eqid.in_(eqids)).delete(
+        synchronize_session=False
+    )
+    EquivalentIdentifier.query.filter_by(type_id=type_id).delete()
+    IdentifierType.query.filter_by(id=type_id).delete()
+    database.session.commit()
+
+
+def test_concurrent_ingest(app, committed_type):
+    """Test that concurrent merges keep the clusters consistent."""
+    type_id = committed_type
+    size = 100
+    pairs = [(str(i), str(j)) for i in range(size)
+             for j in (i + 1, i + 2) if j < size]
+    random.Random(0).shuffle(pairs)
+    workers = 8
+    errors = []
+
+    def ingest(pairs):
+        with app.app_context():
+            try:
+                for subject, object_ in pairs:
+                    run_in_transaction(
+                        db_.session,
+                        lambda: EquivalentIdentifier.set_equivalent_id(
+                            type_id, subject, type_id, object_
+                        ),
+                        retries=10
+                    )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db_.session.remove()
+
+    threads = [
+        threading.Thread(target=ingest, args=(pairs[i::workers], ))
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    eqids = [eqid for eqid, in db_.session.query(
+        EquivalentIdentifier.eqid
+    ).filter_by(type_id=type_id)]
+    # No duplicates and a single cluster.
+    assert len(eqids) == size
+    assert len(set(EquivalentCluster.roots(eqids).values())) == 1
+    # Only roots have no parent.
+    assert EquivalentCluster.query.filter(
+        EquivalentCluster.eqid.in_(eqids),
+        EquivalentCluster.parent_eqid.is_(None)
+    ).count() == 1
+
+
+@populate_all_and_dummy_claimant
+def test_statistics(webtest_app, dummy_subject, dummy_object):
+    """Test the cluster statistics and the eqid counters."""
+    sub_id = IdentifierType.query.filter_by(
+        name=dummy_subject['type']
+    ).one().id
+    ob_id = IdentifierType.query.filter_by(
+        name=dummy_object['type']
+    ).one().id
+    before = counters.snapshot('eqid.')
+    stats = EquivalentCluster.statistics(top=1)
+    set_equivalent_id = EquivalentIdentifier.set_equivalent_id
+    set_equivalent_id(sub_id, 'x0', ob_id, 'x0')
+    set_equivalent_id(sub_id, 'x1', ob_id, 'x1')
+    set_equivalent_id(sub_id, 'x0', ob_id, 'x2')
+    set_equivalent_id(sub_id, 'x0', ob_id, 'x1')
+    after = counters.snapshot('eqid.')
+    for name, delta in (('eqid.new', 2), ('eqid.extend', 1),
+                        ('eqid.merge', 1), ('eqid.rows_rewritten', 2)):
+        assert after[name] - before.get(name, 0) == delta
+
+    new_stats = EquivalentCluster.statistics(top=1)
+    assert new_stats['clusters'] == stats['clusters'] + 1
+    assert new_stats['identifiers'] == stats['identifiers'] + 5
+    assert sum(bucket['clusters'] for bucket in new_stats['histogram']) == \
+        new_stats['clusters']
+    assert all(bucket['min'] <= bucket['max']
+               for bucket in new_stats['histogram'])
+    assert len(new_stats['largest']) == 1
+    assert new_stats['largest'][0]['size'] >= 5
+    today = new_stats['history'][-1]
+    assert today['created'] >= 2
+    assert today['merged'] >= 1
+    assert new_stats['counters'] == after
+
+
+@populate_all_and_dummy_claimant
+def test_rebuild_incremental(monkeypatch, webtest_app):
+    """Test that incremental reindexes only process unindexed claims."""
+    monkeypatch.setitem(current_app.config, 'CFG_EQUIVALENT_PREDICATES',
+                        ['is_same_as'])
+    EquivalentIdentifier.rebuild()
+    state = EquivalentIndexState.get()
+    assert state.claim_id > 0
+    assert state.predicates == ['is_same_as']
+    assert EquivalentIdentifier.incremental_claims().count() == 0
+    assert EquivalentIdentifier.rebuild_incremental() == 0
+
+    # Only the claims using the new equivalence predicate are processed.
+    monkeypatch.setitem(current_app.config, 'CFG_EQUIVALENT_PREDICATES',
+                        ['is_same_as', 'is_variant_of'])
+    assert EquivalentIndexState.get().new_predicates() == ['is_variant_of']
+    claim_ids = [row[4] for row in EquivalentIdentifier.incremental_claims()]
+    assert len(claim_ids) == 1
+
+    # An interrupted reindex is resumed after its last checkpoint.
+    EquivalentIndexState.get().checkpoint(claim_ids[0])
+    assert EquivalentIdentifier.incremental_claims().count() == 0
+    EquivalentIndexState.get().resume_claim_id = None
+    assert EquivalentIdentifier.rebuild_incremental() == 1
+    assert EquivalentIndexState.get().predicates == \
+        ['is_same_as', 'is_variant_of']
+    assert EquivalentIdentifier.rebuild_incremental() == 0
+
+
+@populate_all_and_dummy_claimant
+def test_rebuild_relinks_claims(webtest_app):
+    """Test that a rebuild after a drop relinks the claims."""
+    equivalents = Claim.equivalents('INSPIRE_RECORD_ID', 'cond-mat/9906097')
+    assert equivalents.count() == 2
+    unlinked = EquivalentIdentifier.unlinked_claims()
+    assert unlinked.count() == 0
+
+    EquivalentIdentifier.clear()
+    assert unlinked.count() > 0
+    assert EquivalentIdentifier.rebuild() == 3
+    assert unlinked.count() == 0
+    assert Claim.equivalents(
+        'INSPIRE_RECORD_ID', 'cond-mat/9906097'
+    ).count() == 2
+    # Claims that are correctly linked are not updated again.
+    assert EquivalentIdentifier.relink_claims() == 0
+
+
+@populate_all_and_dummy_claimant
+def test_page_without_cluster_row(webtest_app):
+    """Test that eqids without a cluster row are listed once backfilled."""
+    type_id = IdentifierType.query.filter_by(
+        name='INSPIRE_RECORD_ID'
+    ).one().id
+    legacy = EquivalentIdentifier(eqid=str(uuid4()), type_id=type_id,
+                                  value='legacy/0001')
+    db_.session.add(legacy)
+    db_.session.commit()
+    assert EquivalentCluster.query.filter_by(eqid=legacy.eqid).count() == 0
+    roots = [row.eqid for row in EquivalentCluster.page(None, 1000)]
+    assert legacy.eqid not in roots
+
+    EquivalentCluster.compact()
+    assert EquivalentCluster.query.filter_by(
+        eqid=legacy.eqid, parent_eqid=None
+    ).count() == 1
+    assert EquivalentCluster.backfill() == 0
+    roots = [row.eqid for row in EquivalentCluster.page(None, 1000)]
+    assert roots == sorted(roots)
+    assert roots.count(legacy.eqid) == 1
+    expected = [{'type': 'INSPIRE_RECORD_ID', 'value': 'legacy/0001'}]
+    resp = webtest_app.get('/api/eqids?per_page=1000')
+    assert resp.json[legacy.eqid] == expected
+    resp = webtest_app.get('/api/eqids?stream=1&per_page=1')
+    assert resp.json[legacy.eqid] == expected
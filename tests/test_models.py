@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of ClaimStore.
+# Copyright (C) 2015 CERN.
+#
+# ClaimStore is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# ClaimStore is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ClaimStore; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307,
+# USA.
+
+"""claimstore.models test suite."""
+
+import pytest
+
+from claimstore.models import Predicate, predicate_cache
+
+pytest_plugins = (
+    'claimstore.testing.fixtures.predicate',
+)
+
+
+@pytest.mark.usefixtures('all_predicates')
+def test_reference_cache(app, db):
+    """Testing the name <-> id cache of reference tables."""
+    is_same_as = Predicate.query.filter_by(name='is_same_as').one()
+    assert predicate_cache.get_id('is_same_as') == is_same_as.id
+    assert predicate_cache.get_name(is_same_as.id) == 'is_same_as'
+
+    # Unknown names are remembered in a bounded negative cache.
+    negative_size = app.config['CFG_REFERENCE_CACHE_NEGATIVE_SIZE']
+    app.config['CFG_REFERENCE_CACHE_NEGATIVE_SIZE'] = 2
+    try:
+        for name in ('unknown1', 'unknown2', 'is_cited_by'):
+            assert predicate_cache.get_id(name) is None
+        assert list(predicate_cache._missing) == ['unknown2', 'is_cited_by']
+    finally:
+        app.config['CFG_REFERENCE_CACHE_NEGATIVE_SIZE'] = negative_size
+
+    db.session.add(Predicate(name='is_cited_by'))
+    db.session.flush()
+    assert predicate_cache.get_id('is_cited_by') is None
+    predicate_cache.invalidate()
+    assert predicate_cache.get_id('is_cited_by') is not None
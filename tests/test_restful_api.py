@@ -20,9 +20,18 @@
 
 """claimstore.restful test suite."""
 
+import json
+
 import pytest
+from sqlalchemy.exc import OperationalError
 
-from claimstore.testing.fixtures.decorator import populate_all
+from claimstore.app import db as db_
+from claimstore.core.metrics import counters
+from claimstore.models import Claim, EquivalentCluster, Predicate, \
+    invalidate_reference_caches
+from claimstore.restful import ClaimBatchResource, invalidate_claims_version
+from claimstore.testing.fixtures.decorator import populate_all, \
+    populate_all_and_dummy_claimant
 
 pytest_plugins = (
     'claimstore.testing.fixtures.claim',
@@ -197,6 +206,23 @@ def test_get_claims_by_type_value_recursive(webtest_app):
     )
     assert len(resp.json) == 2
 
+    # Recursive queries are filtered and paginated like any other listing.
+    resp = webtest_app.get(
+        '/api/claims?type=INSPIRE_RECORD_ID&value=cond-mat/9906097&recurse=1'
+        '&predicate=is_variant_of'
+    )
+    assert len(resp.json) == 1
+    resp = webtest_app.get(
+        '/api/claims?type=INSPIRE_RECORD_ID&value=cond-mat/9906097&recurse=1'
+        '&per_page=1'
+    )
+    assert len(resp.json) == 1
+    assert 'rel="next"' in resp.headers['Link']
+    resp = webtest_app.get(
+        '/api/claims?type=INSPIRE_RECORD_ID&value=unknown&recurse=1'
+    )
+    assert len(resp.json) == 0
+
 
 @populate_all
 def test_get_claims_by_subject_object(webtest_app):
@@ -237,3 +263,440 @@ def test_get_eqids(webtest_app):
     resp = webtest_app.get('/api/eqids/{}'.format(eqid))
     assert resp.status_code == 200
     assert len(resp.json) == 1
+
+
+@populate_all
+def test_get_eqids_by_type_value(webtest_app):
+    """Testing GET eqids api filtering by type and value."""
+    resp = webtest_app.get(
+        '/api/eqids?type=INSPIRE_RECORD_ID&value=cond-mat/9906097'
+    )
+    assert len(resp.json) == 1
+    eqid, identifiers = list(resp.json.items())[0]
+    assert {'type': 'INSPIRE_RECORD_ID', 'value': 'cond-mat/9906097'} in \
+        identifiers
+    resp = webtest_app.get('/api/eqids/{}'.format(eqid))
+    assert len(resp.json[eqid]) == len(identifiers)
+    assert all(identifier in identifiers for identifier in resp.json[eqid])
+
+    resp = webtest_app.get('/api/eqids?type=INSPIRE_RECORD_ID&value=xxx')
+    assert resp.json == {}
+    resp = webtest_app.get('/api/eqids?type=INSPIRE_RECORD_ID',
+                           expect_errors=True)
+    assert resp.status_code == 400
+
+
+@populate_all
+def test_get_eqids_pages(webtest_app):
+    """Testing GET eqids with cursor pagination, min_size and streaming."""
+    all_clusters = webtest_app.get('/api/eqids?per_page=100').json
+    assert list(all_clusters) == sorted(all_clusters)
+
+    clusters = {}
+    url = '/api/eqids?per_page=1'
+    while url:
+        resp = webtest_app.get(url)
+        assert len(resp.json) == 1
+        clusters.update(resp.json)
+        url = None
+        for link in resp.headers['Link'].split(','):
+            if link.endswith('rel="next"'):
+                url = link[link.index('<') + 1:link.index('>')]
+    assert clusters == all_clusters
+
+    resp = webtest_app.get('/api/eqids?min_size=2')
+    assert resp.json
+    assert all(len(ids) >= 2 for ids in resp.json.values())
+    assert all(resp.json[eqid] == all_clusters[eqid] for eqid in resp.json)
+    resp = webtest_app.get('/api/eqids?min_size=1000')
+    assert resp.json == {}
+    resp = webtest_app.get('/api/eqids?min_size=0', expect_errors=True)
+    assert resp.status_code == 400
+    for per_page in (0, -1):
+        resp = webtest_app.get('/api/eqids?per_page={}'.format(per_page),
+                               expect_errors=True)
+        assert resp.status_code == 400
+
+    resp = webtest_app.get('/api/eqids?stream=1&per_page=1')
+    assert 'Link' not in resp.headers
+    assert resp.json == all_clusters
+    resp = webtest_app.get('/api/eqids',
+                           headers={'Accept': 'application/x-ndjson'})
+    assert resp.content_type == 'application/x-ndjson'
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert {line['eqid']: line['identifiers'] for line in lines} == \
+        all_clusters
+
+
+@populate_all
+def test_get_eqids_stats(webtest_app):
+    """Testing GET eqids stats api."""
+    resp = webtest_app.get('/api/eqids/stats?top=1')
+    assert resp.status_code == 200
+    clusters = webtest_app.get('/api/eqids?per_page=100').json
+    assert resp.json['clusters'] == len(clusters)
+    assert resp.json['identifiers'] == \
+        sum(len(ids) for ids in clusters.values())
+    largest = resp.json['largest'][0]
+    assert largest['size'] == max(len(ids) for ids in clusters.values())
+    assert len(clusters[largest['eqid']]) == largest['size']
+    assert 'history' in resp.json and 'counters' in resp.json
+
+    resp = webtest_app.get('/api/eqids/stats?days=0', expect_errors=True)
+    assert resp.status_code == 400
+
+
+@populate_all
+def test_post_eqids_resolve(webtest_app):
+    """Testing POST eqids resolve api."""
+    cluster = webtest_app.get(
+        '/api/eqids?type=INSPIRE_RECORD_ID&value=cond-mat/9906097'
+    ).json
+    resp = webtest_app.post_json('/api/eqids/resolve', [
+        {'type': 'INSPIRE_RECORD_ID', 'value': 'cond-mat/9906097'},
+        {'type': 'INSPIRE_RECORD_ID', 'value': 'xxx'},
+        {'type': 'NO_TYPE', 'value': 'cond-mat/9906097'},
+    ])
+    assert len(resp.json) == 3
+    assert {resp.json[0]['eqid']: resp.json[0]['identifiers']} == cluster
+    assert resp.json[1]['eqid'] is None
+    assert resp.json[2]['identifiers'] == []
+
+    resp = webtest_app.post_json('/api/eqids/resolve', [{'type': 'DOI'}],
+                                 expect_errors=True)
+    assert resp.status_code == 400
+
+
+@pytest.mark.usefixtures('all_predicates')
+def test_post_claims_batch(webtest_app, dummy_claimant, dummy_claim):
+    """Testing POST to `claims/batch` api."""
+    webtest_app.post_json(
+        '/api/claimants',
+        dummy_claimant
+    )
+    # Valid according to the JSON schema, but not registered.
+    Predicate.query.filter_by(name='is_erratum_of').delete()
+    invalidate_reference_caches()
+    unknown_predicate = dict(dummy_claim, predicate='is_erratum_of')
+    other_predicate = dict(dummy_claim, predicate='is_author_of')
+    unknown_claimant = dict(dummy_claim, claimant='unknown')
+    invalid_claim = dict(dummy_claim, certainty=2)
+    resp = webtest_app.post_json(
+        '/api/claims/batch',
+        [dummy_claim, unknown_claimant, invalid_claim, unknown_predicate,
+         other_predicate]
+    )
+    assert resp.status_code == 200
+    assert [r['status'] for r in resp.json] == \
+        ['success', 'error', 'error', 'error', 'success']
+    assert resp.json[1]['message'] == 'Claimant not registered'
+    assert resp.json[2]['message'] == 'JSON data is not valid'
+    assert resp.json[3]['message'] == 'Predicate not registered'
+
+    resp = webtest_app.get('/api/claims/{}'.format(resp.json[0]['uuid']))
+    assert len(resp.json) == 1
+
+    # One claim per line
+    resp = webtest_app.post(
+        '/api/claims/batch',
+        '{}\nnot json\n\n{}\n'.format(json.dumps(dummy_claim),
+                                      json.dumps(other_predicate)),
+        content_type='application/x-ndjson'
+    )
+    assert resp.status_code == 200
+    assert [r['status'] for r in resp.json] == \
+        ['success', 'error', 'success']
+
+    resp = webtest_app.post_json('/api/claims/batch', [], expect_errors=True)
+    assert resp.status_code == 400
+
+
+@pytest.mark.usefixtures('all_predicates')
+def test_post_claims_batch_failure(webtest_app, app, monkeypatch,
+                                   dummy_claimant, dummy_claim):
+    """Testing POST to `claims/batch` api when a chunk cannot be recorded."""
+    webtest_app.post_json(
+        '/api/claimants',
+        dummy_claimant
+    )
+    monkeypatch.setitem(app.config, 'CFG_CLAIMS_BATCH_COMMIT_SIZE', 2)
+    record_chunk = ClaimBatchResource._record_chunk
+    chunks = []
+
+    def failing_record_chunk(chunk, results):
+        chunks.append(chunk)
+        if len(chunks) == 2:
+            raise OperationalError('INSERT', {}, Exception('Server closed'))
+        return record_chunk(chunk, results)
+
+    monkeypatch.setattr(ClaimBatchResource, '_record_chunk',
+                        staticmethod(failing_record_chunk))
+    # Commits only flush in tests: a real rollback would also discard the
+    # chunks recorded before the failure.
+    rollbacks = []
+    monkeypatch.setattr(db_.session, 'rollback',
+                        lambda: rollbacks.append(None))
+    invalid_claim = dict(dummy_claim, certainty=2)
+    resp = webtest_app.post_json(
+        '/api/claims/batch',
+        [dummy_claim, invalid_claim, dummy_claim, dummy_claim, dummy_claim,
+         dummy_claim],
+        expect_errors=True
+    )
+    assert resp.status_code == 500
+    assert [r['status'] for r in resp.json] == \
+        ['success', 'error', 'success', 'error', 'error', 'error']
+    assert resp.json[1]['message'] == 'JSON data is not valid'
+    assert resp.json[3]['message'] == 'Claim could not be recorded'
+    assert resp.json[5]['message'] == \
+        'Claim not recorded after a previous failure'
+    assert len(chunks) == 2 and len(rollbacks) == 1
+    for result in resp.json[0], resp.json[2]:
+        resp = webtest_app.get('/api/claims/{}'.format(result['uuid']))
+        assert len(resp.json) == 1
+
+
+@populate_all
+def test_get_claims_cursor(webtest_app):
+    """Testing GET claims with cursor pagination."""
+    resp = webtest_app.get('/api/claims?per_page=10')
+    all_uuids = [c['uuid'] for c in resp.json]
+    assert len(all_uuids) == 3
+
+    for sort in ('id', 'received'):
+        uuids = []
+        url = '/api/claims?per_page=2&cursor=&sort={}'.format(sort)
+        while url:
+            resp = webtest_app.get(url)
+            assert 'rel="last"' not in resp.headers['Link']
+            uuids.extend(c['uuid'] for c in resp.json)
+            url = None
+            for link in resp.headers['Link'].split(','):
+                if link.endswith('rel="next"'):
+                    url = link[link.index('<') + 1:link.index('>')]
+        assert uuids == all_uuids
+
+    resp = webtest_app.get('/api/claims?cursor=xxx', expect_errors=True)
+    assert resp.status_code == 400
+    for per_page in (0, -1):
+        resp = webtest_app.get(
+            '/api/claims?cursor=&per_page={}'.format(per_page),
+            expect_errors=True
+        )
+        assert resp.status_code == 400
+
+
+@populate_all
+def test_get_claims_stream(webtest_app):
+    """Testing GET claims streamed as NDJSON or as a JSON array."""
+    all_uuids = [c['uuid'] for c in webtest_app.get('/api/claims').json]
+
+    resp = webtest_app.get('/api/claims?stream=1&per_page=1')
+    assert resp.content_type == 'application/json'
+    assert 'Link' not in resp.headers
+    assert [c['uuid'] for c in resp.json] == all_uuids
+
+    ndjson = {'Accept': 'application/x-ndjson'}
+    resp = webtest_app.get('/api/claims', headers=ndjson)
+    assert resp.content_type == 'application/x-ndjson'
+    lines = resp.text.splitlines()
+    assert [json.loads(line)['uuid'] for line in lines] == all_uuids
+
+    resp = webtest_app.get(
+        '/api/claims?type=INSPIRE_RECORD_ID&value=cond-mat/9906097&recurse=1',
+        headers=ndjson
+    )
+    assert len(resp.text.splitlines()) == 2
+
+    resp = webtest_app.get('/api/claims?claimant=NONE', headers=ndjson)
+    assert resp.text == ''
+    resp = webtest_app.get('/api/claims?claimant=NONE&stream=1')
+    assert resp.json == []
+
+
+@populate_all
+def test_get_claims_count(webtest_app):
+    """Testing GET claims with the different count modes."""
+    resp = webtest_app.get('/api/claims?per_page=2&count=exact')
+    assert len(resp.json) == 2
+    assert 'page=2' in resp.headers['Link'].split(',')[-1]
+    assert resp.headers['Link'].endswith('rel="last"')
+
+    resp = webtest_app.get('/api/claims?per_page=2&count=none')
+    assert len(resp.json) == 2
+    assert 'rel="next"' in resp.headers['Link']
+    assert 'rel="last"' not in resp.headers['Link']
+    resp = webtest_app.get('/api/claims?per_page=2&page=2&count=none')
+    assert len(resp.json) == 1
+    assert 'rel="next"' not in resp.headers['Link']
+
+    resp = webtest_app.get('/api/claims?per_page=2&count=estimate')
+    assert len(resp.json) == 2
+    assert resp.headers['Link'].endswith('rel="last"')
+
+    resp = webtest_app.get('/api/claims?count=xxx', expect_errors=True)
+    assert resp.status_code == 400
+
+
+@populate_all_and_dummy_claimant
+def test_get_claims_etag(webtest_app, dummy_claim):
+    """Testing GET claims with ETags and cached responses."""
+    resp = webtest_app.get('/api/claims?predicate=is_same_as&per_page=1')
+    etag = resp.headers['ETag']
+    assert etag.startswith('"')
+    link = resp.headers['Link']
+
+    # Same query, arguments in another order: served from the cache.
+    hits = counters.get('claims.cache.hit')
+    resp = webtest_app.get('/api/claims?per_page=1&predicate=is_same_as')
+    assert counters.get('claims.cache.hit') == hits + 1
+    assert resp.headers['ETag'] == etag
+    assert resp.headers['Link'] == link
+    assert len(resp.json) == 1
+
+    resp = webtest_app.get('/api/claims?predicate=is_same_as&per_page=1',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    resp = webtest_app.get('/api/claims?predicate=is_variant_of',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+
+    # A new claim changes the version of the claims.
+    webtest_app.post_json('/api/claims', dummy_claim)
+    resp = webtest_app.get('/api/claims?predicate=is_same_as&per_page=1',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+    # Rewriting the index, e.g. from the command line, changes it too.
+    etag = resp.headers['ETag']
+    EquivalentCluster.compact()
+    invalidate_claims_version()
+    resp = webtest_app.get('/api/claims?predicate=is_same_as&per_page=1',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+
+    resp = webtest_app.get('/api/claims?stream=1')
+    assert 'ETag' not in resp.headers
+
+
+@populate_all
+def test_get_claims_version(webtest_app, app, monkeypatch):
+    """Testing that the version of the claims is read once in a while."""
+    calls = []
+    version = Claim.version
+
+    def counted_version():
+        calls.append(None)
+        return version()
+
+    monkeypatch.setattr(Claim, 'version', counted_version)
+    webtest_app.get('/api/claims?predicate=is_same_as')
+    webtest_app.get('/api/claims?predicate=is_variant_of')
+    assert len(calls) == 1
+    monkeypatch.setitem(app.config, 'CFG_CLAIMS_VERSION_TTL', 0)
+    invalidate_claims_version()
+    webtest_app.get('/api/claims?predicate=is_same_as')
+    webtest_app.get('/api/claims?predicate=is_variant_of')
+    assert len(calls) == 3
+
+
+@populate_all
+def test_get_claims_fields(webtest_app):
+    """Testing GET claims with a projection of their fields."""
+    claims = webtest_app.get('/api/claims').json
+    resp = webtest_app.get('/api/claims?fields=uuid,subject,object,certainty')
+    assert resp.json == [
+        {field: claim[field]
+         for field in ('uuid', 'subject', 'object', 'certainty')}
+        for claim in claims
+    ]
+
+    fields = 'claimant,subject,predicate,object,certainty,arguments,' \
+        'created,recieved,uuid'
+    resp = webtest_app.get('/api/claims?fields={}'.format(fields))
+    assert resp.json == claims
+
+    # Projections are paginated, streamed and combined with filters.
+    resp = webtest_app.get('/api/claims?fields=uuid&per_page=2&cursor=&'
+                           'sort=received')
+    assert [c['uuid'] for c in resp.json] == \
+        [c['uuid'] for c in claims[:2]]
+    url = resp.headers['Link'].split(',')[-1]
+    resp = webtest_app.get(url[url.index('<') + 1:url.index('>')])
+    assert resp.json == [{'uuid': claims[2]['uuid']}]
+    resp = webtest_app.get('/api/claims?fields=uuid', headers={
+        'Accept': 'application/x-ndjson'
+    })
+    assert [json.loads(line) for line in resp.text.splitlines()] == \
+        [{'uuid': c['uuid']} for c in claims]
+    url = '/api/claims?type=INSPIRE_RECORD_ID&value=cond-mat/9906097' \
+        '&recurse=1'
+    resp = webtest_app.get(url + '&fields=predicate')
+    assert len(resp.json) == 2
+    assert resp.json == [{'predicate': c['predicate']}
+                         for c in webtest_app.get(url).json]
+
+    resp = webtest_app.get('/api/claims?fields=uuid,xxx', expect_errors=True)
+    assert resp.status_code == 400
+
+
+@populate_all
+def test_get_claims_compiled_queries(webtest_app):
+    """Testing that the claim queries are compiled once per combination."""
+    url = '/api/claims?claimant={}&certainty={}&actor={}&per_page=1'
+    webtest_app.get(url.format('INSPIRE', 0.1, 'John%25'))
+    compiled = counters.get('claims.query.compiled')
+    executed = counters.get('claims.query.executed')
+    resp = webtest_app.get(url.format('CDS', 0.2, 'CDS%25'))
+    assert len(resp.json) == 1
+    assert resp.json[0]['claimant'] == 'CDS'
+    assert counters.get('claims.query.compiled') == compiled
+    # The claims and their count.
+    assert counters.get('claims.query.executed') == executed + 2
+    # The same filters with an exact actor are another query.
+    resp = webtest_app.get(url.format('INSPIRE', 0.6, 'John Doe'))
+    assert len(resp.json) == 1
+    assert counters.get('claims.query.compiled') > compiled
+
+    resp = webtest_app.get('/api/claims/stats')
+    assert resp.json['counters']['claims.query.executed'] == \
+        counters.get('claims.query.executed')
+    assert 0 < resp.json['query_cache_hit_rate'] <= 1
+
+
+@populate_all
+def test_post_claims_lookup(webtest_app):
+    """Testing POST claims lookup api."""
+    identifiers = [
+        {'type': 'INSPIRE_RECORD_ID', 'value': 'cond-mat/9906097'},
+        {'type': 'DOI', 'value': 'C10.1103/PhysRevE.62.7422'},
+        {'type': 'INSPIRE_RECORD_ID', 'value': 'xxx'},
+        {'type': 'NO_TYPE', 'value': 'cond-mat/9906097'},
+        {'type': 'INSPIRE_RECORD_ID', 'value': 'cond-mat/9906097'},
+    ]
+    resp = webtest_app.post_json('/api/claims/lookup', identifiers)
+    assert len(resp.json) == 5
+    for item, result in zip(identifiers, resp.json):
+        assert result['type'] == item['type']
+        assert result['value'] == item['value']
+        url = '/api/claims?type={type}&value={value}'.format(**item)
+        assert result['claims'] == webtest_app.get(url).json
+    assert resp.json[0]['claims']
+    assert resp.json[2]['claims'] == resp.json[3]['claims'] == []
+
+    # Expanded through the equivalent identifiers and filtered.
+    resp = webtest_app.post_json(
+        '/api/claims/lookup?recurse=1&certainty=0.6&fields=uuid',
+        identifiers[:3]
+    )
+    for item, result in zip(identifiers, resp.json):
+        url = '/api/claims?type={type}&value={value}&recurse=1' \
+            '&certainty=0.6&fields=uuid'.format(**item)
+        assert result['claims'] == webtest_app.get(url).json
+    assert len(resp.json[0]['claims']) == 1
+
+    resp = webtest_app.post_json('/api/claims/lookup', [],
+                                 expect_errors=True)
+    assert resp.status_code == 400